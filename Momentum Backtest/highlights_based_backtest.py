@@ -9,15 +9,17 @@ import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-import json
-import requests
-import time
-import random
+from datetime import datetime
 
 # Add parent directory to path so we can import from ai_highlights
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ai_highlights import get_market_data, generate_summary, COINGECKO_API_URL
+from ai_highlights import get_market_data
+import history_cache
+import price_panel
+import monte_carlo
+import strategy_engine
+import ranking
+import cost_model
 
 # Constants for the backtest
 HOLDING_PERIOD_DAYS = 1  # How often to rebalance (daily)
@@ -26,7 +28,6 @@ HISTORY_DAYS = 90  # How many days of historical data to backtest
 BENCHMARK_COIN = "bitcoin"  # Benchmark to compare against
 INITIAL_CAPITAL = 10000  # Starting capital in USD
 CACHE_DIR = "Momentum Backtest/cache"  # Cache directory path
-MAX_RETRIES = 5  # Maximum number of retries for API requests
 MIN_COINS_FOR_BACKTEST = 10  # Minimum number of coins needed for backtest
 
 def ensure_cache_dir():
@@ -35,81 +36,11 @@ def ensure_cache_dir():
         os.makedirs(CACHE_DIR)
 
 def get_historical_prices(coin_id, days=HISTORY_DAYS, vs_currency="usd"):
-    """Get historical price data for a specific coin with exponential backoff for rate limits"""
-    cache_file = f"{CACHE_DIR}/{coin_id}_history_{days}d.json"
-    
-    # Try to load from cache
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            cache_time = cache_data.get('timestamp', 0)
-            # Cache valid for 12 hours
-            if time.time() - cache_time < 12 * 3600:
-                print(f"Loading {coin_id} history from cache...")
-                return cache_data.get('data')
-        except Exception as e:
-            print(f"Error reading cache: {e}")
-    
-    # Fetch from API if cache not available
-    print(f"Fetching {days} days of history for {coin_id}...")
-    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
-    params = {
-        'vs_currency': vs_currency,
-        'days': days,
-        'interval': 'daily'
-    }
-    
-    # Implement exponential backoff
-    for retry in range(MAX_RETRIES):
-        try:
-            response = requests.get(url, params=params)
-            
-            # Handle rate limiting
-            if response.status_code == 429:
-                wait_time = 2 ** retry + random.random()
-                print(f"Rate limited. Waiting {wait_time:.2f} seconds before retry {retry+1}/{MAX_RETRIES}...")
-                time.sleep(wait_time)
-                continue
-                
-            response.raise_for_status()
-            data = response.json()
-            
-            # Cache the results
-            try:
-                ensure_cache_dir()
-                with open(cache_file, 'w') as f:
-                    cache_content = {
-                        'timestamp': time.time(),
-                        'data': data
-                    }
-                    json.dump(cache_content, f)
-            except Exception as e:
-                print(f"Error caching data: {e}")
-                
-            return data
-        except requests.exceptions.RequestException as e:
-            if response.status_code == 429 and retry < MAX_RETRIES - 1:
-                # Already handled above, just continue the loop
-                continue
-            elif retry < MAX_RETRIES - 1:
-                wait_time = 2 ** retry + random.random()
-                print(f"Error: {e}. Retrying in {wait_time:.2f} seconds... ({retry+1}/{MAX_RETRIES})")
-                time.sleep(wait_time)
-            else:
-                print(f"Error fetching historical data for {coin_id} after {MAX_RETRIES} retries: {e}")
-                return None
-        except Exception as e:
-            print(f"Unexpected error for {coin_id}: {e}")
-            return None
-    
-    return None
+    """Get historical price data for a specific coin from the shared history cache"""
+    return history_cache.get_history(coin_id, days, vs_currency)
 
 def prepare_historical_dataframe(coin_ids, max_coins=50):
     """Prepare a DataFrame with historical prices for all coins"""
-    all_prices = {}
-    all_volumes = {}
-    
     # Add benchmark to the list if not already there
     if BENCHMARK_COIN not in coin_ids:
         coin_ids = [BENCHMARK_COIN] + coin_ids
@@ -119,48 +50,17 @@ def prepare_historical_dataframe(coin_ids, max_coins=50):
         print(f"Limiting to top {max_coins} coins to prevent excessive API calls")
         coin_ids = coin_ids[:max_coins]
     
-    for coin_id in coin_ids:
-        history = get_historical_prices(coin_id)
-        if not history:
-            continue
-            
-        # Extract price and volume data
-        prices = history.get('prices', [])
-        volumes = history.get('total_volumes', [])
-        
-        # Convert to DataFrames
-        if prices:
-            df_prices = pd.DataFrame(prices, columns=['timestamp', coin_id])
-            df_prices['timestamp'] = pd.to_datetime(df_prices['timestamp'], unit='ms')
-            df_prices.set_index('timestamp', inplace=True)
-            all_prices[coin_id] = df_prices
-        
-        if volumes:
-            df_volumes = pd.DataFrame(volumes, columns=['timestamp', coin_id])
-            df_volumes['timestamp'] = pd.to_datetime(df_volumes['timestamp'], unit='ms')
-            df_volumes.set_index('timestamp', inplace=True)
-            all_volumes[coin_id] = df_volumes
-        
-        # Add a small delay between API requests to avoid hitting rate limits
-        time.sleep(0.5)
+    # Serve all histories from the shared cache; missing days are fetched concurrently
+    histories = history_cache.get_histories(coin_ids, HISTORY_DAYS)
     
-    # Combine all price DataFrames
-    if all_prices:
-        df_prices = pd.concat(all_prices.values(), axis=1)
-        df_prices = df_prices.sort_index()
-        
-        # Forward fill missing values (if a coin doesn't have data for a day)
-        df_prices = df_prices.ffill()
-    else:
-        df_prices = pd.DataFrame()
-    
-    # Combine all volume DataFrames
-    if all_volumes:
-        df_volumes = pd.concat(all_volumes.values(), axis=1)
-        df_volumes = df_volumes.sort_index()
-        df_volumes = df_volumes.ffill()
-    else:
-        df_volumes = pd.DataFrame()
+    # Snap every series onto one UTC daily grid; gaps are forward-filled and reported
+    price_panel_data = price_panel.align_charts(histories, 'prices')
+    if price_panel_data.coin_ids:
+        price_panel.print_coverage(price_panel_data)
+    volume_panel_data = price_panel.align_charts(histories, 'total_volumes')
+    
+    df_prices = price_panel_data.to_frame() if price_panel_data.coin_ids else pd.DataFrame()
+    df_volumes = volume_panel_data.to_frame() if volume_panel_data.coin_ids else pd.DataFrame()
     
     return df_prices, df_volumes
 
@@ -170,153 +70,102 @@ def calculate_returns(df_prices):
     daily_returns = df_prices.pct_change().dropna()
     return daily_returns
 
+def print_top_coins(top_coins, market_data, top_n=TOP_N_COINS):
+    """Print the selected coins with their 24h change from a highlights snapshot"""
+    print(f"Top {top_n} coins from daily highlights:")
+    for i, coin_id in enumerate(top_coins):
+        coin_info = next((c for c in market_data if c.get('id') == coin_id), None)
+        if coin_info:
+            change = coin_info.get('price_change_percentage_24h', 0)
+            symbol = coin_info.get('symbol', '').upper()
+            print(f"  {i+1}. {symbol} ({coin_id}): {change:.2f}% 24h change")
+
 def extract_top_coins_from_highlights(market_data, top_n=TOP_N_COINS):
     """Extract the top N coins from the daily AI highlights summary"""
-    # Sort the market data by 24h price change (descending)
-    sorted_data = sorted(
-        market_data, 
-        key=lambda x: x.get('price_change_percentage_24h', 0), 
-        reverse=True
-    )
-    
-    # Take the top N coins
-    top_coins = [coin['id'] for coin in sorted_data[:top_n] if 'id' in coin]
+    # Select the top N coins by 24h price change (descending) without sorting the whole snapshot
+    changes = np.array([coin.get('price_change_percentage_24h', 0) for coin in market_data], dtype=np.float64)
+    top = ranking.top_k(changes, top_n)
+    top_coins = [market_data[i]['id'] for i in top[top >= 0] if 'id' in market_data[i]]
     
     if not top_coins:
         print("Warning: No valid coins found in the highlights data")
         return []
     
-    print(f"Top {top_n} coins from daily highlights:")
-    for i, coin_id in enumerate(top_coins):
-        coin_info = next((c for c in sorted_data if c.get('id') == coin_id), None)
-        if coin_info:
-            change = coin_info.get('price_change_percentage_24h', 0)
-            symbol = coin_info.get('symbol', '').upper()
-            print(f"  {i+1}. {symbol} ({coin_id}): {change:.2f}% 24h change")
+    print_top_coins(top_coins, market_data, top_n)
     
     return top_coins
 
-def run_highlights_based_backtest(df_prices, daily_returns, market_data_by_day):
-    """Run a backtest based on the top coins from the daily AI highlights summary"""
-    # Initialize portfolio and benchmark tracking
-    portfolio_value = [INITIAL_CAPITAL]
-    benchmark_value = [INITIAL_CAPITAL]
-    rebalance_dates = []
-    positions = {}
-    win_count = 0
-    total_rebalances = 0
-    spike_captures = 0  # Count of ≥10% daily moves caught
+def market_data_for_day(market_data_by_day, day_key):
+    """The day's snapshot, else the most recent earlier one, else the first available one"""
+    if day_key in market_data_by_day:
+        return market_data_by_day[day_key]
+    available_days = [d for d in market_data_by_day.keys() if d < day_key]
+    if available_days:
+        return market_data_by_day[max(available_days)]
+    return market_data_by_day[min(market_data_by_day.keys())]
+
+def snapshot_scores(market_data_by_day, dates, coin_ids):
+    """
+    days x coins matrix of the 24h change each day's snapshot reports
+    (NaN for coins not in the snapshot or without price data)
+    """
+    columns = {coin_id: i for i, coin_id in enumerate(coin_ids)}
+    scores = np.full((len(dates), len(coin_ids)), np.nan)
+    for row, day in enumerate(dates):
+        for coin in market_data_for_day(market_data_by_day, day.strftime('%Y-%m-%d')):
+            if coin.get('id') in columns:
+                scores[row, columns[coin['id']]] = coin.get('price_change_percentage_24h', 0)
+    return scores
+
+def run_highlights_based_backtest(df_prices, market_data_by_day, df_volumes=None):
+    """
+    Run a backtest based on the top coins from the daily AI highlights summary.
+    With `df_volumes`, its trades are also priced with cost_model.
+    """
+    if not market_data_by_day:
+        print("Error: No highlights snapshots to backtest")
+        return None
     
-    # Find the closest trading day to start with
-    trading_days = daily_returns.index
+    # Rank each day's snapshot and rotate into its top coins on the shared engine
+    panel = strategy_engine.Panel.from_frames(df_prices, df_volumes, benchmark=BENCHMARK_COIN)
+    scores = snapshot_scores(market_data_by_day, df_prices.index, panel.coin_ids)
+    strategy = strategy_engine.HighlightsRotation(scores, TOP_N_COINS, HOLDING_PERIOD_DAYS)
+    result = strategy_engine.run(panel, strategy, state=strategy_engine.new_state(INITIAL_CAPITAL))
     
     # Make sure we have at least one day of data
-    if len(trading_days) < 2:
+    if result is None or len(result['rows']) < 2:
         print("Error: Not enough trading days in the data")
         return None
     
-    current_day = trading_days[0]
-    last_rebalance = current_day - timedelta(days=HOLDING_PERIOD_DAYS + 1)  # Force initial rebalance
-    
-    for i, current_day in enumerate(trading_days):
-        # Get the day's market data (or use the most recent if not available for this day)
-        day_key = current_day.strftime('%Y-%m-%d')
-        if day_key in market_data_by_day:
-            day_market_data = market_data_by_day[day_key]
-        else:
-            # Find the most recent day
-            available_days = [d for d in market_data_by_day.keys() if d < day_key]
-            if available_days:
-                latest_day = max(available_days)
-                day_market_data = market_data_by_day[latest_day]
-            else:
-                # Use the first available day
-                first_day = min(market_data_by_day.keys())
-                day_market_data = market_data_by_day[first_day]
-        
-        # Check if it's time to rebalance
-        if (current_day - last_rebalance).days >= HOLDING_PERIOD_DAYS:
-            # Get top coins from the highlights
-            top_coins = extract_top_coins_from_highlights(day_market_data, TOP_N_COINS)
-            
-            # Store rebalance decision for later analysis
-            rebalance_info = {
-                'date': current_day,
-                'selected_coins': top_coins,
-                'daily_changes': {
-                    coin: next(
-                        (c.get('price_change_percentage_24h', 0) for c in day_market_data if c.get('id') == coin), 
-                        0
-                    ) for coin in top_coins
-                }
-            }
-            rebalance_dates.append(rebalance_info)
-            
-            # Close old positions and calculate P&L
-            prior_portfolio_value = portfolio_value[-1]
-            
-            # Record if this rebalance was a win compared to benchmark
-            if len(positions) > 0 and i > 0:
-                portfolio_return = (portfolio_value[-1] / portfolio_value[-2]) - 1
-                benchmark_return = (benchmark_value[-1] / benchmark_value[-2]) - 1
-                if portfolio_return > benchmark_return:
-                    win_count += 1
-                total_rebalances += 1
-            
-            # Create new equal-weighted positions
-            if top_coins:
-                # Filter to only coins we have price data for
-                investable_coins = [coin for coin in top_coins if coin in df_prices.columns]
-                if investable_coins:
-                    positions = {coin: prior_portfolio_value / len(investable_coins) for coin in investable_coins}
-                else:
-                    # If no coins have price data, maintain cash position
-                    positions = {}
-            else:
-                positions = {}
-            
-            last_rebalance = current_day
-        
-        # Update portfolio value for today
-        if positions:
-            # Only consider coins that have data for today
-            valid_positions = {coin: amount for coin, amount in positions.items() 
-                             if coin in daily_returns.columns and current_day in daily_returns.index}
-            
-            if valid_positions:
-                daily_pnl = sum(valid_positions[coin] * daily_returns.loc[current_day, coin]
-                                for coin in valid_positions)
-                new_portfolio_value = portfolio_value[-1] + daily_pnl
-                
-                # Check for spike captures (≥10% daily moves)
-                for coin in valid_positions:
-                    if daily_returns.loc[current_day, coin] >= 0.10:  # 10% or more
-                        spike_captures += 1
-            else:
-                # No valid positions, maintain current value
-                new_portfolio_value = portfolio_value[-1]
+    rebalance_dates = []
+    for row, selected, changes in zip(result['rebalances'], result['selected'], result['selected_scores']):
+        current_day = df_prices.index[row]
+        top_coins = [panel.coin_ids[coin] for coin in selected if coin >= 0]
+        if top_coins:
+            print_top_coins(top_coins, market_data_for_day(market_data_by_day, current_day.strftime('%Y-%m-%d')))
         else:
-            # No positions, maintain current value
-            new_portfolio_value = portfolio_value[-1]
+            print("Warning: No valid coins found in the highlights data")
         
-        portfolio_value.append(new_portfolio_value)
-        
-        # Update benchmark value
-        if BENCHMARK_COIN in daily_returns.columns and current_day in daily_returns.index:
-            benchmark_daily_return = daily_returns.loc[current_day, BENCHMARK_COIN]
-            new_benchmark_value = benchmark_value[-1] * (1 + benchmark_daily_return)
-            benchmark_value.append(new_benchmark_value)
-        else:
-            benchmark_value.append(benchmark_value[-1])
+        # Store rebalance decision for later analysis
+        rebalance_dates.append({
+            'date': current_day,
+            'selected_coins': top_coins,
+            'daily_changes': dict(zip(top_coins, changes[selected >= 0]))
+        })
+    
+    costs = None
+    if panel.volumes is not None:
+        costs = cost_model.cost_metrics(result, cost_model.trade_volumes(panel, result['rows']))
     
     # Compile results
     performance = {
-        'portfolio_values': portfolio_value[1:],  # Drop the initial value
-        'benchmark_values': benchmark_value[1:],  # Drop the initial value
-        'dates': trading_days,
+        'portfolio_values': result['values'].tolist(),
+        'benchmark_values': result['benchmark_values'].tolist(),
+        'dates': result['dates'],
         'rebalance_dates': rebalance_dates,
-        'win_rate': win_count / total_rebalances if total_rebalances > 0 else 0,
-        'spike_captures': spike_captures
+        'win_rate': result['win_count'] / result['total_rebalances'] if result['total_rebalances'] > 0 else 0,
+        'spike_captures': result['spike_captures'],
+        'costs': costs
     }
     
     return performance
@@ -375,7 +224,9 @@ def calculate_performance_metrics(performance):
         'benchmark_returns': benchmark_returns,
         'strategy_cumulative': strategy_cumulative,
         'benchmark_cumulative': benchmark_cumulative,
-        'rebalance_dates': performance['rebalance_dates']
+        'rebalance_dates': performance['rebalance_dates'],
+        'monte_carlo': monte_carlo.run_monte_carlo(strategy_returns.values),
+        'costs': performance.get('costs')
     }
     
     return metrics
@@ -389,6 +240,11 @@ def plot_results(metrics, coin_universe):
     plt.plot(metrics['strategy_cumulative'], label=f'Top {TOP_N_COINS} Daily AI Coins')
     plt.plot(metrics['benchmark_cumulative'], label=f'Benchmark ({BENCHMARK_COIN.capitalize()})')
     plt.title(f'Daily Top Performers Strategy: Top {TOP_N_COINS} AI Coins vs. {BENCHMARK_COIN.capitalize()}')
+    if metrics.get('monte_carlo'):
+        bands = metrics['monte_carlo']['bands']
+        low, high = metrics['monte_carlo']['percentiles'][0], metrics['monte_carlo']['percentiles'][-1]
+        plt.fill_between(metrics['strategy_cumulative'].index, bands[low] + 1, bands[high] + 1,
+                         color='tab:blue', alpha=0.15, label=f'Bootstrap P{low}-P{high}')
     plt.ylabel('Cumulative Return')
     plt.legend()
     plt.grid(True)
@@ -425,6 +281,10 @@ def plot_results(metrics, coin_universe):
     print(f"Maximum Drawdown: {metrics['max_drawdown']:.2%}")
     print(f"Win Rate: {metrics['win_rate']:.2%} of rebalances")
     print(f"Spike Captures: {metrics['spike_captures']} instances of ≥10% daily moves")
+    if metrics.get('monte_carlo'):
+        monte_carlo.print_summary(metrics['monte_carlo'])
+    if metrics.get('costs'):
+        cost_model.print_summary(metrics['costs'])
     print("="*50)
     
     # Get most recent portfolio allocation
@@ -470,7 +330,7 @@ def simulate_historical_market_data(coin_universe, days=HISTORY_DAYS):
         return None
     
     # Get historical price data for all coins
-    df_prices, _ = prepare_historical_dataframe(coin_universe)
+    df_prices, df_volumes = prepare_historical_dataframe(coin_universe)
     
     if df_prices.empty:
         print("No price data available. Exiting.")
@@ -509,7 +369,7 @@ def simulate_historical_market_data(coin_universe, days=HISTORY_DAYS):
             market_data_by_day[day_str] = day_market_data
     
     print(f"Created simulated market data for {len(market_data_by_day)} days")
-    return market_data_by_day, df_prices, daily_returns
+    return market_data_by_day, df_prices, daily_returns, df_volumes
 
 def main():
     """Main function to run the highlights-based backtest"""
@@ -530,7 +390,7 @@ def main():
     if not simulation_result:
         return
     
-    market_data_by_day, df_prices, daily_returns = simulation_result
+    market_data_by_day, df_prices, daily_returns, df_volumes = simulation_result
     
     # Ensure we have enough coins for a meaningful backtest
     if len(df_prices.columns) < MIN_COINS_FOR_BACKTEST:
@@ -541,7 +401,7 @@ def main():
     
     # Run highlights-based backtest
     print(f"Running highlights-based backtest...")
-    performance = run_highlights_based_backtest(df_prices, daily_returns, market_data_by_day)
+    performance = run_highlights_based_backtest(df_prices, market_data_by_day, df_volumes)
     
     if not performance:
         print("Failed to run backtest. Exiting.")
@@ -561,6 +421,9 @@ def main():
         'Strategy_Cumulative': metrics['strategy_cumulative'].values,
         'Benchmark_Cumulative': metrics['benchmark_cumulative'].values
     })
+    if metrics.get('monte_carlo'):
+        for column, values in monte_carlo.band_columns(metrics['monte_carlo']).items():
+            results_df[column] = values
     results_df.to_csv("Momentum Backtest/highlights_backtest_results.csv", index=False)
     
     # Save portfolio allocations history
@@ -5,13 +5,17 @@ import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import json
-import requests
-import time
-import random
+import argparse
 
 # Add parent directory to path so we can import from ai_highlights
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ai_highlights import get_market_data, COINGECKO_API_URL
+from ai_highlights import get_market_data
+import history_cache
+import price_panel
+import monte_carlo
+import atomic_io
+import strategy_engine
+import cost_model
 
 # Constants for the backtest
 LOOKBACK_DAYS = 7  # Momentum lookback period in days
@@ -21,8 +25,11 @@ HISTORY_DAYS = 90  # How many days of historical data to backtest
 BENCHMARK_COIN = "bitcoin"  # Benchmark to compare against
 INITIAL_CAPITAL = 10000  # Starting capital in USD
 CACHE_DIR = "Momentum Backtest/cache"  # Updated cache directory path
-MAX_RETRIES = 5  # Maximum number of retries for API requests
 MIN_COINS_FOR_BACKTEST = 10  # Minimum number of coins needed to run backtest
+MAX_BACKTEST_COINS = 50  # Coins fetched per run, benchmark included (prefetch_data.py warms the same list)
+RESULTS_FILE = "Momentum Backtest/momentum_results.csv"
+ALLOCATIONS_FILE = "Momentum Backtest/portfolio_allocations.csv"
+STATE_FILE = "Momentum Backtest/cache/backtest_state.json"  # Saved by every run for --incremental
 
 def ensure_cache_dir():
     """Ensure cache directory exists"""
@@ -30,239 +37,230 @@ def ensure_cache_dir():
         os.makedirs(CACHE_DIR)
 
 def get_historical_prices(coin_id, days=HISTORY_DAYS, vs_currency="usd"):
-    """Get historical price data for a specific coin with exponential backoff for rate limits"""
-    cache_file = f"{CACHE_DIR}/{coin_id}_history_{days}d.json"
-    
-    # Try to load from cache
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            cache_time = cache_data.get('timestamp', 0)
-            # Cache valid for 12 hours
-            if time.time() - cache_time < 12 * 3600:
-                print(f"Loading {coin_id} history from cache...")
-                return cache_data.get('data')
-        except Exception as e:
-            print(f"Error reading cache: {e}")
-    
-    # Fetch from API if cache not available
-    print(f"Fetching {days} days of history for {coin_id}...")
-    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
-    params = {
-        'vs_currency': vs_currency,
-        'days': days,
-        'interval': 'daily'
-    }
-    
-    # Implement exponential backoff
-    for retry in range(MAX_RETRIES):
-        try:
-            response = requests.get(url, params=params)
-            
-            # Handle rate limiting
-            if response.status_code == 429:
-                wait_time = 2 ** retry + random.random()
-                print(f"Rate limited. Waiting {wait_time:.2f} seconds before retry {retry+1}/{MAX_RETRIES}...")
-                time.sleep(wait_time)
-                continue
-                
-            response.raise_for_status()
-            data = response.json()
-            
-            # Cache the results
-            try:
-                ensure_cache_dir()
-                with open(cache_file, 'w') as f:
-                    cache_content = {
-                        'timestamp': time.time(),
-                        'data': data
-                    }
-                    json.dump(cache_content, f)
-            except Exception as e:
-                print(f"Error caching data: {e}")
-                
-            return data
-        except requests.exceptions.RequestException as e:
-            if response.status_code == 429 and retry < MAX_RETRIES - 1:
-                # Already handled above, just continue the loop
-                continue
-            elif retry < MAX_RETRIES - 1:
-                wait_time = 2 ** retry + random.random()
-                print(f"Error: {e}. Retrying in {wait_time:.2f} seconds... ({retry+1}/{MAX_RETRIES})")
-                time.sleep(wait_time)
-            else:
-                print(f"Error fetching historical data for {coin_id} after {MAX_RETRIES} retries: {e}")
-                return None
-        except Exception as e:
-            print(f"Unexpected error for {coin_id}: {e}")
-            return None
-    
-    return None
+    """Get historical price data for a specific coin from the shared history cache"""
+    return history_cache.get_history(coin_id, days, vs_currency)
 
-def prepare_historical_dataframe(coin_ids, max_coins=50):
-    """Prepare a DataFrame with historical prices for all coins"""
-    all_prices = {}
-    all_volumes = {}
-    
+def backtest_coins(coin_ids, max_coins=MAX_BACKTEST_COINS):
+    """The benchmark plus the top coins of the universe, at most `max_coins` in total (None = all)"""
     # Add benchmark to the list if not already there
     if BENCHMARK_COIN not in coin_ids:
         coin_ids = [BENCHMARK_COIN] + coin_ids
+    return coin_ids[:max_coins]
+
+def prepare_historical_dataframe(coin_ids, max_coins=MAX_BACKTEST_COINS, days=HISTORY_DAYS):
+    """Prepare a DataFrame with historical prices for all coins"""
+    coin_ids = backtest_coins(coin_ids, max_coins=None)
     
     # Limit the number of coins to prevent excessive API calls
     if len(coin_ids) > max_coins:
         print(f"Limiting to top {max_coins} coins to prevent excessive API calls")
         coin_ids = coin_ids[:max_coins]
     
-    for coin_id in coin_ids:
-        history = get_historical_prices(coin_id)
-        if not history:
-            continue
-            
-        # Extract price and volume data
-        prices = history.get('prices', [])
-        volumes = history.get('total_volumes', [])
-        
-        # Convert to DataFrames
-        if prices:
-            df_prices = pd.DataFrame(prices, columns=['timestamp', coin_id])
-            df_prices['timestamp'] = pd.to_datetime(df_prices['timestamp'], unit='ms')
-            df_prices.set_index('timestamp', inplace=True)
-            all_prices[coin_id] = df_prices
-        
-        if volumes:
-            df_volumes = pd.DataFrame(volumes, columns=['timestamp', coin_id])
-            df_volumes['timestamp'] = pd.to_datetime(df_volumes['timestamp'], unit='ms')
-            df_volumes.set_index('timestamp', inplace=True)
-            all_volumes[coin_id] = df_volumes
-        
-        # Add a small delay between API requests to avoid hitting rate limits
-        time.sleep(0.5)
+    # Serve all histories from the shared cache; missing days are fetched concurrently
+    histories = history_cache.get_histories(coin_ids, days)
     
-    # Combine all price DataFrames
-    if all_prices:
-        df_prices = pd.concat(all_prices.values(), axis=1)
-        df_prices = df_prices.sort_index()
-        
-        # Forward fill missing values (if a coin doesn't have data for a day)
-        df_prices = df_prices.ffill()
-    else:
-        df_prices = pd.DataFrame()
+    # Snap every series onto one UTC daily grid; gaps are forward-filled and reported
+    price_panel_data = price_panel.align_charts(histories, 'prices')
+    if price_panel_data.coin_ids:
+        price_panel.print_coverage(price_panel_data)
+    volume_panel_data = price_panel.align_charts(histories, 'total_volumes')
     
-    # Combine all volume DataFrames
-    if all_volumes:
-        df_volumes = pd.concat(all_volumes.values(), axis=1)
-        df_volumes = df_volumes.sort_index()
-        df_volumes = df_volumes.ffill()
-    else:
-        df_volumes = pd.DataFrame()
+    df_prices = price_panel_data.to_frame() if price_panel_data.coin_ids else pd.DataFrame()
+    df_volumes = volume_panel_data.to_frame() if volume_panel_data.coin_ids else pd.DataFrame()
     
     return df_prices, df_volumes
 
-def calculate_returns(df_prices):
-    """Calculate daily and rolling returns"""
-    # Daily returns
-    daily_returns = df_prices.pct_change().dropna()
-    
-    # Lookback period returns for momentum
-    lookback_returns = df_prices.pct_change(periods=LOOKBACK_DAYS).dropna()
-    
-    return daily_returns, lookback_returns
-
-def run_momentum_strategy(df_prices, daily_returns, lookback_returns):
-    """Run the momentum strategy backtest"""
-    # Initialize portfolio and benchmark tracking
-    portfolio_value = [INITIAL_CAPITAL]
-    benchmark_value = [INITIAL_CAPITAL]
-    rebalance_dates = []
-    positions = {}
-    win_count = 0
-    total_rebalances = 0
-    spike_captures = 0  # Count of ≥10% daily moves caught
-    
-    # Drop the first LOOKBACK_DAYS rows as we need prior data for momentum calculation
-    start_idx = LOOKBACK_DAYS
-    trading_days = daily_returns.index[start_idx:]
-    
-    # Find the closest trading day to start with
-    current_day = trading_days[0]
-    last_rebalance = current_day - timedelta(days=HOLDING_PERIOD_DAYS + 1)  # Force initial rebalance
-    
-    for i, current_day in enumerate(trading_days):
-        day_idx = start_idx + i
-        
-        # Check if it's time to rebalance
-        if (current_day - last_rebalance).days >= HOLDING_PERIOD_DAYS:
-            # Get the momentum ranking as of yesterday
-            momentum_rank_day = current_day - timedelta(days=1)
-            if momentum_rank_day in lookback_returns.index:
-                momentum_ranking = lookback_returns.loc[momentum_rank_day].sort_values(ascending=False)
-                
-                # Filter out benchmark from trading set if it's in there
-                if BENCHMARK_COIN in momentum_ranking:
-                    momentum_ranking = momentum_ranking.drop(BENCHMARK_COIN)
-                
-                # Select top N coins
-                top_coins = momentum_ranking.head(TOP_N_COINS).index.tolist()
-                
-                # Store rebalance decision for later analysis
-                rebalance_info = {
-                    'date': current_day,
-                    'selected_coins': top_coins,
-                    'momentum_values': {coin: momentum_ranking[coin] for coin in top_coins}
-                }
-                rebalance_dates.append(rebalance_info)
-                
-                # Close old positions and calculate P&L
-                prior_portfolio_value = portfolio_value[-1]
-                
-                # Record if this rebalance was a win compared to benchmark
-                if len(positions) > 0 and i > 0:
-                    portfolio_return = (portfolio_value[-1] / portfolio_value[-2]) - 1
-                    benchmark_return = (benchmark_value[-1] / benchmark_value[-2]) - 1
-                    if portfolio_return > benchmark_return:
-                        win_count += 1
-                    total_rebalances += 1
-                
-                # Create new equal-weighted positions
-                positions = {coin: prior_portfolio_value / len(top_coins) for coin in top_coins}
-                last_rebalance = current_day
-            
-        # Update portfolio value for today
-        if positions:
-            daily_pnl = sum(positions[coin] * daily_returns.loc[current_day, coin]
-                            for coin in positions if coin in daily_returns.columns)
-            new_portfolio_value = portfolio_value[-1] + daily_pnl
-            portfolio_value.append(new_portfolio_value)
-            
-            # Check for spike captures (≥10% daily moves)
-            for coin in positions:
-                if coin in daily_returns.columns and daily_returns.loc[current_day, coin] >= 0.10:  # 10% or more
-                    spike_captures += 1
-        else:
-            portfolio_value.append(portfolio_value[-1])
-        
-        # Update benchmark value
-        if BENCHMARK_COIN in daily_returns.columns:
-            benchmark_daily_return = daily_returns.loc[current_day, BENCHMARK_COIN]
-            new_benchmark_value = benchmark_value[-1] * (1 + benchmark_daily_return)
-            benchmark_value.append(new_benchmark_value)
-        else:
-            benchmark_value.append(benchmark_value[-1])
+def run_momentum_strategy(df_prices, state=None, df_volumes=None):
+    """
+    Run the momentum strategy backtest on the shared strategy engine.
+    
+    With a `state` from an earlier run, only the trading days after its last
+    processed day are simulated and the state is advanced in place.
+    With `df_volumes` (from prepare_historical_dataframe), the run's trades are
+    also priced with cost_model (fees, volume-dependent market impact, capacity).
+    """
+    panel = strategy_engine.Panel.from_frames(df_prices, df_volumes, benchmark=BENCHMARK_COIN)
+    strategy = strategy_engine.MomentumRotation(LOOKBACK_DAYS, HOLDING_PERIOD_DAYS, TOP_N_COINS)
+    if state is None:
+        state = strategy_engine.new_state(INITIAL_CAPITAL)
+        start = None
+    else:
+        start = int(np.searchsorted(df_prices.index, pd.Timestamp(state['last_date']), side='right'))
+    
+    result = strategy_engine.run(panel, strategy, start, state=state)
+    
+    portfolio_value, benchmark_value, trading_days, rebalance_dates = [], [], pd.DatetimeIndex([]), []
+    costs = None
+    if result is not None:
+        state.update(result['state'], last_date=result['dates'][-1])
+        portfolio_value = result['values'].tolist()
+        benchmark_value = result['benchmark_values'].tolist()
+        trading_days = result['dates']
+        # Store rebalance decisions for later analysis
+        for row, selected, momentum in zip(result['rebalances'], result['selected'], result['selected_scores']):
+            top_coins = [panel.coin_ids[coin] for coin in selected if coin >= 0]
+            rebalance_dates.append({
+                'date': df_prices.index[row],
+                'selected_coins': top_coins,
+                'momentum_values': dict(zip(top_coins, momentum[selected >= 0]))
+            })
+        # Costs assume the run starts from cash, so they are only priced for full runs
+        if panel.volumes is not None and start is None:
+            costs = cost_model.cost_metrics(result, cost_model.trade_volumes(panel, result['rows']))
     
     # Compile results
     performance = {
-        'portfolio_values': portfolio_value[1:],  # Drop the initial value
-        'benchmark_values': benchmark_value[1:],  # Drop the initial value
+        'portfolio_values': portfolio_value,
+        'benchmark_values': benchmark_value,
         'dates': trading_days,
         'rebalance_dates': rebalance_dates,
-        'win_rate': win_count / total_rebalances if total_rebalances > 0 else 0,
-        'spike_captures': spike_captures
+        'win_rate': state['win_count'] / state['total_rebalances'] if state['total_rebalances'] > 0 else 0,
+        'spike_captures': state['spike_captures'],
+        'costs': costs,
+        'state': state
     }
     
     return performance
 
-def calculate_performance_metrics(performance, daily_returns):
+def save_backtest_state(state, df_prices, first_values, universe):
+    """
+    Persist the backtest state for --incremental runs: positions, the last two
+    values, counters, the last processed day, the value the cumulative columns
+    are measured from, the coins the full run selected from (see backtest_coins)
+    and the last LOOKBACK_DAYS + 1 price rows (enough to compute the next day's
+    momentum and returns).
+    """
+    buffer = df_prices.iloc[-(LOOKBACK_DAYS + 1):]
+    data = {
+        **{key: state[key] for key in ('portfolio_value', 'benchmark_value', 'positions',
+                                       'days_traded', 'win_count', 'total_rebalances', 'spike_captures')},
+        'last_rebalance': (pd.Timestamp(state['last_date']) - timedelta(days=state['days_since_rebalance'])).isoformat()
+                          if state['days_since_rebalance'] is not None else None,
+        'last_date': pd.Timestamp(state['last_date']).isoformat(),
+        'first_values': [float(value) for value in first_values],
+        'universe': list(universe),
+        'price_buffer': {
+            'dates': [date.isoformat() for date in buffer.index],
+            'coins': list(buffer.columns),
+            'prices': buffer.to_numpy().tolist()
+        }
+    }
+    try:
+        atomic_io.atomic_write_json(STATE_FILE, data)
+    except IOError as e:
+        print(f"Error writing backtest state: {e}")
+
+def load_backtest_state():
+    """Saved backtest state and its price buffer DataFrame, or (None, None)"""
+    if not os.path.exists(STATE_FILE):
+        return None, None
+    try:
+        with open(STATE_FILE, 'r') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error reading backtest state: {e}")
+        return None, None
+
+    buffer = data.pop('price_buffer')
+    df_buffer = pd.DataFrame(buffer['prices'], index=pd.to_datetime(buffer['dates']), columns=buffer['coins'], dtype=float)
+    state = {**data, 'last_date': pd.Timestamp(data['last_date'])}
+    last_rebalance = state.pop('last_rebalance')
+    state['days_since_rebalance'] = (state['last_date'] - pd.Timestamp(last_rebalance)).days if last_rebalance else None
+    return state, df_buffer
+
+def advance_backtest(state, df_buffer, df_new_prices):
+    """
+    Advance a saved backtest by the days in `df_new_prices` only.
+    
+    Returns:
+        Tuple of (performance for the new trading days, prices panel to buffer next time)
+    """
+    df_new_prices = df_new_prices[df_new_prices.index > df_buffer.index[-1]].reindex(columns=df_buffer.columns)
+    df_prices = pd.concat([df_buffer, df_new_prices]).ffill()
+    return run_momentum_strategy(df_prices, state), df_prices
+
+def append_csv(path, rows):
+    """Append rows to a CSV, matching the columns of its existing header (extra columns stay empty)"""
+    if os.path.exists(path):
+        columns = pd.read_csv(path, nrows=0).columns
+        rows.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+    else:
+        rows.to_csv(path, index=False)
+
+def run_incremental():
+    """
+    Daily update: load the saved state, fetch only the days since its last
+    processed day, advance the backtest over them, append the new rows to
+    the results and allocations CSVs and redraw the chart from the results CSV.
+    
+    The saved state only covers the coins of the last full run, so when the
+    current top AI coin list differs from them a full run is needed instead.
+    
+    Returns:
+        False if a full run is needed (no usable saved state, or a new coin universe)
+    """
+    state, df_buffer = load_backtest_state()
+    if state is None or df_buffer.empty:
+        print("No saved backtest state found.")
+        return False
+    
+    coin_universe = get_coin_universe()
+    if coin_universe is None:
+        print("Continuing with the coin universe of the last full run.")
+    elif set(backtest_coins(coin_universe)) != set(state.get('universe', [])):
+        print("The top AI coin list changed since the last full run.")
+        return False
+    
+    last_day = df_buffer.index[-1]
+    new_days = (pd.Timestamp(history_cache.today_ms(), unit='ms') - last_day).days
+    if new_days <= 0:
+        print(f"Backtest is already up to date (last processed day {last_day.strftime('%Y-%m-%d')}).")
+        return True
+    
+    print(f"Advancing backtest by up to {new_days} day(s) from {last_day.strftime('%Y-%m-%d')}...")
+    histories = history_cache.get_histories(list(df_buffer.columns), new_days + 1)
+    last_epoch_day = int(last_day.value // (history_cache.DAY_MS * 1_000_000))
+    panel = price_panel.align_charts(histories, 'prices', start_day=last_epoch_day + 1)
+    df_new_prices = panel.to_frame() if panel.coin_ids else pd.DataFrame(columns=df_buffer.columns, index=pd.DatetimeIndex([]), dtype=float)
+    
+    previous_values = (state['portfolio_value'][-1], state['benchmark_value'][-1])
+    performance, df_prices = advance_backtest(state, df_buffer, df_new_prices)
+    if not len(performance['dates']):
+        print("No new complete trading days yet.")
+        return True
+    
+    strategy_values = np.array([previous_values[0]] + performance['portfolio_values'])
+    benchmark_values = np.array([previous_values[1]] + performance['benchmark_values'])
+    first_values = state['first_values']
+    append_csv(RESULTS_FILE, pd.DataFrame({
+        'Date': performance['dates'],
+        'Strategy_Return': strategy_values[1:] / strategy_values[:-1] - 1,
+        'Benchmark_Return': benchmark_values[1:] / benchmark_values[:-1] - 1,
+        'Strategy_Cumulative': strategy_values[1:] / first_values[0],
+        'Benchmark_Cumulative': benchmark_values[1:] / first_values[1]
+    }))
+    allocations = [
+        {'Date': rebalance['date'], 'Coin': coin, 'Momentum': rebalance['momentum_values'][coin]}
+        for rebalance in performance['rebalance_dates'] for coin in rebalance['selected_coins']
+    ]
+    if allocations:
+        append_csv(ALLOCATIONS_FILE, pd.DataFrame(allocations))
+    save_backtest_state(performance['state'], df_prices, first_values, state['universe'])
+    
+    results = pd.read_csv(RESULTS_FILE, index_col='Date', parse_dates=['Date'])
+    band = None
+    if {'Strategy_Cumulative_P5', 'Strategy_Cumulative_P95'} <= set(results.columns):
+        band = ('Bootstrap P5-P95 (last full run)', results['Strategy_Cumulative_P5'], results['Strategy_Cumulative_P95'])
+    plot_chart(results['Strategy_Cumulative'], results['Benchmark_Cumulative'], band)
+    
+    print(f"Processed {len(performance['dates'])} new day(s) through {performance['dates'][-1].strftime('%Y-%m-%d')}")
+    print(f"Total Return: {strategy_values[-1] / first_values[0] - 1:.2%} vs. Benchmark: {benchmark_values[-1] / first_values[1] - 1:.2%}")
+    if performance['rebalance_dates']:
+        latest = performance['rebalance_dates'][-1]
+        print(f"Current Portfolio: {', '.join(coin.upper() for coin in latest['selected_coins'])}")
+    return True
+
+def calculate_performance_metrics(performance):
     """Calculate key performance metrics"""
     portfolio_values = performance['portfolio_values']
     benchmark_values = performance['benchmark_values']
@@ -316,27 +314,38 @@ def calculate_performance_metrics(performance, daily_returns):
         'benchmark_returns': benchmark_returns,
         'strategy_cumulative': strategy_cumulative,
         'benchmark_cumulative': benchmark_cumulative,
-        'rebalance_dates': performance['rebalance_dates']  # Added to include in metrics
+        'rebalance_dates': performance['rebalance_dates'],  # Added to include in metrics
+        'monte_carlo': monte_carlo.run_monte_carlo(strategy_returns.values),
+        'costs': performance.get('costs')
     }
     
     return metrics
 
-def plot_results(metrics, coin_universe):
-    """Plot the backtest results"""
+def plot_chart(strategy_cumulative, benchmark_cumulative, band=None):
+    """
+    Draw the cumulative returns and drawdowns chart to momentum_results.png.
+    
+    Args:
+        strategy_cumulative, benchmark_cumulative: date-indexed growth of 1
+        band: optional (label, lower, upper) growth-of-1 band around the strategy
+    """
     plt.figure(figsize=(12, 8))
     
     # Cumulative returns
     plt.subplot(2, 1, 1)
-    plt.plot(metrics['strategy_cumulative'], label=f'Top {TOP_N_COINS} AI Coin Momentum')
-    plt.plot(metrics['benchmark_cumulative'], label=f'Benchmark ({BENCHMARK_COIN.capitalize()})')
+    plt.plot(strategy_cumulative, label=f'Top {TOP_N_COINS} AI Coin Momentum')
+    plt.plot(benchmark_cumulative, label=f'Benchmark ({BENCHMARK_COIN.capitalize()})')
     plt.title(f'Momentum Strategy: Top {TOP_N_COINS} AI Coins vs. {BENCHMARK_COIN.capitalize()}')
+    if band is not None:
+        label, lower, upper = band
+        plt.fill_between(strategy_cumulative.index, lower, upper, color='tab:blue', alpha=0.15, label=label)
     plt.ylabel('Cumulative Return')
     plt.legend()
     plt.grid(True)
     
     # Drawdowns
     plt.subplot(2, 1, 2)
-    drawdowns = 1 - metrics['strategy_cumulative'] / metrics['strategy_cumulative'].cummax()
+    drawdowns = 1 - strategy_cumulative / strategy_cumulative.cummax()
     plt.fill_between(drawdowns.index, 0, drawdowns.values, color='red', alpha=0.3)
     plt.title('Drawdowns')
     plt.ylabel('Drawdown')
@@ -347,6 +356,15 @@ def plot_results(metrics, coin_universe):
     
     # Save the figure
     plt.savefig("Momentum Backtest/momentum_results.png")
+
+def plot_results(metrics, coin_universe):
+    """Plot the backtest results"""
+    band = None
+    if metrics.get('monte_carlo'):
+        bands = metrics['monte_carlo']['bands']
+        low, high = metrics['monte_carlo']['percentiles'][0], metrics['monte_carlo']['percentiles'][-1]
+        band = (f'Bootstrap P{low}-P{high}', bands[low] + 1, bands[high] + 1)
+    plot_chart(metrics['strategy_cumulative'], metrics['benchmark_cumulative'], band)
     
     # Show summary 
     print("\n" + "="*50)
@@ -364,6 +382,10 @@ def plot_results(metrics, coin_universe):
     print(f"Maximum Drawdown: {metrics['max_drawdown']:.2%}")
     print(f"Win Rate: {metrics['win_rate']:.2%} of rebalances")
     print(f"Spike Captures: {metrics['spike_captures']} instances of ≥10% daily moves")
+    if metrics.get('monte_carlo'):
+        monte_carlo.print_summary(metrics['monte_carlo'])
+    if metrics.get('costs'):
+        cost_model.print_summary(metrics['costs'])
     print("="*50)
     
     # Get most recent top performers
@@ -394,13 +416,21 @@ def get_coin_universe():
     print(f"Identified {len(coin_universe)} AI-related coins for backtest universe.")
     return coin_universe
 
-def main():
-    """Main function to run the momentum backtest"""
+def main(incremental=False):
+    """
+    Main function to run the momentum backtest.
+    With `incremental`, only the days since the last run are processed (see run_incremental).
+    """
     print("Starting AI Coin Momentum Backtest...")
     
     # Ensure cache directory exists
     ensure_cache_dir()
     
+    if incremental:
+        if run_incremental():
+            return
+        print("Running the full backtest...")
+    
     # Get universe of AI coins
     coin_universe = get_coin_universe()
     if not coin_universe:
@@ -421,15 +451,12 @@ def main():
     
     print(f"Historical data prepared for {len(df_prices.columns)} coins.")
     
-    # Calculate returns
-    daily_returns, lookback_returns = calculate_returns(df_prices)
-    
     # Run momentum strategy
     print(f"Running momentum strategy with {LOOKBACK_DAYS}-day lookback period...")
-    performance = run_momentum_strategy(df_prices, daily_returns, lookback_returns)
+    performance = run_momentum_strategy(df_prices, df_volumes=df_volumes)
     
     # Calculate performance metrics
-    metrics = calculate_performance_metrics(performance, daily_returns)
+    metrics = calculate_performance_metrics(performance)
     
     # Plot and display results
     plot_results(metrics, coin_universe)
@@ -442,7 +469,10 @@ def main():
         'Strategy_Cumulative': metrics['strategy_cumulative'].values,
         'Benchmark_Cumulative': metrics['benchmark_cumulative'].values
     })
-    results_df.to_csv("Momentum Backtest/momentum_results.csv", index=False)
+    if metrics.get('monte_carlo'):
+        for column, values in monte_carlo.band_columns(metrics['monte_carlo']).items():
+            results_df[column] = values
+    results_df.to_csv(RESULTS_FILE, index=False)
     
     # Save portfolio allocations history
     allocations_data = []
@@ -456,9 +486,21 @@ def main():
     
     if allocations_data:
         allocations_df = pd.DataFrame(allocations_data)
-        allocations_df.to_csv("Momentum Backtest/portfolio_allocations.csv", index=False)
+        allocations_df.to_csv(ALLOCATIONS_FILE, index=False)
+    
+    # Save the state the next --incremental run continues from
+    if len(performance['dates']):
+        save_backtest_state(performance['state'], df_prices,
+                            (performance['portfolio_values'][0], performance['benchmark_values'][0]),
+                            backtest_coins(coin_universe))
     
     print("Backtest complete! Results saved to 'Momentum Backtest' folder.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI coin momentum backtest")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Advance the saved backtest by the new day(s) only and append to the CSVs")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(incremental=parse_args().incremental) 
\ No newline at end of file
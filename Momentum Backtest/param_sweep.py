@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Parallel parameter sweep for the momentum backtest.
+
+The price panel is loaded and aligned once, copied into a shared memory
+block, and every parameter combination is evaluated by a pool of worker
+processes that attach to it without copying. Each worker derives daily
+returns once and momentum matrices once per lookback, so a combination only
+costs a few array operations. Results come back as one row per combination.
+
+Usage (from the project root):
+    python3 "Momentum Backtest/param_sweep.py" --lookback 3-14 --holding 1-5 --top-n 1-5 \
+        --trailing 0,7,14 --entry top,positive
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import momentum_backtest
+import strategy_engine
+from momentum_backtest import (
+    LOOKBACK_DAYS, HOLDING_PERIOD_DAYS, TOP_N_COINS, HISTORY_DAYS, BENCHMARK_COIN, INITIAL_CAPITAL
+)
+
+# Constants
+ENTRY_RULES = strategy_engine.ENTRY_RULES
+RISK_FREE_RATE = 0.02  # Same assumptions as calculate_performance_metrics
+TRADING_DAYS_PER_YEAR = 252
+SWEEP_RESULTS_FILE = "Momentum Backtest/sweep_results.csv"
+DEFAULT_GRID = {
+    'lookback_days': [LOOKBACK_DAYS],
+    'holding_days': [HOLDING_PERIOD_DAYS],
+    'top_n': [TOP_N_COINS],
+    'trailing_window': [0],  # 0 disables the trailing-return filter
+    'entry_rule': ["top"]
+}
+
+# Panel attached by each worker process (see attach_panel)
+worker_state = {}
+
+def expand_grid(grid):
+    """All combinations of a {parameter: [values]} grid as a list of parameter dicts"""
+    grid = {**DEFAULT_GRID, **grid}
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+class PanelSignals(strategy_engine.Panel):
+    """
+    strategy_engine.Panel over a bare price matrix that also records whether
+    its runs wait for a complete price row (`require_complete`, passed on to
+    every MomentumRotation built by simulate_rotation). Returns and rankings
+    are cached by the Panel itself.
+    """
+
+    def __init__(self, prices, benchmark_col=None, require_complete=True):
+        super().__init__(prices, benchmark_col=benchmark_col)
+        # Long panels (require_complete=False): coins listed later simply aren't ranked until they have momentum
+        self.require_complete = require_complete
+
+def simulate_rotation(signals, params, start=None, end=None):
+    """
+    Top-N momentum rotation with the rules of momentum_backtest.run_momentum_strategy
+    (strategy_engine.MomentumRotation), evaluated on array rows [start, end) of the panel.
+
+    Returns:
+        strategy_engine.run result: 'rows' (panel rows traded), 'values' and
+        'benchmark_values' (per traded day), 'weights' (rows x coins target
+        weights), 'rebalances' (panel rows of rebalance days), ...;
+        or None if the window has no trading days
+    """
+    strategy = strategy_engine.MomentumRotation(require_complete=signals.require_complete, **params)
+    return strategy_engine.run(signals, strategy, start, end, strategy_engine.new_state(INITIAL_CAPITAL))
+
+def summarize(result):
+    """
+    Headline metrics of a simulated run, computed like calculate_performance_metrics.
+    Turnover is the average daily one-way turnover as a fraction of the portfolio
+    (the initial build is not counted).
+    """
+    values = result['values']
+    returns = values[1:] / values[:-1] - 1
+    cumulative = values[1:] / values[0]
+    if not len(returns):
+        return {'total_return': 0.0, 'annual_return': 0.0, 'volatility': 0.0,
+                'sharpe': 0.0, 'max_drawdown': 0.0, 'turnover': 0.0}
+
+    annual_return = cumulative[-1] ** (TRADING_DAYS_PER_YEAR / len(cumulative)) - 1
+    volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR) if len(returns) > 1 else 0.0
+    weight_changes = np.abs(np.diff(result['weights'], axis=0)).sum(axis=1) / 2
+    return {
+        'total_return': float(cumulative[-1] - 1),
+        'annual_return': float(annual_return),
+        'volatility': float(volatility),
+        'sharpe': float((annual_return - RISK_FREE_RATE) / volatility) if volatility > 0 else 0.0,
+        'max_drawdown': float(np.max(1 - cumulative / np.maximum.accumulate(cumulative))),
+        'turnover': float(weight_changes.mean()) if len(weight_changes) else 0.0
+    }
+
+def evaluate(signals, params, start=None, end=None):
+    """Parameters plus metrics of one combination (metrics are NaN if the window is too short)"""
+    result = simulate_rotation(signals, params, start, end)
+    if result is None:
+        metrics = dict.fromkeys(('total_return', 'annual_return', 'volatility', 'sharpe', 'max_drawdown', 'turnover'), np.nan)
+    else:
+        metrics = summarize(result)
+    return {**params, **metrics}
+
+def attach_panel(name, shape, benchmark_col, require_complete):
+    """Worker initializer: map the shared price panel and build this worker's signal cache"""
+    block = shared_memory.SharedMemory(name=name)
+    prices = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    worker_state['block'] = block
+    worker_state['signals'] = PanelSignals(prices, benchmark_col, require_complete)
+
+def evaluate_in_worker(task):
+    params, start, end = task
+    return evaluate(worker_state['signals'], params, start, end)
+
+def run_parallel(prices, tasks, benchmark_col=None, workers=None, require_complete=True):
+    """
+    Evaluate (params, start, end) tasks over one price panel.
+    With more than one worker the panel is placed in shared memory and the
+    tasks are spread over a process pool; results keep the task order.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) < 2:
+        signals = PanelSignals(prices, benchmark_col, require_complete)
+        return [evaluate(signals, *task) for task in tasks]
+
+    block = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=block.buf)[:] = prices
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_panel,
+                                 initargs=(block.name, prices.shape, benchmark_col, require_complete)) as pool:
+            return list(pool.map(evaluate_in_worker, tasks, chunksize=chunksize))
+    finally:
+        block.close()
+        block.unlink()
+
+def run_sweep(df_prices, grid, workers=None, benchmark=BENCHMARK_COIN):
+    """
+    Backtest every combination of `grid` on one aligned price panel.
+
+    Args:
+        df_prices: days x coins DataFrame from prepare_historical_dataframe
+        grid: {parameter: [values]} over lookback_days, holding_days, top_n,
+              trailing_window and entry_rule (missing ones use the backtest defaults)
+        workers: worker processes (default: one per CPU, 1 = run in this process)
+
+    Returns:
+        DataFrame with one row per combination: the parameters plus total_return,
+        annual_return, volatility, sharpe, max_drawdown and turnover
+    """
+    combinations = expand_grid(grid)
+    for params in combinations:
+        if params['entry_rule'] not in ENTRY_RULES:
+            raise ValueError(f"entry_rule must be one of {', '.join(ENTRY_RULES)}, got {params['entry_rule']!r}")
+
+    prices = np.ascontiguousarray(df_prices.to_numpy(dtype=np.float64))
+    columns = list(df_prices.columns)
+    benchmark_col = columns.index(benchmark) if benchmark in columns else None
+    rows = run_parallel(prices, [(params, None, None) for params in combinations], benchmark_col, workers)
+    return pd.DataFrame(rows)
+
+def parse_values(text, cast=int):
+    """Parse '1,2,5' or '3-14' (inclusive range) or a mix like '1-3,7'"""
+    values = []
+    for part in text.split(','):
+        part = part.strip()
+        if cast is int and '-' in part:
+            low, high = part.split('-', 1)
+            values.extend(range(int(low), int(high) + 1))
+        elif part:
+            values.append(cast(part))
+    return values
+
+def load_price_panel(days=HISTORY_DAYS):
+    """Load the coin universe and its aligned price panel once, as the backtest does"""
+    coin_universe = momentum_backtest.get_coin_universe()
+    if not coin_universe:
+        return None
+    df_prices, _ = momentum_backtest.prepare_historical_dataframe(coin_universe, days=days)
+    return df_prices
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep for the momentum backtest")
+    parser.add_argument('--lookback', default=str(LOOKBACK_DAYS), help="Lookback days, e.g. 3,7,14 or 3-14")
+    parser.add_argument('--holding', default=str(HOLDING_PERIOD_DAYS), help="Holding period days")
+    parser.add_argument('--top-n', default=str(TOP_N_COINS), help="Coins held")
+    parser.add_argument('--trailing', default="0", help="Trailing-return filter windows (0 = off)")
+    parser.add_argument('--entry', default="top", help=f"Entry rules: {', '.join(ENTRY_RULES)}")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--output', default=SWEEP_RESULTS_FILE, help="CSV file for the results table")
+    args = parser.parse_args()
+
+    grid = {
+        'lookback_days': parse_values(args.lookback),
+        'holding_days': parse_values(args.holding),
+        'top_n': parse_values(args.top_n),
+        'trailing_window': parse_values(args.trailing),
+        'entry_rule': parse_values(args.entry, cast=str)
+    }
+
+    df_prices = load_price_panel()
+    if df_prices is None or df_prices.empty:
+        print("No price data available. Exiting.")
+        return 1
+
+    n_combinations = len(expand_grid(grid))
+    print(f"Sweeping {n_combinations} combinations over {df_prices.shape[1]} coins x {df_prices.shape[0]} days...")
+    started = time.time()
+    results = run_sweep(df_prices, grid, args.workers)
+    print(f"Sweep finished in {time.time() - started:.2f}s")
+
+    results = results.sort_values('sharpe', ascending=False)
+    results.to_csv(args.output, index=False)
+    print(results.head(10).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    print(f"Results saved to '{args.output}'")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,35 @@
 """
 Utility script to prefetch historical data for top AI coins.
 This helps avoid rate limits when running the main backtest.
+
+With --daemon it keeps running and trickles refreshes through the day,
+most urgent first (staleness x likelihood of being used by the backtest),
+so the 1 AM cron run starts with a warm cache.
 """
 
 import sys
 import os
 import time
-import random
-import json
-import requests
+import heapq
+import argparse
 from datetime import datetime
 
 # Add parent directory to path so we can import from ai_highlights
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from ai_highlights import get_market_data
+import history_cache
+import momentum_backtest
+from rate_limit import COINGECKO_REQUESTS_PER_MINUTE
 
 # Constants
 CACHE_DIR = "Momentum Backtest/cache"
 HISTORY_DAYS = 90
-MAX_RETRIES = 5
-MAX_COINS = 30  # Maximum number of coins to prefetch
+BENCHMARK_COINS = ("bitcoin",)  # Benchmarks used by the backtests, always prefetched
+TOP_N_COINS = 3  # Portfolio size of the backtests
+CUTOFF_BAND = 5  # Coins within this many ranks of the top-N cutoff (by 24h change) are likely picks
+MISSING_STALENESS = 4.0  # Staleness given to coins with no usable history (in multiples of the TTL)
+DAEMON_BUDGET_SHARE = 0.25  # Share of the CoinGecko per-minute budget the daemon may use
+UNIVERSE_REFRESH_SECONDS = 3600  # How often the daemon re-reads the market data and rebuilds its queue
 
 def ensure_cache_dir():
     """Ensure cache directory exists"""
@@ -29,80 +39,108 @@ def ensure_cache_dir():
 
 def get_historical_prices_with_backoff(coin_id, days=HISTORY_DAYS, vs_currency="usd"):
     """
-    Fetch historical price data with exponential backoff for rate limits
+    Warm the shared history cache for one coin, fetching only the days it is missing.
+    Requests are paced by the shared rate controller, which handles 429s and Retry-After
+    across every job, so no extra delay is needed between coins.
     """
-    cache_file = f"{CACHE_DIR}/{coin_id}_history_{days}d.json"
-    
-    # Check if we already have cached data
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            cache_time = cache_data.get('timestamp', 0)
-            
-            # If cache is less than 24 hours old, skip
-            if time.time() - cache_time < 24 * 3600:
-                print(f"✅ {coin_id}: Cache is fresh (less than 24h old)")
-                return True
-                
-            print(f"🔄 {coin_id}: Cache is stale, refreshing...")
-        except Exception as e:
-            print(f"⚠️ {coin_id}: Error reading cache: {e}")
+    status = history_cache.history_status(coin_id, days, vs_currency)
+    if status == 'fresh':
+        print(f"✅ {coin_id}: Cache is fresh")
+        return True
+    elif status == 'stale':
+        print(f"🔄 {coin_id}: Cache is stale, fetching missing days...")
     else:
         print(f"🆕 {coin_id}: No cache found, fetching new data...")
     
-    # Fetch from API
-    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
-    params = {
-        'vs_currency': vs_currency,
-        'days': days,
-        'interval': 'daily'
-    }
+    history_cache.get_history(coin_id, days, vs_currency)
+    if history_cache.history_status(coin_id, days, vs_currency) != 'fresh':
+        print(f"❌ {coin_id}: Failed to fetch history")
+        return False
     
-    # Implement exponential backoff
-    for retry in range(MAX_RETRIES):
-        try:
-            response = requests.get(url, params=params)
-            
-            # Handle rate limiting
-            if response.status_code == 429:
-                wait_time = 30 + 2 ** retry + random.random() * 10
-                print(f"⏳ {coin_id}: Rate limited. Waiting {wait_time:.2f} seconds (retry {retry+1}/{MAX_RETRIES})...")
-                time.sleep(wait_time)
+    print(f"✅ {coin_id}: Data fetched and cached successfully")
+    return True
+
+def usage_likelihood(market_data):
+    """
+    Estimate how likely each coin is to be used by the next backtest run.
+
+    Benchmarks are certain; coins ranked by 24h change at or near the top-N
+    cutoff come next, decaying with their distance from it; the rest of the
+    coins the momentum backtest fetches (momentum_backtest.backtest_coins,
+    in market-cap order) get a lower weight by market-cap rank.
+
+    Returns:
+        Dict of {coin_id: likelihood in (0, 1]}
+    """
+    likelihood = {}
+
+    # The exact list the backtest fetches, so none of it is left cold
+    universe = momentum_backtest.backtest_coins([coin['id'] for coin in market_data])
+    for rank, coin_id in enumerate(universe):
+        likelihood[coin_id] = 0.5 * (1 - rank / len(universe))
+
+    by_change = sorted(
+        (coin for coin in market_data if coin.get('price_change_percentage_24h') is not None),
+        key=lambda x: x['price_change_percentage_24h'], reverse=True
+    )
+    for rank, coin in enumerate(by_change[:TOP_N_COINS + 2 * CUTOFF_BAND]):
+        distance = max(0, rank + 1 - TOP_N_COINS)
+        likelihood[coin['id']] = max(likelihood.get(coin['id'], 0), 1 / (1 + distance / CUTOFF_BAND))
+
+    for coin_id in BENCHMARK_COINS:
+        likelihood[coin_id] = 1.0
+    return likelihood
+
+def staleness(coin_id, days=HISTORY_DAYS):
+    """How overdue a coin's history is, in multiples of the cache TTL (0 when fresh)"""
+    if history_cache.history_status(coin_id, days) == 'fresh':
+        return 0.0
+    age = history_cache.history_age(coin_id, days)
+    if age is None:
+        return MISSING_STALENESS
+    return max(1.0, age / history_cache.HISTORY_TTL_SECONDS)
+
+def build_prefetch_queue(market_data):
+    """
+    Priority queue of coins that need a refresh, most urgent first.
+
+    Returns:
+        Heap of (-priority, coin_id) for coins whose history is not fresh
+    """
+    queue = []
+    for coin_id, likelihood in usage_likelihood(market_data).items():
+        priority = staleness(coin_id) * likelihood
+        if priority > 0:
+            queue.append((-priority, coin_id))
+    heapq.heapify(queue)
+    return queue
+
+def run_daemon():
+    """Refresh histories in priority order forever, using only part of the shared rate budget"""
+    request_interval = 60.0 / (COINGECKO_REQUESTS_PER_MINUTE * DAEMON_BUDGET_SHARE)
+    print(f"🔁 Prefetch daemon started: one refresh every {request_interval:.1f}s at most")
+
+    queue = []
+    rebuilt_at = 0
+    while True:
+        if not queue or time.time() - rebuilt_at >= UNIVERSE_REFRESH_SECONDS:
+            # Pick up history written by other jobs (e.g. the cron run) before ranking
+            history_cache.get_store().reload()
+            market_data = get_market_data()
+            queue = build_prefetch_queue(market_data) if market_data else []
+            rebuilt_at = time.time()
+            if not queue:
+                print(f"💤 All histories fresh ({datetime.now().strftime('%H:%M')}). Next check in {UNIVERSE_REFRESH_SECONDS // 60} min.")
+                time.sleep(UNIVERSE_REFRESH_SECONDS)
                 continue
-            
-            response.raise_for_status()
-            data = response.json()
-            
-            # Cache the results
-            try:
-                with open(cache_file, 'w') as f:
-                    cache_content = {
-                        'timestamp': time.time(),
-                        'data': data
-                    }
-                    json.dump(cache_content, f)
-                print(f"✅ {coin_id}: Data fetched and cached successfully")
-                return True
-            except Exception as e:
-                print(f"⚠️ {coin_id}: Error caching data: {e}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            if response.status_code == 429 and retry < MAX_RETRIES - 1:
-                continue  # Already handled above
-            elif retry < MAX_RETRIES - 1:
-                wait_time = 10 + 2 ** retry + random.random() * 5
-                print(f"⚠️ {coin_id}: Error: {e}. Retrying in {wait_time:.2f}s... ({retry+1}/{MAX_RETRIES})")
-                time.sleep(wait_time)
-            else:
-                print(f"❌ {coin_id}: Failed after {MAX_RETRIES} retries: {e}")
-                return False
-        except Exception as e:
-            print(f"❌ {coin_id}: Unexpected error: {e}")
-            return False
-    
-    return False
+            print(f"📋 {len(queue)} coin(s) queued; most urgent: {queue[0][1]} (priority {-queue[0][0]:.2f})")
+
+        _, coin_id = heapq.heappop(queue)
+        # It may have been refreshed by another job since the queue was built
+        if staleness(coin_id) == 0:
+            continue
+        get_historical_prices_with_backoff(coin_id)
+        time.sleep(request_interval)
 
 def main():
     """Main function to prefetch data"""
@@ -117,19 +155,11 @@ def main():
         print("❌ Failed to fetch AI coin market data. Exiting.")
         return
     
-    # Sort by market cap
-    market_data.sort(key=lambda x: x.get('market_cap', 0) if x.get('market_cap') else 0, reverse=True)
-    
-    # Take top N coins plus Bitcoin as benchmark
-    top_coins = ["bitcoin"]  # Always include the benchmark
-    
-    # Add top coins by market cap
-    for coin in market_data[:MAX_COINS]:
-        coin_id = coin.get('id')
-        if coin_id and coin_id not in top_coins:
-            top_coins.append(coin_id)
+    # Benchmarks, likely top-N picks and the market-cap universe, most urgent first
+    likelihood = usage_likelihood(market_data)
+    top_coins = sorted(likelihood, key=lambda coin_id: staleness(coin_id) * likelihood[coin_id], reverse=True)
     
-    print(f"🎯 Selected {len(top_coins)} coins to prefetch, starting with Bitcoin as benchmark")
+    print(f"🎯 Selected {len(top_coins)} coins to prefetch, most urgent first")
     
     # Fetch historical data for each coin
     success_count = 0
@@ -137,15 +167,16 @@ def main():
         print(f"[{i+1}/{len(top_coins)}] Fetching data for {coin_id}...")
         if get_historical_prices_with_backoff(coin_id):
             success_count += 1
-        
-        # Add a delay between requests to avoid rate limits
-        if i < len(top_coins) - 1:
-            delay = 2 + random.random() * 3
-            print(f"⏳ Waiting {delay:.2f}s before next request...")
-            time.sleep(delay)
     
     print(f"\n✅ Prefetch complete! Successfully cached data for {success_count}/{len(top_coins)} coins.")
     print(f"📊 Data ready for momentum backtest (finished at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Prefetch historical data for top AI coins")
+    parser.add_argument("--daemon", action="store_true", help="keep running and refresh caches in priority order throughout the day")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+    else:
+        main() 
\ No newline at end of file
@@ -16,9 +16,9 @@ echo "Step 1/2: Prefetching historical data for top AI coins..."
 python3 "Momentum Backtest/prefetch_data.py"
 echo
 
-# Step 2: Run the momentum backtest
+# Step 2: Advance the momentum backtest by the new day(s) (a full run the first time or when the top AI coin list changes)
 echo "Step 2/2: Running momentum backtest..."
-python3 "Momentum Backtest/run_backtest.py"
+python3 "Momentum Backtest/run_backtest.py" --incremental
 echo
 
 echo "==============================================="
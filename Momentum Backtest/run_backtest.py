@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from momentum_backtest import main
+from momentum_backtest import main, parse_args
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(incremental=parse_args().incremental)
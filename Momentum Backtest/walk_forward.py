@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Walk-forward evaluation of the momentum backtest.
+
+The stored history is split into rolling folds of `train` days followed by
+`test` days. On every train slice each parameter combination is scored, the
+best one is applied to the following test slice, and the test slices are
+chained into one out-of-sample equity curve. All (combination, fold) train
+runs go to the parallel sweep pool at once, and every worker reuses its
+return matrices across folds, so only the fold boundaries change between
+runs.
+
+Usage (from the project root):
+    python3 "Momentum Backtest/walk_forward.py" --days 730 --train 90 --test 30 --lookback 3-14 --top-n 1-5
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import param_sweep
+from momentum_backtest import LOOKBACK_DAYS, HOLDING_PERIOD_DAYS, TOP_N_COINS, BENCHMARK_COIN, INITIAL_CAPITAL
+
+# Constants
+WALK_FORWARD_DAYS = 730  # History loaded for a walk-forward run
+TRAIN_DAYS = 90
+TEST_DAYS = 30
+SELECTION_METRIC = "sharpe"
+WALK_FORWARD_RESULTS_FILE = "Momentum Backtest/walk_forward_results.csv"
+
+def make_folds(n_rows, train_days=TRAIN_DAYS, test_days=TEST_DAYS, first_row=0):
+    """
+    Rolling folds over panel rows; each test slice starts where its train
+    slice ends and folds advance by `test_days`, so test slices never overlap.
+
+    Returns:
+        List of (train_start, train_end, test_start, test_end) row bounds (ends exclusive)
+    """
+    folds = []
+    train_start = first_row
+    while train_start + train_days + test_days <= n_rows:
+        train_end = train_start + train_days
+        folds.append((train_start, train_end, train_end, train_end + test_days))
+        train_start += test_days
+    return folds
+
+def pick_best(rows, metric=SELECTION_METRIC):
+    """Row with the highest finite `metric` (first in grid order on ties), or None"""
+    best = None
+    for row in rows:
+        if np.isfinite(row[metric]) and (best is None or row[metric] > best[metric]):
+            best = row
+    return best
+
+def run_walk_forward(df_prices, grid, train_days=TRAIN_DAYS, test_days=TEST_DAYS,
+                     metric=SELECTION_METRIC, workers=None, benchmark=BENCHMARK_COIN):
+    """
+    Walk-forward evaluation of every combination of `grid` on one price panel.
+
+    Returns:
+        Tuple of (folds DataFrame with one row per fold: its dates, the chosen
+        parameters, their train score and the test metrics; out-of-sample
+        DataFrame of daily Strategy_Value/Benchmark_Value; metrics of the
+        chained out-of-sample curve), or None if the history is too short
+    """
+    combinations = param_sweep.expand_grid(grid)
+    prices = np.ascontiguousarray(df_prices.to_numpy(dtype=np.float64))
+    columns = list(df_prices.columns)
+    benchmark_col = columns.index(benchmark) if benchmark in columns else None
+    folds = make_folds(len(prices), train_days, test_days)
+    if not folds:
+        print(f"Not enough history for a {train_days}+{test_days} day fold ({len(prices)} days loaded).")
+        return None
+
+    print(f"Scoring {len(combinations)} combinations on {len(folds)} folds...")
+    tasks = [(params, train_start, train_end) for train_start, train_end, _, _ in folds for params in combinations]
+    scored = param_sweep.run_parallel(prices, tasks, benchmark_col, workers, require_complete=False)
+
+    signals = param_sweep.PanelSignals(prices, benchmark_col, require_complete=False)
+    dates = df_prices.index
+    fold_rows = []
+    oos_returns, oos_benchmark, oos_weights, oos_dates = [], [], [], []
+    for i, (train_start, train_end, test_start, test_end) in enumerate(folds):
+        best = pick_best(scored[i * len(combinations):(i + 1) * len(combinations)], metric)
+        if best is None:
+            continue
+        params = {name: best[name] for name in combinations[0]}
+        result = param_sweep.simulate_rotation(signals, params, test_start, test_end)
+        if result is None:
+            continue
+
+        fold_rows.append({
+            'fold': i + 1,
+            'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+            'test_start': dates[result['rows'][0]], 'test_end': dates[test_end - 1],
+            **params,
+            f'train_{metric}': best[metric],
+            **{f'test_{name}': value for name, value in param_sweep.summarize(result).items()}
+        })
+
+        # Daily returns of the fold, the first day measured from the capital it started with
+        oos_returns.append(result['values'] / np.concatenate([[INITIAL_CAPITAL], result['values'][:-1]]) - 1)
+        oos_benchmark.append(result['benchmark_values'] / np.concatenate([[INITIAL_CAPITAL], result['benchmark_values'][:-1]]) - 1)
+        oos_weights.append(result['weights'])
+        oos_dates.append(dates[result['rows']])
+
+    if not fold_rows:
+        print("No fold produced a usable parameter choice.")
+        return None
+
+    values = INITIAL_CAPITAL * np.cumprod(1 + np.concatenate(oos_returns))
+    out_of_sample = pd.DataFrame({
+        'Strategy_Value': values,
+        'Benchmark_Value': INITIAL_CAPITAL * np.cumprod(1 + np.concatenate(oos_benchmark))
+    }, index=np.concatenate(oos_dates))
+    metrics = param_sweep.summarize({'values': values, 'weights': np.vstack(oos_weights)})
+    return pd.DataFrame(fold_rows), out_of_sample, metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward evaluation of the momentum backtest")
+    parser.add_argument('--days', type=int, default=WALK_FORWARD_DAYS, help="Days of history to load")
+    parser.add_argument('--train', type=int, default=TRAIN_DAYS, help="Train slice length in days")
+    parser.add_argument('--test', type=int, default=TEST_DAYS, help="Test slice length in days")
+    parser.add_argument('--metric', default=SELECTION_METRIC,
+                        choices=("sharpe", "total_return", "annual_return"), help="Train score used to pick parameters")
+    parser.add_argument('--lookback', default=str(LOOKBACK_DAYS), help="Lookback days, e.g. 3,7,14 or 3-14")
+    parser.add_argument('--holding', default=str(HOLDING_PERIOD_DAYS), help="Holding period days")
+    parser.add_argument('--top-n', default=str(TOP_N_COINS), help="Coins held")
+    parser.add_argument('--trailing', default="0", help="Trailing-return filter windows (0 = off)")
+    parser.add_argument('--entry', default="top", help=f"Entry rules: {', '.join(param_sweep.ENTRY_RULES)}")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--output', default=WALK_FORWARD_RESULTS_FILE, help="CSV file for the per-fold table")
+    args = parser.parse_args()
+
+    grid = {
+        'lookback_days': param_sweep.parse_values(args.lookback),
+        'holding_days': param_sweep.parse_values(args.holding),
+        'top_n': param_sweep.parse_values(args.top_n),
+        'trailing_window': param_sweep.parse_values(args.trailing),
+        'entry_rule': param_sweep.parse_values(args.entry, cast=str)
+    }
+
+    df_prices = param_sweep.load_price_panel(args.days)
+    if df_prices is None or df_prices.empty:
+        print("No price data available. Exiting.")
+        return 1
+
+    started = time.time()
+    result = run_walk_forward(df_prices, grid, args.train, args.test, args.metric, args.workers)
+    if result is None:
+        return 1
+    folds, out_of_sample, metrics = result
+    print(f"Walk-forward finished in {time.time() - started:.2f}s")
+
+    folds.to_csv(args.output, index=False)
+    print(folds.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    print("\nOut-of-sample (chained test slices):")
+    print(f"Period: {out_of_sample.index[0].strftime('%Y-%m-%d')} to {out_of_sample.index[-1].strftime('%Y-%m-%d')}")
+    print(f"Total Return: {metrics['total_return']:.2%} vs. Benchmark: "
+          f"{out_of_sample['Benchmark_Value'].iloc[-1] / out_of_sample['Benchmark_Value'].iloc[0] - 1:.2%}")
+    print(f"Sharpe Ratio: {metrics['sharpe']:.2f}")
+    print(f"Maximum Drawdown: {metrics['max_drawdown']:.2%}")
+    print(f"Results saved to '{args.output}'")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,34 @@ import requests
 import json
 import time
 import os
+import queue
+import threading
 from datetime import datetime, timedelta
 from statistics import median
 
+import memo
+import atomic_io
+import market_records
+import transport
+import history_fetcher
+from source_stats import SourceStats
+from rate_limit import DISCORD_LIMITER
+
 # --- Constants ---
 COINGECKO_API_URL = "https://api.coingecko.com/api/v3/coins/markets"
 CRYPTORANK_API_URL = "https://api.cryptorank.io/v1/coins"
 CACHE_FILE = "coingecko_cache.json"
-CACHE_TTL_SECONDS = 23 * 3600 + 55 * 60 # 23 hours 55 minutes
+CACHE_TTL_SECONDS = 23 * 3600 + 55 * 60 # 23 hours 55 minutes (hard TTL: older snapshots trigger a blocking fetch)
+CACHE_SOFT_TTL_SECONDS = 3600 # Snapshots older than this are served immediately and refreshed in the background
+MARKET_DATA_MEMO_TTL_SECONDS = 300 # How long a loaded snapshot is reused within one process
+MARKET_CATEGORIES = ('artificial-intelligence',) # CoinGecko categories merged into the coin universe, e.g. add 'ai-agents'
+MARKET_PAGE_SIZE = 250 # CoinGecko's maximum per_page
+MARKET_PAGES_PER_CATEGORY = 2 # Pages requested at once per category; more are fetched only if the last one is full
+REQUEST_TIMEOUT_SECONDS = 20 # Per-request timeout for CryptoRank and Discord
+MARKET_FETCH_DEADLINE_SECONDS = 90 # Overall deadline for a live market data fetch across all sources
+HEDGE_DELAY_SECONDS = 8 # Delay before CryptoRank is raced against CoinGecko, until enough latency samples exist
+HEDGE_LATENCY_PERCENTILE = 95 # Recent CoinGecko latency percentile used as the hedge delay
+SOURCE_STATS_FILE = "cache/source_stats.json"
 TOP_N_COINS = 5
 DISCORD_WEBHOOK_URL = "https://discord.com/api/webhooks/1362469269769814238/-EyJ_fSmcjSYvIFgV7V0Nc5YeTSQ0QNVg8paMNpjUzTmEpMwCOEFowPbkAkEZvfVKOtT"
 
@@ -27,38 +47,73 @@ NON_AI_COINS_BLACKLIST = [
     # Add more as needed
 ]
 
-def get_market_data_from_api():
-    """Fetches AI coin market data from CoinGecko API."""
-    print("Fetching fresh market data from CoinGecko API (with AI category filter)...")
-    params = {
-        'vs_currency': 'usd',
-        'category': 'artificial-intelligence',
-        'order': 'market_cap_desc',
-        'per_page': 250,
-        'page': 1,
-        'sparkline': 'false',
-        'price_change_percentage': '24h'
-    }
-    try:
-        response = requests.get(COINGECKO_API_URL, params=params)
-        response.raise_for_status()
-        print("Successfully fetched market data.")
-        
-        # Filter out non-AI coins from the response
-        data = response.json()
-        filtered_data = [coin for coin in data if coin.get('id') not in NON_AI_COINS_BLACKLIST]
-        
-        if len(data) != len(filtered_data):
-            print(f"Filtered out {len(data) - len(filtered_data)} non-AI coins that were incorrectly categorized.")
-        
-        return filtered_data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching market data from CoinGecko: {e}")
-        print("Attempting fallback to CryptoRank...")
-        return get_cryptorank_fallback()
-    except json.JSONDecodeError:
-        print("Error decoding JSON response from CoinGecko.")
-        return get_cryptorank_fallback()
+def fetch_market_pages(categories, first_page, pages):
+    """
+    Fetches `pages` pages of each category, starting at `first_page`, concurrently
+    under the shared CoinGecko rate limit.
+
+    Returns:
+        Dict of {(category, page): list of coin dicts or None}
+    """
+    def fetch_page(key):
+        category, page = key
+        params = {
+            'vs_currency': 'usd',
+            'category': category,
+            'order': 'market_cap_desc',
+            'per_page': MARKET_PAGE_SIZE,
+            'page': page,
+            'sparkline': 'false',
+            'price_change_percentage': '24h'
+        }
+        return history_fetcher.get_json(COINGECKO_API_URL, params, f"{category} page {page}")
+
+    keys = [(category, page) for category in categories for page in range(first_page, first_page + pages)]
+    return history_fetcher.fetch_all(keys, fetch_page)
+
+def fetch_coingecko_market_data(categories=MARKET_CATEGORIES, pages=MARKET_PAGES_PER_CATEGORY):
+    """
+    Fetches AI coin market data from CoinGecko API. Returns None if a first page failed.
+
+    The first `pages` pages of every category are requested at once, so a wide
+    universe costs about one round-trip. If a category's last page comes back
+    full, the next batch of pages is requested the same way. Coins listed in
+    several categories or pages are kept once, ordered by market cap.
+    """
+    print(f"Fetching fresh market data from CoinGecko API (categories: {', '.join(categories)})...")
+    coins_by_id = {}
+    first_page = 1
+    pending = list(categories)
+    while pending:
+        results = fetch_market_pages(pending, first_page, pages)
+        if first_page == 1 and any(results[(category, 1)] is None for category in pending):
+            print("Error fetching market data from CoinGecko.")
+            return None
+
+        next_pending = []
+        for (category, page), data in results.items():
+            if data is None:
+                print(f"Warning: {category} page {page} failed; universe may be incomplete.")
+                continue
+            for coin in data:
+                coins_by_id.setdefault(coin.get('id'), coin)
+            if page == first_page + pages - 1 and len(data) == MARKET_PAGE_SIZE:
+                next_pending.append(category)
+
+        pending = next_pending
+        first_page += pages
+    print("Successfully fetched market data.")
+
+    # Restore market-cap order across merged categories
+    data = sorted(coins_by_id.values(), key=lambda coin: coin.get('market_cap') or 0, reverse=True)
+
+    # Filter out non-AI coins from the response
+    filtered_data = [coin for coin in data if coin.get('id') not in NON_AI_COINS_BLACKLIST]
+    
+    if len(data) != len(filtered_data):
+        print(f"Filtered out {len(data) - len(filtered_data)} non-AI coins that were incorrectly categorized.")
+    
+    return filtered_data
 
 def get_cryptorank_fallback():
     """Fallback to CryptoRank API if CoinGecko fails."""
@@ -69,7 +124,7 @@ def get_cryptorank_fallback():
         'sort': 'rank'
     }
     try:
-        response = requests.get(CRYPTORANK_API_URL, params=params)
+        response = transport.get(CRYPTORANK_API_URL, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         
@@ -100,57 +155,215 @@ def get_cryptorank_fallback():
         print(f"Error with CryptoRank fallback: {e}")
         return None
 
+# Latency and win/loss stats per market data source, shared across runs
+source_stats = SourceStats(SOURCE_STATS_FILE)
+
+MARKET_SOURCES = {
+    'coingecko': fetch_coingecko_market_data,
+    'cryptorank': get_cryptorank_fallback
+}
+
+def get_market_data_from_api():
+    """
+    Fetches AI coin market data with a hedged request across CoinGecko and CryptoRank.
+
+    CoinGecko is asked first. If it has not answered within the hedge delay
+    (recent p95 latency) or it fails, CryptoRank is raced against it and the
+    first valid response wins. Nothing is waited on past MARKET_FETCH_DEADLINE_SECONDS.
+
+    Returns:
+        List of coin dicts in CoinGecko format, or None if no source answered in time
+    """
+    results = queue.Queue()
+    started_at = time.monotonic()
+    deadline = started_at + MARKET_FETCH_DEADLINE_SECONDS
+    hedge_at = started_at + source_stats.latency_percentile('coingecko', HEDGE_LATENCY_PERCENTILE, HEDGE_DELAY_SECONDS)
+    launched = []
+
+    def run(source):
+        source_started = time.monotonic()
+        try:
+            data = MARKET_SOURCES[source]()
+        except Exception as e:
+            print(f"Unexpected error fetching market data from {source}: {e}")
+            data = None
+        latency = time.monotonic() - source_started
+        source_stats.record_latency(source, latency, ok=bool(data))
+        results.put((source, data, latency))
+
+    def launch(source):
+        launched.append(source)
+        # Daemon threads: a loser still in flight must not hold the process open
+        threading.Thread(target=run, args=(source,), name=f"market-data-{source}", daemon=True).start()
+
+    launch('coingecko')
+    winner, winning_data, finished = None, None, []
+    while len(finished) < len(launched):
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        wait_until = deadline if 'cryptorank' in launched else min(hedge_at, deadline)
+        try:
+            source, data, latency = results.get(timeout=max(0, wait_until - now))
+        except queue.Empty:
+            if 'cryptorank' not in launched and time.monotonic() < deadline:
+                print(f"CoinGecko has not answered after {time.monotonic() - started_at:.1f}s. Hedging with CryptoRank...")
+                launch('cryptorank')
+            continue
+
+        finished.append(source)
+        if data:
+            winner, winning_data = source, data
+            print(f"Using market data from {source} ({latency:.1f}s).")
+            break
+        if 'cryptorank' not in launched:
+            print("Attempting fallback to CryptoRank...")
+            launch('cryptorank')
+
+    for source in launched:
+        if source == winner:
+            source_stats.record_outcome(source, 'wins')
+        elif winner is None and source not in finished:
+            source_stats.record_outcome(source, 'timeouts')
+        else:
+            source_stats.record_outcome(source, 'losses')
+
+    if winner is None:
+        print(f"No market data source returned valid data within {MARKET_FETCH_DEADLINE_SECONDS}s.")
+    return winning_data
+
+class MarketSnapshot(list):
+    """
+    List of CoinRecords that also carries the age of the data in seconds (0 for a live fetch).
+    `table` is a struct-of-arrays view (market_records.MarketTable) for bulk sorting and ranking.
+    """
+
+    def __init__(self, coins, age_seconds=0.0):
+        super().__init__(market_records.to_records(coins))
+        self.age_seconds = age_seconds
+        self._table = None
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = market_records.MarketTable(self)
+        return self._table
+
 def load_from_cache():
-    """Loads data from cache file if it exists and is valid."""
+    """
+    Loads data from the cache file if it exists, regardless of age.
+
+    Returns:
+        Tuple of (blacklist-filtered CoinRecords, age in seconds), or (None, None)
+    """
     if os.path.exists(CACHE_FILE):
         try:
-            with open(CACHE_FILE, 'r') as f:
-                cache_data = json.load(f)
-            timestamp = cache_data.get('timestamp', 0)
-            if time.time() - timestamp < CACHE_TTL_SECONDS:
-                print("Loading market data from cache...")
-                cached_data = cache_data.get('data')
-                
-                # Apply blacklist to cached data as well
-                filtered_cached_data = [coin for coin in cached_data if coin.get('id') not in NON_AI_COINS_BLACKLIST]
-                if len(cached_data) != len(filtered_cached_data):
-                    print(f"Filtered out {len(cached_data) - len(filtered_cached_data)} non-AI coins from cache.")
-                
-                return filtered_cached_data
-            else:
-                print("Cache expired.")
-        except (json.JSONDecodeError, IOError) as e:
+            with open(CACHE_FILE, 'rb') as f:
+                timestamp, cached_data = market_records.decode_snapshot(f.read())
+            age = time.time() - timestamp
+            
+            # Apply blacklist to cached data as well
+            filtered_cached_data = [coin for coin in cached_data if coin.get('id') not in NON_AI_COINS_BLACKLIST]
+            if len(cached_data) != len(filtered_cached_data):
+                print(f"Filtered out {len(cached_data) - len(filtered_cached_data)} non-AI coins from cache.")
+            
+            return filtered_cached_data, age
+        except (ValueError, AttributeError, IOError) as e:
             print(f"Error reading cache file: {e}. Fetching new data.")
     else:
         print("Cache file not found.")
-    return None
+    return None, None
 
 def save_to_cache(data):
-    """Saves data to the cache file with a timestamp."""
+    """Saves data to the cache file with a timestamp (atomically, so readers never see a partial file)."""
     try:
-        with open(CACHE_FILE, 'w') as f:
-            cache_content = {
-                'timestamp': time.time(),
-                'data': data
-            }
-            json.dump(cache_content, f)
+        cache_content = {
+            'timestamp': time.time(),
+            'data': data
+        }
+        atomic_io.atomic_write_json(CACHE_FILE, cache_content)
         print("Market data saved to cache.")
     except IOError as e:
         print(f"Error writing to cache file: {e}")
 
-def get_market_data():
+# Background refresh started when a snapshot is past its soft TTL
+refresh_thread = None
+refresh_lock = threading.Lock()
+
+def refresh_market_data():
     """
-    Fetches AI market data, using cache if available and valid.
+    Fetches live market data and stores it in the cache. Returns the data, or None if every source failed.
+    Single-flight across jobs: if another job is already refreshing, this waits and uses its result.
     """
-    cached_data = load_from_cache()
+    def load_refreshed():
+        # Another job may have refreshed the cache while we waited for the lock
+        cached_data, age = load_from_cache()
+        return cached_data if cached_data and age < CACHE_SOFT_TTL_SECONDS else None
+
+    def fetch():
+        api_data = get_market_data_from_api()
+        if api_data:
+            save_to_cache(api_data)
+        return api_data
+
+    data = atomic_io.single_flight(atomic_io.key_lock('market-data', CACHE_FILE), load_refreshed, fetch)
+    if data:
+        # Later calls in this process should see the refreshed snapshot
+        load_market_snapshot.invalidate_all()
+    return data
+
+def refresh_in_background():
+    """Starts a background cache refresh unless one is already running"""
+    global refresh_thread
+    with refresh_lock:
+        if refresh_thread is not None and refresh_thread.is_alive():
+            return
+        # Not a daemon thread, so a short-lived script still waits for the refreshed cache to be written
+        refresh_thread = threading.Thread(target=refresh_market_data, name="market-data-refresh")
+        refresh_thread.start()
+
+@memo.memoized(MARKET_DATA_MEMO_TTL_SECONDS)
+def load_market_snapshot():
+    """
+    Loads AI market data using a stale-while-revalidate cache policy.
+
+    - Younger than CACHE_SOFT_TTL_SECONDS: served from cache.
+    - Up to CACHE_TTL_SECONDS: served from cache immediately while a background refresh runs.
+    - Older, or missing: fetched live; if every source fails, the last good
+      snapshot is served instead with its age attached (`age_seconds`).
+    """
+    cached_data, age = load_from_cache()
+    if cached_data and age < CACHE_TTL_SECONDS:
+        if age < CACHE_SOFT_TTL_SECONDS:
+            print("Loading market data from cache...")
+        else:
+            print(f"Cached market data is {age / 3600:.1f}h old. Serving it and refreshing in the background...")
+            refresh_in_background()
+        return MarketSnapshot(cached_data, age)
+    
     if cached_data:
-        return cached_data
+        print("Cache expired.")
 
-    api_data = get_market_data_from_api()
+    api_data = refresh_market_data()
     if api_data:
-        save_to_cache(api_data)
+        return MarketSnapshot(api_data)
+    
+    if cached_data:
+        print(f"All market data sources failed. Serving last good snapshot ({age / 3600:.1f}h old).")
+        return MarketSnapshot(cached_data, age)
     return api_data
 
+def get_market_data():
+    """
+    Fetches AI market data, using cache if available and valid.
+    The snapshot is read and filtered at most once per process (see load_market_snapshot);
+    each caller gets its own list so in-place sorting doesn't leak between callers.
+    """
+    snapshot = load_market_snapshot()
+    if not snapshot:
+        return snapshot
+    return MarketSnapshot(snapshot, snapshot.age_seconds)
+
 def generate_summary(ai_market_data):
     """
     Generates a summary string for AI coins, finding the top N movers.
@@ -182,6 +395,11 @@ def generate_summary(ai_market_data):
     top_ai_coins = valid_ai_coins[:TOP_N_COINS]
 
     summary_lines = [f"📈 Daily AI Altcoin Highlights ({datetime.now().strftime('%Y-%m-%d')}) 📉\n"]
+    
+    # Flag snapshots served past their TTL because live sources were unavailable
+    data_age = getattr(ai_market_data, 'age_seconds', 0)
+    if data_age >= CACHE_TTL_SECONDS:
+        summary_lines.append(f"⚠️ Live market data unavailable; showing a cached snapshot from {data_age / 3600:.1f}h ago.\n")
     summary_lines.append(f"🚀 Top {len(top_ai_coins)} AI Movers (by 24h % Change):")
 
     changes_24h = [c['price_change_percentage_24h'] for c in valid_ai_coins]
@@ -229,10 +447,14 @@ def send_to_discord(summary):
     }
     
     try:
-        response = requests.post(
+        # Share the webhook budget with every other job posting to Discord
+        DISCORD_LIMITER.acquire()
+        response = transport.post(
             DISCORD_WEBHOOK_URL,
-            json=payload
+            json=payload,
+            timeout=REQUEST_TIMEOUT_SECONDS
         )
+        DISCORD_LIMITER.record_response(response.status_code, response.headers.get('Retry-After'))
         response.raise_for_status()
         print("Successfully sent summary to Discord!")
         return True
@@ -0,0 +1,131 @@
+"""
+Crash- and concurrency-safe file helpers for every cache writer.
+Files are written to a temp file in the same directory, fsynced and renamed
+over the target, so readers see either the old or the new contents and never
+a truncated file. FileLock wraps advisory `flock` locks for coordinating
+jobs, and single_flight uses them so only one job fetches a given key.
+"""
+
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads within one process
+    fcntl = None
+
+# Constants
+LOCK_DIR = "cache/locks"
+
+def default_mode():
+    """
+    Permissions open() gives a new file (0666 minus the umask). mkstemp's 0600
+    would lock cache files written by one job out of jobs running as other users.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+@contextmanager
+def atomic_open(path, mode='w'):
+    """
+    Open a temp file next to `path` for writing; on a clean exit it is
+    fsynced and renamed over `path`, on an exception it is discarded.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, default_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Persist the rename itself
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Write `data` as JSON to `path` atomically"""
+    with atomic_open(path, 'w') as f:
+        json.dump(data, f, **dump_kwargs)
+
+class FileLock:
+    """
+    Advisory lock on `path` (created if needed), usable as a context manager.
+    Each FileLock opens its own file handle, so it also excludes other
+    threads of the same process.
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.handle = None
+        self.thread_lock = threading.Lock() if fcntl is None else None
+
+    def acquire(self, blocking=True):
+        """Take the lock. Returns False instead of waiting when `blocking` is False and it is held elsewhere."""
+        if fcntl is None:
+            return self.thread_lock.acquire(blocking)
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.handle = open(self.path, 'a')
+        flags = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.handle, flags)
+            return True
+        except BlockingIOError:
+            self.handle.close()
+            self.handle = None
+            return False
+
+    def release(self):
+        if fcntl is None:
+            self.thread_lock.release()
+            return
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def key_lock(namespace, key, lock_dir=LOCK_DIR):
+    """FileLock for one cache key, e.g. key_lock('history-usd', 'bittensor')"""
+    safe_key = "".join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in str(key))
+    return FileLock(os.path.join(lock_dir, namespace, f"{safe_key}.lock"))
+
+def single_flight(lock, load_cached, compute):
+    """
+    Run `compute()` unless another job already produced the result.
+
+    Takes `lock` (waiting if another job holds it), then calls `load_cached()`;
+    if that returns something, the other job's result is used. Otherwise
+    `compute()` runs while the lock is held, so concurrent callers for the same
+    key wait for it instead of repeating the work.
+    """
+    with lock:
+        cached = load_cached()
+        if cached is not None:
+            return cached
+        return compute()
@@ -0,0 +1,93 @@
+"""
+Manifest index for the history cache.
+Maps each coin id to where its history is stored, the date range it covers,
+when it was fetched, its row count and a checksum. It is rewritten
+atomically on every cache write, so lookups never need to scan the cache
+directory, and a precomputed normalized-id map serves fuzzy matches.
+"""
+
+import os
+import json
+
+import atomic_io
+
+# Constants
+MANIFEST_FILE_NAME = "manifest.json"
+
+def normalize_coin_id(coin_id):
+    """Normalize a coin id for fuzzy matching (case and separators ignored)"""
+    return coin_id.lower().replace('-', '').replace('_', '')
+
+class CacheManifest:
+    """In-memory view of the manifest file with O(1) exact and normalized lookups"""
+
+    def __init__(self, path):
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        """Reload the manifest from disk and rebuild the normalized-id map"""
+        self.coins = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.coins = json.load(f).get('coins', {})
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Error reading cache manifest: {e}")
+        self.normalized = {normalize_coin_id(coin_id): coin_id for coin_id in self.coins}
+
+    def __contains__(self, coin_id):
+        return coin_id in self.coins
+
+    def __len__(self):
+        return len(self.coins)
+
+    def coin_ids(self):
+        return list(self.coins)
+
+    def lookup(self, coin_id, vs_currency="usd"):
+        """Manifest entry for an exact coin id, or None"""
+        return self.coins.get(coin_id, {}).get(vs_currency)
+
+    def resolve(self, coin_id, vs_currency="usd"):
+        """
+        Resolve a possibly mismatched coin id to a cached one.
+
+        Tries the exact id, then the normalized-id map, then a substring match
+        against the precomputed normalized ids.
+
+        Returns:
+            The cached coin id, or None if nothing matches
+        """
+        if self.lookup(coin_id, vs_currency):
+            return coin_id
+
+        normalized_id = normalize_coin_id(coin_id)
+        match = self.normalized.get(normalized_id)
+        if match and self.lookup(match, vs_currency):
+            return match
+
+        candidates = [
+            cached_id for normalized, cached_id in self.normalized.items()
+            if (normalized_id in normalized or normalized in normalized_id) and self.lookup(cached_id, vs_currency)
+        ]
+        if candidates:
+            # Prefer the longest history, as the old file-name matching did
+            return max(candidates, key=lambda cached_id: self.coins[cached_id][vs_currency]['rows'])
+        return None
+
+    def replace_currency(self, vs_currency, entries):
+        """Replace all entries of one quote currency with `entries` ({coin_id: entry}) and write atomically"""
+        with atomic_io.FileLock(f"{self.path}.lock"):
+            # Start from the latest file so entries written by other currencies are kept
+            self.reload()
+            for coin_id in list(self.coins):
+                self.coins[coin_id].pop(vs_currency, None)
+                if not self.coins[coin_id]:
+                    del self.coins[coin_id]
+            for coin_id, entry in entries.items():
+                self.coins.setdefault(coin_id, {})[vs_currency] = entry
+
+            atomic_io.atomic_write_json(self.path, {'coins': self.coins})
+
+        self.normalized = {normalize_coin_id(coin_id): coin_id for coin_id in self.coins}
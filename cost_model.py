@@ -0,0 +1,188 @@
+"""
+Transaction cost and slippage model for strategy engine runs.
+Trades are the row-to-row changes of a run's dollar positions. Every trade
+pays a flat fee plus a market-impact estimate that grows with the square
+root of its participation (trade size / the coin's 24h volume). All trades
+of a run are priced at once from the volume panel, and so is a whole grid
+of capital levels, which makes capacity analysis a single array pass
+instead of one rerun per capital level.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Constants
+FEE_RATE = 0.001  # Exchange fee per trade (0.1% of the amount traded)
+IMPACT_COEFFICIENT = 0.1  # Square-root law: impact = coefficient * sqrt(trade / 24h volume)
+MAX_IMPACT_RATE = 0.10  # Impact cap, also charged when a coin's volume is unknown
+MAX_PARTICIPATION = 0.05  # Trades above 5% of a coin's daily volume exceed the strategy's capacity
+CAPACITY_PERCENTILE = 95  # Participation percentile the capacity estimate is based on
+CAPITAL_LEVELS = (1e4, 1e5, 1e6, 1e7, 1e8)
+TRADING_DAYS_PER_YEAR = 252
+
+def trade_matrix(result):
+    """
+    Dollars traded per row and coin: changes of the run's positions
+    (weights x base), including the initial build.
+
+    Returns:
+        rows x coins matrix
+    """
+    positions = result['weights'] * result['base'][:, None]
+    previous = np.vstack([np.zeros((1, positions.shape[1])), positions[:-1]])
+    return np.abs(positions - previous)
+
+def trade_volumes(panel, rows):
+    """
+    24h volume behind each traded row: the day before it, the last full day
+    known when the trade is placed (NaN where the panel has no volumes)
+    """
+    if panel.volumes is None:
+        return np.full((len(rows), panel.prices.shape[1]), np.nan)
+    return panel.volumes[np.maximum(np.asarray(rows) - 1, 0)]
+
+def impact_rates(participation, impact_coefficient=IMPACT_COEFFICIENT, max_rate=MAX_IMPACT_RATE):
+    """Impact cost per dollar traded (capped; unknown or zero volume pays the cap)"""
+    with np.errstate(invalid='ignore'):
+        rates = impact_coefficient * np.sqrt(participation)
+    return np.where(np.isfinite(rates), np.minimum(rates, max_rate), max_rate)
+
+def simulate_costs(result, volumes, capitals, fee_rate=FEE_RATE, impact_coefficient=IMPACT_COEFFICIENT):
+    """
+    Net-of-cost value paths of one run for several starting capitals at once.
+    Trades scale with capital (they are sized on the run's gross value path),
+    so only the impact term changes between capital levels. Costs are
+    charged as a rate of the value before each row, so the net portfolio
+    holds and trades the same weights as the gross one.
+
+    Args:
+        result: strategy_engine.run result
+        volumes: rows x coins 24h volumes for the run's rows (see trade_volumes)
+        capitals: starting capitals
+
+    Returns:
+        Dict with 'capitals', per capital x row 'net_values', 'fees' and
+        'impact' (dollars) and 'cost_rates' (fraction of value), per trade (capital x trade) 'participation', and the
+        per-row 'gross_returns' and 'turnover' (one-way, fraction of value)
+    """
+    capitals = np.asarray(capitals, dtype=np.float64)
+    values = result['values']
+    value_before = np.concatenate([[result['initial_value']], values[:-1]])
+    gross_returns = values / value_before - 1
+
+    # Only the non-zero trades are priced: (capital, trade) arrays instead of (capital, row, coin)
+    traded = trade_matrix(result)
+    day, coin = np.nonzero(traded > 0)
+    unit_amount = traded[day, coin] / result['initial_value']
+    amount = capitals[:, None] * unit_amount[None, :]
+    trade_volume = volumes[day, coin]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        participation = np.where(trade_volume > 0, amount / trade_volume, np.nan)
+    impact_cost = amount * impact_rates(participation, impact_coefficient)
+
+    n_days = len(values)
+    fees = np.zeros((len(capitals), n_days))
+    impact = np.zeros((len(capitals), n_days))
+    np.add.at(fees, (slice(None), day), amount * fee_rate)
+    np.add.at(impact, (slice(None), day), impact_cost)
+
+    scaled_value_before = capitals[:, None] * (value_before / result['initial_value'])[None, :]
+    cost_rate = (fees + impact) / scaled_value_before
+    net_values = capitals[:, None] * np.cumprod((1 + gross_returns)[None, :] * (1 - cost_rate), axis=1)
+    # Costs were priced on the gross path; the net portfolio trades proportionally less
+    scale = np.hstack([capitals[:, None], net_values[:, :-1]]) / scaled_value_before
+    fees *= scale
+    impact *= scale
+    return {
+        'capitals': capitals,
+        'net_values': net_values,
+        'fees': fees,
+        'impact': impact,
+        'cost_rates': cost_rate,
+        'participation': participation,
+        'gross_returns': gross_returns,
+        'turnover': traded.sum(axis=1) / (2 * value_before)
+    }
+
+def annualize(total_return, n_days):
+    """Annualized return of a total return over `n_days` trading days"""
+    return (1 + total_return) ** (TRADING_DAYS_PER_YEAR / n_days) - 1
+
+def capacity_estimate(participation, capital, max_participation=MAX_PARTICIPATION, percentile=CAPACITY_PERCENTILE):
+    """
+    Largest starting capital whose `percentile` trade stays within
+    `max_participation` of the coin's 24h volume. Participation grows linearly
+    with capital, so this scales the observed participation instead of rerunning.
+    """
+    known = participation[np.isfinite(participation)]
+    if not len(known) or np.percentile(known, percentile) <= 0:
+        return float('inf')
+    return float(capital * max_participation / np.percentile(known, percentile))
+
+def cost_metrics(result, volumes, capital=None, capitals=CAPITAL_LEVELS,
+                 fee_rate=FEE_RATE, impact_coefficient=IMPACT_COEFFICIENT):
+    """
+    Transaction cost report of one rotation-valued engine run (averaged
+    portfolios have no dollar positions to trade).
+
+    Args:
+        capital: starting capital the headline figures are scaled to (default: the run's own)
+        capitals: capital levels of the capacity curve
+
+    Returns:
+        Dict with 'capital', 'fee_rate', 'turnover' (average daily one-way turnover, initial
+        build excluded), 'fees' and 'impact' (total dollars), 'cost_drag'
+        (costs per year as a fraction of portfolio value), 'gross_total_return',
+        'net_total_return', 'net_annual_return', 'capacity' (see capacity_estimate)
+        and 'capacity_curve' (DataFrame indexed by capital: net_total_return,
+        net_annual_return, cost_drag, mean_participation, max_participation;
+        trades without volume data are left out of the participation figures)
+    """
+    capital = float(result['initial_value'] if capital is None else capital)
+    levels = np.concatenate([[capital], np.asarray(capitals, dtype=np.float64)])
+    costs = simulate_costs(result, volumes, levels, fee_rate, impact_coefficient)
+
+    n_days = len(result['values'])
+    gross_total = result['values'][-1] / result['initial_value'] - 1
+    net_total = costs['net_values'][:, -1] / levels - 1
+    net_annual = annualize(net_total, n_days)
+    cost_drag = costs['cost_rates'].sum(axis=1) * TRADING_DAYS_PER_YEAR / n_days
+    participation = costs['participation']
+    known = np.isfinite(participation)
+    n_known = known.sum(axis=1)
+    mean_participation = np.where(known, participation, 0).sum(axis=1) / np.maximum(n_known, 1)
+    max_participation = np.max(np.where(known, participation, 0), axis=1, initial=0)
+
+    return {
+        'capital': capital,
+        'fee_rate': fee_rate,
+        'turnover': float(costs['turnover'][1:].mean()) if n_days > 1 else 0.0,
+        'fees': float(costs['fees'][0].sum()),
+        'impact': float(costs['impact'][0].sum()),
+        'cost_drag': float(cost_drag[0]),
+        'gross_total_return': float(gross_total),
+        'net_total_return': float(net_total[0]),
+        'net_annual_return': float(net_annual[0]),
+        'capacity': capacity_estimate(participation[0], capital),
+        'capacity_curve': pd.DataFrame({
+            'net_total_return': net_total[1:],
+            'net_annual_return': net_annual[1:],
+            'cost_drag': cost_drag[1:],
+            'mean_participation': mean_participation[1:],
+            'max_participation': max_participation[1:]
+        }, index=pd.Index(levels[1:], name='capital'))
+    }
+
+def print_summary(costs):
+    """Print turnover, cost drag and the capacity curve of a cost report"""
+    print(f"Costs (fee {costs['fee_rate']:.2%} per trade + square-root market impact, ${costs['capital']:,.0f} capital):")
+    print(f"  Average Daily Turnover: {costs['turnover']:.2%}")
+    print(f"  Fees: ${costs['fees']:,.2f}, Market Impact: ${costs['impact']:,.2f}")
+    print(f"  Cost Drag: {costs['cost_drag']:.2%} of portfolio value per year")
+    print(f"  Net Total Return: {costs['net_total_return']:.2%} (gross {costs['gross_total_return']:.2%})")
+    capacity = costs['capacity']
+    capacity_text = f"${capacity:,.0f}" if np.isfinite(capacity) else "unlimited"
+    print(f"  Capacity: {capacity_text} (P{CAPACITY_PERCENTILE} trade at {MAX_PARTICIPATION:.0%} of 24h volume)")
+    for capital, row in costs['capacity_curve'].iterrows():
+        print(f"    ${capital:>14,.0f}: net {row['net_total_return']:>9.2%}, drag {row['cost_drag']:>8.2%}/yr, "
+              f"max participation {row['max_participation']:.2%}")
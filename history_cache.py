@@ -0,0 +1,321 @@
+"""
+Single history cache for CoinGecko price series, keyed by coin and quote currency.
+Each coin's longest fetched history is kept in the columnar price store on a
+daily UTC grid; any `days` window is answered by slicing it, and stale
+series are refreshed incrementally by requesting only the missing days.
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import memo
+import atomic_io
+import history_fetcher
+import price_store
+
+# Constants
+DAY_MS = 24 * 3600 * 1000
+CHART_SERIES = ('prices', 'market_caps', 'total_volumes')
+HISTORY_TTL_SECONDS = 12 * 3600  # Shared freshness window for every history consumer
+HISTORY_MEMO_TTL_SECONDS = 3600  # How long a sliced window is reused within one process
+SPARKLINE_DAYS = 7  # Days covered by the hourly `sparkline_in_7d` of /coins/markets
+SPARKLINE_STEP_MS = 3600 * 1000
+
+# One store per quote currency, shared by every caller in this process
+stores = {}
+store_lock = threading.Lock()
+
+def today_ms():
+    """Epoch milliseconds of the current UTC midnight"""
+    now_ms = int(time.time() * 1000)
+    return now_ms - now_ms % DAY_MS
+
+def drop_provisional_point(points):
+    """Drop the trailing "current time" point CoinGecko appends to daily series"""
+    if points and points[-1][0] % DAY_MS:
+        return points[:-1]
+    return points
+
+def to_daily_points(points):
+    """Keep the first point of each UTC day, snapped to midnight (handles hourly range responses)"""
+    daily = {}
+    for timestamp, value in points:
+        day = int(timestamp) - int(timestamp) % DAY_MS
+        if day not in daily:
+            daily[day] = [day, value]
+    return [daily[day] for day in sorted(daily)]
+
+def normalize_market_chart(chart):
+    """Put every series of a market_chart payload on the daily grid without the provisional point"""
+    return {
+        key: to_daily_points(drop_provisional_point(chart.get(key) or []))
+        for key in CHART_SERIES
+    }
+
+def merge_market_charts(old, new):
+    """Merge two normalized charts by timestamp; points in `new` win"""
+    merged = {}
+    for key in CHART_SERIES:
+        points = {point[0]: point for point in (old or {}).get(key) or []}
+        points.update({point[0]: point for point in (new or {}).get(key) or []})
+        merged[key] = [points[timestamp] for timestamp in sorted(points)]
+    return merged
+
+def slice_market_chart(chart, days):
+    """Return only the points within the last `days` days"""
+    start = today_ms() - days * DAY_MS
+    return {
+        key: [point for point in chart.get(key) or [] if point[0] >= start]
+        for key in CHART_SERIES
+    }
+
+def refresh_market_chart(coin_id, cached_chart, days, vs_currency="usd", covered_from_ms=None):
+    """
+    Bring a cached chart up to date, requesting only the missing date range.
+
+    Falls back to a full `days` fetch when nothing usable is cached or the
+    cache does not reach back far enough. `covered_from_ms` marks how far back
+    the cache is known to be complete when that is earlier than its first point
+    (coins listed after the window started).
+
+    Returns:
+        The merged, normalized chart, or None if the fetch failed
+    """
+    cached = normalize_market_chart(cached_chart) if cached_chart else None
+    prices = cached['prices'] if cached else []
+    today = today_ms()
+
+    if not prices or min(prices[0][0], covered_from_ms or prices[0][0]) > today - days * DAY_MS:
+        print(f"{coin_id}: Fetching full {days}-day history...")
+        data = history_fetcher.fetch_market_chart(coin_id, days, vs_currency)
+        return normalize_market_chart(data) if data else None
+
+    last_cached = prices[-1][0]
+    if last_cached >= today:
+        return cached
+
+    missing_days = (today - last_cached) // DAY_MS
+    print(f"{coin_id}: Fetching {missing_days} missing day(s) since last cached point...")
+    delta = history_fetcher.fetch_market_chart_range(
+        coin_id, (last_cached + DAY_MS) // 1000, int(time.time()), vs_currency
+    )
+    if delta is None:
+        return None
+
+    return merge_market_charts(cached, normalize_market_chart(delta))
+
+def load_chart_cache(cache_file):
+    """Load a `{'timestamp', 'data'}` cache file; returns None if missing or unreadable"""
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error reading cache file {cache_file}: {e}")
+        return None
+
+def get_store(vs_currency="usd"):
+    """Shared price store for a quote currency; legacy JSON caches are imported on first use"""
+    with store_lock:
+        if vs_currency not in stores:
+            store = price_store.PriceStore(vs_currency)
+            if not len(store) and vs_currency == "usd":
+                price_store.migrate_json_caches(store=store)
+            stores[vs_currency] = store
+        return stores[vs_currency]
+
+def history_status(coin_id, days, vs_currency="usd"):
+    """
+    Classify the stored history of a coin for a `days` window.
+
+    Returns:
+        'fresh' if it covers the window and is current, 'stale' if it needs a
+        (delta) refresh, or 'missing' if nothing is stored
+    """
+    store = get_store(vs_currency)
+    if coin_id not in store:
+        return 'missing'
+
+    entry = store.index[coin_id]
+    today = today_ms() // DAY_MS
+    covers_window = store.meta(coin_id)['covered_from'] <= today - days
+    is_current = entry['last_day'] >= today or time.time() - entry['fetched_at'] < HISTORY_TTL_SECONDS
+    return 'fresh' if covers_window and is_current else 'stale'
+
+def history_age(coin_id, days, vs_currency="usd"):
+    """Seconds since the stored history of a coin was fetched, or None if it is missing or too short for `days`"""
+    store = get_store(vs_currency)
+    if coin_id not in store or store.meta(coin_id)['covered_from'] > today_ms() // DAY_MS - days:
+        return None
+    return time.time() - store.index[coin_id]['fetched_at']
+
+@memo.memoized(HISTORY_MEMO_TTL_SECONDS)
+def stored_window(coin_id, days, vs_currency="usd"):
+    """
+    Slice the last `days` days out of the stored history as a market_chart, or None.
+    Results are memoized per process; callers must treat them as read-only.
+    """
+    columns = get_store(vs_currency).get(coin_id)
+    if columns is None:
+        return None
+
+    mask = columns[price_store.DAY_COLUMN] >= today_ms() // DAY_MS - days
+    if not mask.any():
+        return None
+    return price_store.columns_to_chart({column: values[mask] for column, values in columns.items()})
+
+def sparkline_to_chart(coin):
+    """
+    Daily market_chart (prices only) derived from a /coins/markets row with `sparkline_in_7d`.
+    The sparkline has no timestamps; points are hourly and end at `last_updated`.
+    """
+    prices = (coin.get('sparkline_in_7d') or {}).get('price') or []
+    if not prices or not coin.get('last_updated'):
+        return None
+
+    end_ms = int(datetime.fromisoformat(coin['last_updated'].replace('Z', '+00:00')).timestamp() * 1000)
+    points = [
+        [end_ms - (len(prices) - 1 - i) * SPARKLINE_STEP_MS, price]
+        for i, price in enumerate(prices) if price is not None
+    ]
+
+    # Keep the first point of each UTC day, but only if it lies within the day's
+    # first hour, so the partial first day is not passed off as a midnight price
+    first_by_day = {}
+    for timestamp, price in points:
+        first_by_day.setdefault(timestamp // DAY_MS, (timestamp, price))
+    daily = [
+        [day * DAY_MS, price] for day, (timestamp, price) in sorted(first_by_day.items())
+        if timestamp - day * DAY_MS < SPARKLINE_STEP_MS
+    ]
+    return {'prices': daily, 'market_caps': [], 'total_volumes': []}
+
+def bulk_refresh(coin_ids, vs_currency="usd"):
+    """
+    Refresh the recent days of many coins from one /coins/markets?sparkline=true call per 250 coins.
+
+    Coins with no stored history get the sparkline's ~6 daily points; stored
+    histories get the days after their last point, as long as the sparkline
+    reaches back far enough to leave no gap. Histories ending more than
+    SPARKLINE_DAYS ago are not requested at all; those gaps are left to the
+    per-coin delta refresh.
+
+    Returns:
+        List of coin ids whose stored history was updated
+    """
+    store = get_store(vs_currency)
+    first_reachable_day = today_ms() // DAY_MS - SPARKLINE_DAYS
+    reachable = [c for c in coin_ids if c not in store or store.index[c]['last_day'] >= first_reachable_day]
+    rows = history_fetcher.fetch_markets_with_sparkline(reachable, vs_currency)
+
+    updates = {}
+    covered_from = {}
+    for coin_id, row in rows.items():
+        chart = sparkline_to_chart(row)
+        columns = price_store.chart_to_columns(chart) if chart else None
+        if columns is None or not len(columns[price_store.DAY_COLUMN]):
+            continue
+
+        days = columns[price_store.DAY_COLUMN]
+        if coin_id in store:
+            last_day = store.index[coin_id]['last_day']
+            if days[0] > last_day + 1:
+                continue
+            # Stored daily points win over the hourly approximation
+            keep = days > last_day
+            if not keep.any():
+                continue
+            columns = {column: values[keep] for column, values in columns.items()}
+        updates[coin_id] = columns
+        covered_from[coin_id] = int(days[0])
+
+    if updates:
+        with store_lock:
+            store.update(updates, covered_from)
+        stored_window.invalidate_all()
+    print(f"Bulk refresh: updated {len(updates)}/{len(coin_ids)} coins from {len(rows)} sparkline rows")
+    return list(updates)
+
+def fetch_and_store(coin_ids, days, vs_currency="usd"):
+    """Refresh the given coins concurrently (delta fetches where possible) and write them to the store once"""
+    if not coin_ids:
+        return
+    store = get_store(vs_currency)
+
+    def refresh(coin_id):
+        cached_chart = None
+        covered_from_ms = None
+        if coin_id in store:
+            cached_chart = price_store.columns_to_chart(store.get(coin_id))
+            covered_from_ms = store.meta(coin_id)['covered_from'] * DAY_MS
+        return refresh_market_chart(coin_id, cached_chart, days, vs_currency, covered_from_ms)
+
+    fetched = history_fetcher.fetch_all(coin_ids, refresh)
+    updates = {c: price_store.chart_to_columns(chart) for c, chart in fetched.items() if chart}
+    if updates:
+        # A successful refresh covers the whole requested window
+        window_start = today_ms() // DAY_MS - days
+        with store_lock:
+            store.update(updates, {c: window_start for c in updates})
+        stored_window.invalidate_all()
+
+    for coin_id, chart in fetched.items():
+        if chart is None and coin_id in store:
+            print(f"{coin_id}: Refresh failed, serving stored history")
+
+def get_histories(coin_ids, days, vs_currency="usd", cache_only=False, bulk=False):
+    """
+    Get the last `days` days of history for several coins.
+
+    Windows are sliced from the longest stored history; only coins whose
+    stored series is missing, too short or stale are fetched (concurrently,
+    as delta refreshes where possible), and the store is rewritten once.
+    With `bulk`, stale coins are first refreshed together from the markets
+    sparkline (see bulk_refresh), so only coins it cannot cover are fetched one by one.
+
+    Returns:
+        Dict of {coin_id: market_chart or None}
+    """
+    store = get_store(vs_currency)
+    coin_ids = list(dict.fromkeys(coin_ids))
+
+    to_fetch = [] if cache_only else [c for c in coin_ids if history_status(c, days, vs_currency) != 'fresh']
+    if to_fetch and bulk:
+        bulk_refresh(to_fetch, vs_currency)
+        to_fetch = [c for c in to_fetch if history_status(c, days, vs_currency) != 'fresh']
+    if to_fetch:
+        # Single flight across jobs: fetch the coins nobody else is fetching right now,
+        # then wait for the others and only fetch those still not fresh afterwards
+        locks = {c: atomic_io.key_lock(f"history-{vs_currency}", c) for c in to_fetch}
+        owned = [c for c in to_fetch if locks[c].acquire(blocking=False)]
+        in_flight = [c for c in to_fetch if c not in owned]
+        try:
+            fetch_and_store(owned, days, vs_currency)
+        finally:
+            for coin_id in owned:
+                locks[coin_id].release()
+
+        if in_flight:
+            print(f"Waiting for {len(in_flight)} coin(s) being fetched by another job...")
+            # Sorted acquisition order keeps concurrent jobs from deadlocking
+            in_flight.sort()
+            for coin_id in in_flight:
+                locks[coin_id].acquire()
+            try:
+                with store_lock:
+                    store.reload()
+                stored_window.invalidate_all()
+                fetch_and_store([c for c in in_flight if history_status(c, days, vs_currency) != 'fresh'], days, vs_currency)
+            finally:
+                for coin_id in in_flight:
+                    locks[coin_id].release()
+
+    return {coin_id: stored_window(coin_id, days, vs_currency) for coin_id in coin_ids}
+
+def get_history(coin_id, days, vs_currency="usd", cache_only=False, bulk=False):
+    """Get the last `days` days of history for one coin as a market_chart, or None"""
+    return get_histories([coin_id], days, vs_currency, cache_only, bulk)[coin_id]
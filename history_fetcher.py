@@ -0,0 +1,147 @@
+"""
+Concurrent, rate-limited fetch engine for CoinGecko price histories.
+Requests run on a thread pool and are paced by the shared rate controller in
+rate_limit.py, so a full universe refresh takes as long as the rate limit
+allows rather than the sum of fixed sleeps, and 429s slow down every job
+using the same quota.
+"""
+
+import time
+import random
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+import transport
+from rate_limit import COINGECKO_LIMITER
+
+# Constants
+COINGECKO_HISTORY_URL = "https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
+COINGECKO_RANGE_URL = "https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart/range"
+COINGECKO_MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+MARKETS_PAGE_SIZE = 250  # Coins per /coins/markets request
+HOURLY_CHUNK_DAYS = 90  # Longest market_chart/range span CoinGecko returns at hourly granularity
+MAX_WORKERS = 8  # Requests in flight at once
+MAX_RETRIES = 5  # Maximum number of retries for API requests
+REQUEST_TIMEOUT = 30  # Seconds before a request is abandoned
+
+def get_json(url, params, label):
+    """GET a CoinGecko endpoint under the shared rate limit; transient network errors back off exponentially"""
+    for retry in range(MAX_RETRIES):
+        COINGECKO_LIMITER.acquire()
+        try:
+            response = transport.get(url, params=params, timeout=REQUEST_TIMEOUT)
+
+            # Handle rate limiting: the shared controller pauses every job until Retry-After has passed
+            wait_time = COINGECKO_LIMITER.record_response(response.status_code, response.headers.get('Retry-After'))
+            if response.status_code == 429:
+                print(f"{label}: Rate limited. All jobs paused for {wait_time:.2f} seconds before retry {retry+1}/{MAX_RETRIES}...")
+                continue
+
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            if retry < MAX_RETRIES - 1:
+                wait_time = 2 ** retry + random.random()
+                print(f"{label}: Error: {e}. Retrying in {wait_time:.2f} seconds... ({retry+1}/{MAX_RETRIES})")
+                time.sleep(wait_time)
+            else:
+                print(f"{label}: Failed after {MAX_RETRIES} retries: {e}")
+        except ValueError as e:
+            print(f"{label}: Error decoding JSON response: {e}")
+            return None
+
+    return None
+
+def fetch_market_chart(coin_id, days, vs_currency="usd", interval="daily"):
+    """
+    Fetch the raw `market_chart` payload (prices, market_caps, total_volumes) for one coin.
+    With `interval=None` CoinGecko picks the granularity (hourly for 2-90 days).
+    """
+    params = {
+        'vs_currency': vs_currency,
+        'days': days
+    }
+    if interval:
+        params['interval'] = interval
+    return get_json(COINGECKO_HISTORY_URL.format(coin_id=coin_id), params, coin_id)
+
+def fetch_market_chart_range(coin_id, from_ts, to_ts, vs_currency="usd"):
+    """Fetch `market_chart` data between two UNIX timestamps (seconds) for one coin"""
+    params = {
+        'vs_currency': vs_currency,
+        'from': int(from_ts),
+        'to': int(to_ts)
+    }
+    return get_json(COINGECKO_RANGE_URL.format(coin_id=coin_id), params, coin_id)
+
+def fetch_market_chart_chunked(coin_id, from_ts, to_ts, vs_currency="usd", chunk_days=HOURLY_CHUNK_DAYS):
+    """
+    Fetch a long range in chunks of at most `chunk_days`, the longest range CoinGecko
+    still answers at hourly granularity, and concatenate the series.
+
+    Returns:
+        Combined market_chart payload, or None if any chunk failed
+    """
+    combined = {'prices': [], 'market_caps': [], 'total_volumes': []}
+    chunk_seconds = chunk_days * 24 * 3600
+    start = int(from_ts)
+    while start < to_ts:
+        end = min(int(to_ts), start + chunk_seconds)
+        data = fetch_market_chart_range(coin_id, start, end, vs_currency)
+        if data is None:
+            return None
+        for key in combined:
+            combined[key].extend(data.get(key) or [])
+        start = end
+    return combined
+
+def fetch_markets_with_sparkline(coin_ids, vs_currency="usd"):
+    """
+    Fetch `/coins/markets` rows with the 7-day hourly sparkline for many coins,
+    MARKETS_PAGE_SIZE coins per request (requests run concurrently).
+
+    Returns:
+        Dict of {coin_id: markets row} for the coins CoinGecko returned
+    """
+    coin_ids = list(dict.fromkeys(coin_ids))
+    chunks = [tuple(coin_ids[i:i + MARKETS_PAGE_SIZE]) for i in range(0, len(coin_ids), MARKETS_PAGE_SIZE)]
+
+    def fetch_chunk(chunk):
+        params = {
+            'vs_currency': vs_currency,
+            'ids': ','.join(chunk),
+            'per_page': MARKETS_PAGE_SIZE,
+            'page': 1,
+            'sparkline': 'true',
+            'price_change_percentage': '1h,24h,7d,14d,30d'
+        }
+        return get_json(COINGECKO_MARKETS_URL, params, f"markets ({len(chunk)} coins)")
+
+    rows = {}
+    for data in fetch_all(chunks, fetch_chunk).values():
+        for coin in data or []:
+            rows[coin.get('id')] = coin
+    return rows
+
+def fetch_all(coin_ids, fetch_fn, max_workers=MAX_WORKERS):
+    """
+    Run `fetch_fn(coin_id)` for every coin with up to `max_workers` requests in flight.
+
+    Returns:
+        Dict of {coin_id: result} in the order of `coin_ids` (None for failed coins)
+    """
+    coin_ids = list(dict.fromkeys(coin_ids))
+    if not coin_ids:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(coin_ids))) as executor:
+        futures = {coin_id: executor.submit(fetch_fn, coin_id) for coin_id in coin_ids}
+        for coin_id, future in futures.items():
+            try:
+                results[coin_id] = future.result()
+            except Exception as e:
+                print(f"Unexpected error fetching {coin_id}: {e}")
+                results[coin_id] = None
+
+    return results
@@ -0,0 +1,239 @@
+"""
+Hourly price histories for intraday signals.
+Each coin is stored as one compact structured .npy file (int32 epoch hour +
+float32 price/volume/market cap, 16 bytes per row) next to a small index,
+fetched in chunked ranges and refreshed incrementally. Bars of any width
+(4h, daily) are resampled on the fly, and `get_resampled_histories` returns
+them as market_chart payloads so daily consumers keep working unchanged.
+"""
+
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+import atomic_io
+import history_fetcher
+
+# Constants
+HOUR_MS = 3600 * 1000
+HOURLY_STORE_DIR = "cache/price_store_hourly"
+INDEX_FILE = "index.json"
+HOURLY_TTL_SECONDS = 3600  # An hourly series is refreshed once its newest complete hour is older than this
+ROW_DTYPE = np.dtype([('hour', '<i4'), ('price', '<f4'), ('volume', '<f4'), ('market_cap', '<f4')])
+CHART_SERIES_FIELDS = {'prices': 'price', 'total_volumes': 'volume', 'market_caps': 'market_cap'}
+
+# One store per quote currency, shared by every caller in this process
+stores = {}
+store_lock = threading.Lock()
+
+def current_hour():
+    """Epoch hour of the current (incomplete) hour"""
+    return int(time.time() // 3600)
+
+def series_to_hourly(points):
+    """Snap [timestamp_ms, value] points to epoch hours, keeping the first point of each hour"""
+    if not points:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    values = np.array([np.nan if value is None else value for _, value in points], dtype=np.float64)
+    hours = np.array([timestamp for timestamp, _ in points], dtype=np.int64) // HOUR_MS
+    order = np.argsort(hours, kind='stable')
+    unique_hours, first = np.unique(hours[order], return_index=True)
+    return unique_hours, values[order][first]
+
+def chart_to_rows(chart):
+    """
+    Convert a market_chart payload to hourly rows; points in the current,
+    still incomplete hour are dropped so they never shadow the final value.
+    """
+    hours, prices = series_to_hourly(chart.get('prices'))
+    complete = hours < current_hour()
+    hours, prices = hours[complete], prices[complete]
+
+    rows = np.zeros(len(hours), dtype=ROW_DTYPE)
+    rows['hour'] = hours
+    rows['price'] = prices
+    for series in ('total_volumes', 'market_caps'):
+        field = CHART_SERIES_FIELDS[series]
+        rows[field] = np.nan
+        series_hours, values = series_to_hourly(chart.get(series))
+        positions = np.searchsorted(hours, series_hours)
+        matched = positions < len(hours)
+        matched[matched] &= hours[positions[matched]] == series_hours[matched]
+        rows[field][positions[matched]] = values[matched]
+    return rows
+
+def merge_rows(old, new):
+    """Merge two row arrays by hour; rows in `new` win"""
+    rows = np.concatenate([old, new])
+    order = np.arange(len(rows))[::-1]
+    _, first = np.unique(rows['hour'][order], return_index=True)
+    return rows[order[first]]
+
+def resample(rows, bar_hours=24):
+    """
+    Aggregate hourly rows into `bar_hours`-wide bars aligned to UTC, in one vectorized pass.
+
+    Returns:
+        Dict of arrays: start_ms, open, high, low, close (price), volume and
+        market_cap (last value in the bar), and `aligned` (True where the bar
+        has a row at its first hour, i.e. `open` is the price at bar start)
+    """
+    hours = rows['hour'].astype(np.int64)
+    prices = rows['price'].astype(np.float64)
+    if not len(hours):
+        empty = np.empty(0)
+        return {'start_ms': np.empty(0, dtype=np.int64), 'open': empty, 'high': empty, 'low': empty,
+                'close': empty, 'volume': empty, 'market_cap': empty, 'aligned': np.empty(0, dtype=bool)}
+
+    buckets = hours // bar_hours
+    bar_ids, starts = np.unique(buckets, return_index=True)
+    ends = np.append(starts[1:], len(hours)) - 1
+    return {
+        'start_ms': bar_ids * bar_hours * HOUR_MS,
+        'open': prices[starts],
+        'high': np.fmax.reduceat(prices, starts),
+        'low': np.fmin.reduceat(prices, starts),
+        'close': prices[ends],
+        'volume': rows['volume'][ends].astype(np.float64),
+        'market_cap': rows['market_cap'][ends].astype(np.float64),
+        'aligned': hours[starts] % bar_hours == 0
+    }
+
+def bars_to_chart(bars):
+    """
+    market_chart payload from resampled bars. Like CoinGecko's daily series,
+    each point is the price at the bar's start; bars without a row at their
+    first hour are skipped.
+    """
+    aligned = bars['aligned']
+    timestamps = bars['start_ms'][aligned].tolist()
+    chart = {'prices': [[ts, value] for ts, value in zip(timestamps, bars['open'][aligned].tolist())]}
+    for series, field in (('total_volumes', 'volume'), ('market_caps', 'market_cap')):
+        chart[series] = [[ts, value] for ts, value in zip(timestamps, bars[field][aligned].tolist()) if value == value]
+    return chart
+
+class HourlyStore:
+    """Per-coin hourly row files plus an index of coverage and fetch times for one quote currency"""
+
+    def __init__(self, vs_currency="usd", store_dir=HOURLY_STORE_DIR):
+        self.vs_currency = vs_currency
+        self.path = os.path.join(store_dir, vs_currency)
+        self.lock_file = os.path.join(store_dir, f"{vs_currency}.lock")
+
+    def coin_file(self, coin_id):
+        return os.path.join(self.path, f"{coin_id}.npy")
+
+    def load_index(self):
+        index_file = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_file):
+            return {}
+        try:
+            with open(index_file, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error reading hourly store index: {e}")
+            return {}
+
+    def entry(self, coin_id):
+        """Index entry (first_hour, last_hour, covered_from, fetched_at, rows) for a coin, or None"""
+        return self.load_index().get(coin_id)
+
+    def get(self, coin_id):
+        """Memory-mapped rows of one coin, or None if it isn't stored"""
+        if not os.path.exists(self.coin_file(coin_id)):
+            return None
+        return np.load(self.coin_file(coin_id), mmap_mode='r')
+
+    def update(self, coin_id, rows, covered_from):
+        """Merge new rows into a coin's file and record how far back it is complete"""
+        with atomic_io.FileLock(self.lock_file):
+            existing = self.get(coin_id)
+            merged = merge_rows(np.asarray(existing), rows) if existing is not None else np.sort(rows, order='hour')
+            if not len(merged):
+                return
+            with atomic_io.atomic_open(self.coin_file(coin_id), 'wb') as f:
+                np.save(f, merged)
+
+            index = self.load_index()
+            previous = index.get(coin_id, {})
+            index[coin_id] = {
+                'first_hour': int(merged['hour'][0]),
+                'last_hour': int(merged['hour'][-1]),
+                'covered_from': int(min(previous.get('covered_from', covered_from), covered_from, merged['hour'][0])),
+                'fetched_at': time.time(),
+                'rows': len(merged)
+            }
+            atomic_io.atomic_write_json(os.path.join(self.path, INDEX_FILE), index)
+
+def get_store(vs_currency="usd"):
+    """Shared hourly store for a quote currency"""
+    with store_lock:
+        if vs_currency not in stores:
+            stores[vs_currency] = HourlyStore(vs_currency)
+        return stores[vs_currency]
+
+def is_fresh(entry, start_hour):
+    """True if a stored series reaches back to `start_hour` and is current"""
+    if not entry or entry['covered_from'] > start_hour:
+        return False
+    return entry['last_hour'] >= current_hour() - 1 or time.time() - entry['fetched_at'] < HOURLY_TTL_SECONDS
+
+def refresh_hourly(coin_id, days, vs_currency="usd"):
+    """
+    Bring one coin's hourly series up to date: only the hours after its last row
+    are fetched when it already covers the window, else the whole window (in
+    chunks). Single-flight across jobs via a per-coin lock.
+
+    Returns:
+        True if the stored series is fresh afterwards
+    """
+    store = get_store(vs_currency)
+    start_hour = current_hour() - days * 24
+    with atomic_io.key_lock(f"hourly-{vs_currency}", coin_id):
+        entry = store.entry(coin_id)
+        if is_fresh(entry, start_hour):
+            return True
+
+        from_hour = entry['last_hour'] + 1 if entry and entry['covered_from'] <= start_hour else start_hour
+        print(f"{coin_id}: Fetching {current_hour() - from_hour} hour(s) of hourly history...")
+        data = history_fetcher.fetch_market_chart_chunked(coin_id, from_hour * 3600, time.time(), vs_currency)
+        if data is None:
+            return False
+        store.update(coin_id, chart_to_rows(data), from_hour)
+        return True
+
+def get_hourly_histories(coin_ids, days, vs_currency="usd", cache_only=False):
+    """
+    Get the last `days` days of hourly rows for several coins, fetching stale ones concurrently.
+
+    Returns:
+        Dict of {coin_id: structured row array (hour, price, volume, market_cap) or None}
+    """
+    coin_ids = list(dict.fromkeys(coin_ids))
+    if not cache_only:
+        history_fetcher.fetch_all(coin_ids, lambda coin_id: refresh_hourly(coin_id, days, vs_currency))
+
+    store = get_store(vs_currency)
+    start_hour = current_hour() - days * 24
+    histories = {}
+    for coin_id in coin_ids:
+        rows = store.get(coin_id)
+        histories[coin_id] = rows[rows['hour'] >= start_hour] if rows is not None else None
+    return histories
+
+def get_resampled_histories(coin_ids, days, bar_hours=24, vs_currency="usd", cache_only=False):
+    """
+    Hourly histories resampled to `bar_hours` bars (24 = daily, 4 = 4h) as market_chart payloads,
+    so consumers of the daily history cache (e.g. calculate_returns) can use them as-is.
+
+    Returns:
+        Dict of {coin_id: market_chart or None}
+    """
+    histories = get_hourly_histories(coin_ids, days, vs_currency, cache_only)
+    return {
+        coin_id: bars_to_chart(resample(rows, bar_hours)) if rows is not None and len(rows) else None
+        for coin_id, rows in histories.items()
+    }
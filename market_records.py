@@ -0,0 +1,145 @@
+"""
+Compact, typed records for market snapshots.
+A CoinGecko markets row carries ~26 fields, of which the pipeline reads a
+handful. Snapshots are decoded (with orjson when installed) straight into
+slotted CoinRecord objects holding only those fields, and MarketTable gives
+a struct-of-arrays view for bulk sorting and ranking.
+"""
+
+import json
+
+import numpy as np
+
+import ranking
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Constants
+# Fields kept from each markets row, with the type they are coerced to
+COIN_SCHEMA = {
+    'id': str,
+    'symbol': str,
+    'name': str,
+    'current_price': float,
+    'market_cap': float,
+    'total_volume': float,
+    'price_change_percentage_24h': float,
+}
+NUMERIC_FIELDS = tuple(field for field, kind in COIN_SCHEMA.items() if kind is float)
+
+class CoinRecord:
+    """
+    One coin of a market snapshot, holding only the fields in COIN_SCHEMA.
+    Supports the dict-style access (`get`, `[]`, `in`, `copy`) the scripts
+    already use on raw markets rows.
+    """
+
+    __slots__ = tuple(COIN_SCHEMA)
+
+    def __init__(self, **values):
+        for field in COIN_SCHEMA:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_row(cls, row):
+        """Decode a raw markets row, coercing values to their schema type (bad values become None)"""
+        record = cls.__new__(cls)
+        for field, kind in COIN_SCHEMA.items():
+            value = row.get(field)
+            if value is not None:
+                try:
+                    value = kind(value)
+                except (TypeError, ValueError):
+                    value = None
+            setattr(record, field, value)
+        return record
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in COIN_SCHEMA else None
+        return default if value is None else value
+
+    def __getitem__(self, field):
+        if field not in COIN_SCHEMA:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in COIN_SCHEMA:
+            raise KeyError(f"{field} is not a CoinRecord field")
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in COIN_SCHEMA and getattr(self, field) is not None
+
+    def copy(self):
+        return CoinRecord(**self.to_dict())
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in COIN_SCHEMA}
+
+    def __repr__(self):
+        return f"CoinRecord({self.id!r}, price={self.current_price}, 24h={self.price_change_percentage_24h})"
+
+def loads(raw):
+    """Parse JSON bytes or text with orjson when available, else the stdlib"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def to_records(rows):
+    """Convert markets rows (dicts or records) to CoinRecords"""
+    return [row if isinstance(row, CoinRecord) else CoinRecord.from_row(row) for row in rows or []]
+
+def decode_snapshot(raw):
+    """
+    Decode a market data cache file (`{'timestamp', 'data'}`) into records.
+
+    Returns:
+        Tuple of (timestamp, list of CoinRecord)
+    """
+    content = loads(raw)
+    return content.get('timestamp', 0), to_records(content.get('data'))
+
+class MarketTable:
+    """
+    Struct-of-arrays view of a snapshot: `ids`, `symbols` and one float64
+    array per numeric field (NaN where missing), aligned with `records`.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.ids = np.array([record.id for record in self.records], dtype=object)
+        self.symbols = np.array([(record.symbol or '').upper() for record in self.records], dtype=object)
+        self.columns = {
+            field: np.array([np.nan if getattr(record, field) is None else getattr(record, field) for record in self.records], dtype=np.float64)
+            for field in NUMERIC_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.records)
+
+    def column(self, field):
+        return self.columns[field]
+
+    def valid_mask(self, *fields):
+        """Rows where every field in `fields` is present"""
+        mask = np.ones(len(self.records), dtype=bool)
+        for field in fields:
+            mask &= ~np.isnan(self.columns[field])
+        return mask
+
+    def order_by(self, field, descending=True):
+        """Row indices sorted by `field` (stable; missing values last)"""
+        values = self.columns[field]
+        keys = -values if descending else values
+        keys = np.where(np.isnan(keys), np.inf, keys)
+        return np.argsort(keys, kind='stable')
+
+    def top(self, field, n, descending=True):
+        """The first `n` records by `field`, skipping rows where it is missing (ties keep row order)"""
+        values = self.columns[field]
+        top = ranking.top_k(values if descending else -values, n)
+        return [self.records[i] for i in top[top >= 0]]
@@ -0,0 +1,73 @@
+"""
+Process-level memoization with TTL and explicit invalidation.
+Used in front of market snapshots and price histories so each artifact is
+parsed or fetched at most once per process, however many scripts ask for it.
+"""
+
+import time
+import threading
+import functools
+
+# Every memoized function, so the whole layer can be invalidated at once
+registry = []
+
+def memoized(ttl_seconds):
+    """
+    Decorator caching a function's results per argument tuple for `ttl_seconds`.
+
+    None results are not cached, so failed fetches are retried on the next
+    call. Concurrent callers with the same arguments wait for a single
+    computation. The wrapper gains `invalidate(*args, **kwargs)` and
+    `invalidate_all()`.
+    """
+    def decorator(func):
+        entries = {}  # {key: (expires_at, value)}
+        key_locks = {}
+        lock = threading.Lock()
+
+        def make_key(args, kwargs):
+            return args, tuple(sorted(kwargs.items()))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            with lock:
+                entry = entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+                key_lock = key_locks.setdefault(key, threading.Lock())
+
+            with key_lock:
+                # Another caller may have computed it while we waited
+                with lock:
+                    entry = entries.get(key)
+                    if entry and entry[0] > time.monotonic():
+                        return entry[1]
+
+                value = func(*args, **kwargs)
+                if value is not None:
+                    with lock:
+                        entries[key] = (time.monotonic() + ttl_seconds, value)
+                return value
+
+        def invalidate(*args, **kwargs):
+            """Drop the cached result for one argument tuple"""
+            with lock:
+                entries.pop(make_key(args, kwargs), None)
+
+        def invalidate_all():
+            """Drop every cached result of this function"""
+            with lock:
+                entries.clear()
+
+        wrapper.invalidate = invalidate
+        wrapper.invalidate_all = invalidate_all
+        registry.append(wrapper)
+        return wrapper
+
+    return decorator
+
+def invalidate_all():
+    """Drop every memoized result in this process"""
+    for wrapper in registry:
+        wrapper.invalidate_all()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the CoinGecko and Discord APIs, served from recorded data.
+Markets come from the market data cache, histories from the price store,
+shifted so they end today. Latency, 429 injection and payload size are
+configurable, so pipeline throughput and rate-limit handling can be
+benchmarked offline.
+
+Point the pipeline at it through the transport layer:
+    python3 mock_api_server.py --port 8765 --latency-ms 150 --rate-limit-probability 0.1
+    HTTP_TRANSPORT_REDIRECT=http://127.0.0.1:8765 python3 momentum_strategy.py
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import history_cache
+import price_store
+
+# Constants
+DEFAULT_PORT = 8765
+DEFAULT_MARKETS_FILE = "coingecko_cache.json"
+SPARKLINE_POINTS = 168
+MARKET_CHART_PATH = re.compile(r'^/api/v3/coins/(?P<coin_id>[^/]+)/market_chart(?P<range>/range)?$')
+MARKETS_PATH = "/api/v3/coins/markets"
+WEBHOOK_PATH_PREFIX = "/api/webhooks/"
+STATS_PATH = "/__stats"
+
+def load_markets(markets_file, payload_coins=None):
+    """
+    Load recorded /coins/markets rows. With `payload_coins`, the list is
+    truncated or padded with renamed copies to exactly that many coins.
+    """
+    with open(markets_file, 'r') as f:
+        data = json.load(f)
+    coins = data.get('data', data) if isinstance(data, dict) else data
+    if payload_coins is None or not coins:
+        return coins
+
+    padded = list(coins[:payload_coins])
+    copy = 1
+    while len(padded) < payload_coins:
+        for coin in coins[:payload_coins - len(padded)]:
+            padded.append(dict(coin, id=f"{coin['id']}-copy{copy}", symbol=f"{coin.get('symbol', '')}{copy}"))
+        copy += 1
+    return padded
+
+def shifted_chart(coin_id, days=None, from_ts=None, to_ts=None):
+    """Stored history of a coin moved forward so its last day is today, as a market_chart (or None)"""
+    columns = history_cache.get_store().get(coin_id)
+    if columns is None or not len(columns[price_store.DAY_COLUMN]):
+        return None
+
+    today = history_cache.today_ms() // history_cache.DAY_MS
+    day_values = np.asarray(columns[price_store.DAY_COLUMN])
+    shifted = {column: np.asarray(values) for column, values in columns.items()}
+    shifted[price_store.DAY_COLUMN] = day_values + (today - day_values[-1])
+
+    mask = np.ones(len(day_values), dtype=bool)
+    if days is not None:
+        mask &= shifted[price_store.DAY_COLUMN] >= today - days
+    if from_ts is not None:
+        mask &= shifted[price_store.DAY_COLUMN] * history_cache.DAY_MS >= from_ts * 1000
+    if to_ts is not None:
+        mask &= shifted[price_store.DAY_COLUMN] * history_cache.DAY_MS <= to_ts * 1000
+    return price_store.columns_to_chart({column: values[mask] for column, values in shifted.items()})
+
+def with_sparkline(coin):
+    """Add a `sparkline_in_7d` built from stored history (flat at the current price if none is stored)"""
+    chart = shifted_chart(coin['id'], days=7)
+    prices = [price for _, price in (chart or {}).get('prices', [])]
+    if len(prices) >= 2:
+        # Interpolate the daily points to hourly resolution
+        hourly = np.interp(np.linspace(0, len(prices) - 1, SPARKLINE_POINTS), np.arange(len(prices)), prices)
+        sparkline = hourly.tolist()
+    else:
+        sparkline = [coin.get('current_price')] * SPARKLINE_POINTS
+    return dict(coin, sparkline_in_7d={'price': sparkline}, last_updated=time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()))
+
+class MockState:
+    """Server configuration plus request counters (shared by handler threads)"""
+
+    def __init__(self, markets, latency_ms, jitter_ms, rate_limit_probability, retry_after):
+        self.markets = markets
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'rate_limited': 0, 'not_found': 0, 'webhook_messages': 0, 'by_path': {}}
+
+    def count(self, key, path=None):
+        with self.lock:
+            self.stats[key] += 1
+            if path:
+                self.stats['by_path'][path] = self.stats['by_path'].get(path, 0) + 1
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    state = None  # Set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate_network(self, path):
+        """Apply latency and 429 injection. Returns True if the request was rejected."""
+        state = self.state
+        state.count('requests', path)
+        delay = max(0.0, state.latency_ms + random.uniform(-state.jitter_ms, state.jitter_ms)) / 1000
+        time.sleep(delay)
+        if random.random() < state.rate_limit_probability:
+            state.count('rate_limited')
+            self.send_json(429, {'status': {'error_code': 429, 'error_message': "You've exceeded the Rate Limit."}},
+                           {'Retry-After': str(state.retry_after)})
+            return True
+        return False
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        if parts.path == STATS_PATH:
+            with self.state.lock:
+                return self.send_json(200, self.state.stats)
+
+        if self.simulate_network(parts.path if not MARKET_CHART_PATH.match(parts.path) else "market_chart"):
+            return
+
+        if parts.path == MARKETS_PATH:
+            coins = self.state.markets
+            if query.get('ids'):
+                wanted = set(query['ids'].split(','))
+                coins = [coin for coin in coins if coin['id'] in wanted]
+            per_page = int(query.get('per_page', 100))
+            page = int(query.get('page', 1))
+            coins = coins[(page - 1) * per_page:page * per_page]
+            if query.get('sparkline') == 'true':
+                coins = [with_sparkline(coin) for coin in coins]
+            return self.send_json(200, coins)
+
+        match = MARKET_CHART_PATH.match(parts.path)
+        if match:
+            if match.group('range'):
+                chart = shifted_chart(match.group('coin_id'), from_ts=int(query.get('from', 0)), to_ts=int(query.get('to', time.time())))
+            else:
+                days = query.get('days', '1')
+                chart = shifted_chart(match.group('coin_id'), days=None if days == 'max' else int(days))
+            if chart is None:
+                self.state.count('not_found')
+                return self.send_json(404, {'error': 'coin not found'})
+            return self.send_json(200, chart)
+
+        self.state.count('not_found')
+        self.send_json(404, {'error': 'unknown endpoint'})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        # Drain the body so keep-alive connections stay usable
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not parts.path.startswith(WEBHOOK_PATH_PREFIX):
+            self.state.count('not_found')
+            return self.send_json(404, {'error': 'unknown endpoint'})
+        if self.simulate_network("webhook"):
+            return
+        self.state.count('webhook_messages')
+        self.send_response(204)
+        self.end_headers()
+
+def serve(port=DEFAULT_PORT, markets_file=DEFAULT_MARKETS_FILE, payload_coins=None, latency_ms=0.0,
+          jitter_ms=0.0, rate_limit_probability=0.0, retry_after=1):
+    """Start the mock server in a background thread. Returns the server (call `shutdown()` to stop it)."""
+    handler = type('ConfiguredMockApiHandler', (MockApiHandler,), {
+        'state': MockState(load_markets(markets_file, payload_coins), latency_ms, jitter_ms, rate_limit_probability, retry_after)
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, name="mock-api-server", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local CoinGecko/Discord stand-in served from recorded data")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--markets-file", default=DEFAULT_MARKETS_FILE, help="recorded /coins/markets rows (market data cache format)")
+    parser.add_argument("--payload-coins", type=int, help="truncate or pad the markets universe to this many coins")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter around the mean latency")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.markets_file, args.payload_coins, args.latency_ms,
+                   args.jitter_ms, args.rate_limit_probability, args.retry_after)
+    print(f"Mock API server listening on http://127.0.0.1:{args.port} (stats at {STATS_PATH})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
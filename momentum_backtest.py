@@ -1,5 +1,7 @@
 import ai_highlights
-import requests
+import history_cache
+import transport
+from rate_limit import DISCORD_LIMITER
 import datetime
 import pandas as pd
 import numpy as np
@@ -9,32 +11,22 @@ from datetime import datetime, timedelta
 import os
 
 # Constants
-COINGECKO_HISTORY_URL = "https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
 BACKTEST_DAYS = 7  # Number of days to backtest
 INVESTMENT_PER_COIN = 100  # Hypothetical $100 invested in each coin
 
 def get_historical_data(coin_id, days):
     """
     Fetch historical price data for a given coin from CoinGecko.
+    Served from the shared history cache, so short windows are sliced from
+    longer stored histories instead of being fetched again.
     """
     print(f"Fetching {days} days of historical data for {coin_id}...")
     
-    params = {
-        'vs_currency': 'usd',
-        'days': days,
-        'interval': 'daily'
-    }
-    
     try:
-        # Add a short delay to respect rate limits
-        time.sleep(1.5)
-        
-        response = requests.get(COINGECKO_HISTORY_URL.format(coin_id=coin_id), params=params)
-        response.raise_for_status()
-        data = response.json()
+        chart = history_cache.get_history(coin_id, days)
         
         # Extract price data
-        prices = data.get('prices', [])
+        prices = (chart or {}).get('prices', [])
         if not prices:
             print(f"No price data found for {coin_id}")
             return None
@@ -46,9 +38,6 @@ def get_historical_data(coin_id, days):
         
         return df
     
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching historical data for {coin_id}: {e}")
-        return None
     except Exception as e:
         print(f"Unexpected error with {coin_id}: {e}")
         return None
@@ -70,6 +59,11 @@ def perform_momentum_backtest(top_coins, days=BACKTEST_DAYS):
     results = []
     all_prices = {}
     
+    # Refresh every coin (and the benchmark) up front: stale tails come from one
+    # bulk sparkline request, and the per-coin reads below hit the cache
+    coin_ids = [coin.get('id') for coin in top_coins if coin.get('id')]
+    history_cache.get_histories(coin_ids + ['bitcoin'], fetch_days, bulk=True)
+    
     for coin in top_coins:
         coin_id = coin.get('id')
         symbol = coin.get('symbol', '').upper()
@@ -420,11 +414,14 @@ if __name__ == "__main__":
             files = {'file': (image_path, image_data)}
             payload = {"content": message}
             
-            response = requests.post(
+            # Share the webhook budget with every other job posting to Discord
+            DISCORD_LIMITER.acquire()
+            response = transport.post(
                 webhook_url,
                 data=payload,
                 files=files
             )
+            DISCORD_LIMITER.record_response(response.status_code, response.headers.get('Retry-After'))
             response.raise_for_status()
             print(f"Successfully sent {image_path} to Discord!")
             return True
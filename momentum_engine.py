@@ -0,0 +1,101 @@
+"""
+As-of signals for the daily top-N momentum strategy.
+The raw price points of every coin are flattened once, and an as-of index
+(the last point at or before each backtest date) turns them into aligned
+days x coins matrices of latest price, 24h return, trailing return and
+coin value. The strategy itself runs on strategy_engine
+(strategy_engine.DailyTopMomentum).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Constants
+TRAILING_WINDOW = 14  # Points back for the trailing-return exit rule
+
+def flatten_charts(charts, coin_ids, series='prices'):
+    """
+    Concatenate the [timestamp_ms, value] points of many coins into flat arrays.
+
+    Returns:
+        Dict with 'timestamps' (int64 ms), 'values', and per-coin 'offsets' and 'lengths'
+    """
+    point_lists = [(charts.get(coin_id) or {}).get(series) or [] for coin_id in coin_ids]
+    lengths = np.array([len(points) for points in point_lists], dtype=np.int64)
+    points = np.array(
+        [point[:2] for points in point_lists for point in points], dtype=np.float64
+    ).reshape(-1, 2)
+    coins = np.repeat(np.arange(len(coin_ids)), lengths)
+    timestamps = points[:, 0].astype(np.int64)
+    # Points are kept in time order within each coin
+    order = np.lexsort((timestamps, coins))
+    return {
+        'timestamps': timestamps[order],
+        'values': points[order, 1],
+        'offsets': np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64),
+        'lengths': lengths
+    }
+
+def dates_to_ms(dates):
+    """Epoch milliseconds of naive datetimes, read as UTC like pd.to_datetime(unit='ms') does"""
+    return pd.DatetimeIndex(dates).values.astype('datetime64[ms]').astype(np.int64)
+
+def as_of_counts(flat, dates_ms):
+    """
+    Number of points of each coin at or before each date, for all days and
+    coins in one searchsorted over a (coin, time) composite key.
+
+    Returns:
+        days x coins int64 matrix
+    """
+    n_coins = len(flat['lengths'])
+    if not len(flat['timestamps']):
+        return np.zeros((len(dates_ms), n_coins), dtype=np.int64)
+
+    base = min(flat['timestamps'].min(), dates_ms.min()) - 1
+    span = max(flat['timestamps'].max(), dates_ms.max()) - base + 1
+    coins = np.repeat(np.arange(n_coins), flat['lengths'])
+    keys = coins * span + (flat['timestamps'] - base)
+    queries = np.arange(n_coins)[None, :] * span + (dates_ms[:, None] - base)
+    return np.searchsorted(keys, queries, side='right') - flat['offsets'][None, :]
+
+def gather(flat, counts, back):
+    """Value `back` points before the latest as-of point (NaN where the coin has too few points)"""
+    valid = counts > back
+    index = np.where(valid, flat['offsets'][None, :] + counts - 1 - back, 0)
+    values = flat['values'][index] if len(flat['values']) else np.zeros(counts.shape)
+    return np.where(valid, values, np.nan)
+
+def precompute_signals(flat, dates_ms, trailing_window=TRAILING_WINDOW):
+    """
+    Matrices the strategy needs for every backtest day at once.
+
+    Returns:
+        Dict of days x coins arrays: 'counts', 'price', 'return_24h',
+        'return_trailing' (NaN until more than `trailing_window` points exist)
+        and 'value' (100 * price / first price, NaN before the first point)
+    """
+    counts = as_of_counts(flat, dates_ms)
+    price = gather(flat, counts, 0)
+    has_points = flat['lengths'] > 0
+    first = np.full(len(has_points), np.nan)
+    first[has_points] = flat['values'][flat['offsets'][has_points]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'counts': counts,
+            'price': price,
+            'return_24h': price / gather(flat, counts, 1) - 1,
+            'return_trailing': price / gather(flat, counts, trailing_window) - 1,
+            'value': 100 * (price / first)
+        }
+
+def symbol_values(values, has_data, symbol_index, n_symbols, initial=100.0):
+    """
+    Per-symbol value matrix. Coins sharing a symbol write into the same
+    column in coin order, so the last coin with data on a day wins, exactly
+    like the per-symbol frames of the original loop.
+    """
+    by_symbol = np.full((values.shape[0], n_symbols), initial)
+    for coin, symbol in enumerate(symbol_index):
+        by_symbol[:, symbol] = np.where(has_data[:, coin], values[:, coin], by_symbol[:, symbol])
+    return by_symbol
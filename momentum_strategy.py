@@ -1,23 +1,21 @@
-import requests
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import time
 from datetime import datetime, timedelta
-import json
 import os
-import random
 import ai_highlights  # Import the AI highlights module
+import history_cache
+import strategy_engine
+import ranking
 
 # Constants
 COINGECKO_API_URL = "https://api.coingecko.com/api/v3/coins/markets"
-COINGECKO_HISTORY_URL = "https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
 CACHE_FILE = "coingecko_cache.json"
 CACHE_DIR = "cache"
 BACKTEST_DAYS = 90  # Backtest for 90 days
 LOOK_BACK_WINDOW = 7  # 7-day return for entry
 TRAILING_WINDOW = 14  # 14-day return for exit condition
-REQUEST_DELAY = 3  # Seconds to wait between API requests
+TOP_N_COINS = 3  # Coins held by the momentum strategy
 
 if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR)
@@ -45,89 +43,15 @@ def get_ai_top_coins():
         print("No valid AI coins found after filtering.")
         return None
     
-    # Sort the valid AI coins by 24h price change (descending)
-    valid_ai_coins.sort(key=lambda x: x['price_change_percentage_24h'], reverse=True)
-    
-    # Take top 3 for the momentum backtest
-    top_3_coins = valid_ai_coins[:3]
+    # Take the top 3 by 24h price change (descending)
+    changes = np.array([coin['price_change_percentage_24h'] for coin in valid_ai_coins], dtype=np.float64)
+    top_3_coins = [valid_ai_coins[i] for i in ranking.top_k(changes, 3) if i >= 0]
     top_3_symbols = [coin.get('symbol', '').upper() for coin in top_3_coins]
     
     print(f"Top 3 AI coins for momentum strategy: {', '.join(top_3_symbols)}")
     
     return top_3_coins
 
-def get_historical_data(coin_id, days):
-    """
-    Fetch historical price data for a given coin from CoinGecko.
-    Uses local caching to avoid excessive API calls.
-    """
-    cache_file = f"{CACHE_DIR}/{coin_id}_{days}_days.json"
-    
-    # Check if we have cached data
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            cached_time = cache_data.get('timestamp', 0)
-            # Use cache if it's less than 24 hours old
-            if time.time() - cached_time < 24 * 3600:
-                print(f"Using cached data for {coin_id}")
-                return pd.DataFrame(cache_data.get('data'))
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading cache for {coin_id}: {e}")
-    
-    print(f"Fetching {days} days of historical data for {coin_id}...")
-    
-    params = {
-        'vs_currency': 'usd',
-        'days': days,
-        'interval': 'daily'
-    }
-    
-    try:
-        # Add a longer delay to respect rate limits
-        time.sleep(REQUEST_DELAY + random.uniform(0.5, 1.5))
-        
-        response = requests.get(COINGECKO_HISTORY_URL.format(coin_id=coin_id), params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract price data
-        prices = data.get('prices', [])
-        if not prices:
-            print(f"No price data found for {coin_id}")
-            return None
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(prices, columns=['timestamp', 'price'])
-        df['date'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df[['date', 'price']]
-        
-        # Save to cache
-        try:
-            with open(cache_file, 'w') as f:
-                # Convert date to string to avoid JSON serialization issues
-                df_to_save = df.copy()
-                df_to_save['date'] = df_to_save['date'].astype(str)
-                
-                cache_content = {
-                    'timestamp': time.time(),
-                    'data': df_to_save.to_dict('records')
-                }
-                json.dump(cache_content, f)
-            print(f"Cached data for {coin_id}")
-        except IOError as e:
-            print(f"Error writing cache for {coin_id}: {e}")
-        
-        return df
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching historical data for {coin_id}: {e}")
-        return None
-    except Exception as e:
-        print(f"Unexpected error with {coin_id}: {e}")
-        return None
-
 def calculate_returns(price_df, window):
     """Calculate the rolling returns for a given window period."""
     if price_df is None or len(price_df) <= window:
@@ -174,22 +98,15 @@ def run_momentum_strategy(total_days=BACKTEST_DAYS):
         if coin.get('price_change_percentage_24h') is not None and coin.get('current_price') is not None:
             valid_ai_coins.append(coin)
     
-    # Get historical data for all valid AI coins
+    # Get historical data for all valid AI coins (missing days are fetched concurrently under the rate limit)
+    histories = history_cache.get_histories([coin.get('id') for coin in valid_ai_coins], fetch_days)
+    
     all_historical_data = {}
     for coin in valid_ai_coins:
         coin_id = coin.get('id')
-        symbol = coin.get('symbol', '').upper()
-        
-        hist_data = get_historical_data(coin_id, fetch_days)
-        if hist_data is not None and len(hist_data) > TRAILING_WINDOW:
-            # Convert date column back to datetime if it's a string
-            if isinstance(hist_data['date'].iloc[0], str):
-                hist_data['date'] = pd.to_datetime(hist_data['date'])
-                
-            all_historical_data[coin_id] = {
-                'symbol': symbol,
-                'data': hist_data
-            }
+        chart = histories.get(coin_id)
+        if chart and len(chart.get('prices') or []) > TRAILING_WINDOW:
+            all_historical_data[coin_id] = coin.get('symbol', '').upper()
     
     if not all_historical_data:
         print("No historical data available for any AI coins. Exiting.")
@@ -199,132 +116,55 @@ def run_momentum_strategy(total_days=BACKTEST_DAYS):
     start_date = datetime.now() - timedelta(days=total_days)
     dates = pd.date_range(start=start_date, periods=total_days)
     
-    # Track portfolio performance
+    # Sample every coin as of the backtest days once, then run the daily rules on the shared engine
+    coin_ids = list(all_historical_data)
+    symbols = list(all_historical_data.values())
+    panel = strategy_engine.Panel.from_charts(histories, coin_ids, dates, TRAILING_WINDOW)
+    strategy = strategy_engine.DailyTopMomentum(TOP_N_COINS, TRAILING_WINDOW, symbols)
+    result = strategy_engine.run(panel, strategy)
+    print_trades(result, symbols)
+    
     portfolio = pd.DataFrame(index=dates)
-    portfolio['value'] = 100.0  # Start with $100
-    
-    # Track individual coin performances
-    coin_performances = {}
-    for coin_id, coin_info in all_historical_data.items():
-        symbol = coin_info['symbol']
-        coin_performances[symbol] = pd.DataFrame(index=dates)
-        coin_performances[symbol]['value'] = 100.0
-        coin_performances[symbol]['in_portfolio'] = False
-    
-    # Active positions
-    active_positions = {}  # {coin_id: entry_price}
-    coins_in_portfolio = []  # List to keep track of which coins are in the portfolio
-    
-    # For each day in the backtest period
-    for i, current_date in enumerate(dates):
-        # Calculate daily returns for all coins to determine top 3 by 24H performance
-        day_returns = {}
-        for coin_id, coin_info in all_historical_data.items():
-            symbol = coin_info['symbol']
-            price_data = coin_info['data']
-            
-            # Filter data up to current date
-            price_data_until_now = price_data[price_data['date'] <= current_date]
-            
-            if len(price_data_until_now) >= 2:  # Need at least 2 days for 24H return
-                latest_price = price_data_until_now.iloc[-1]['price']
-                prev_price = price_data_until_now.iloc[-2]['price']
-                return_24h = (latest_price / prev_price) - 1
-                
-                # Calculate 14-day return for exit condition
-                if len(price_data_until_now) > TRAILING_WINDOW:
-                    price_14d_ago = price_data_until_now.iloc[-TRAILING_WINDOW-1]['price']
-                    return_14d = (latest_price / price_14d_ago) - 1
-                else:
-                    return_14d = None
-                
-                # Only include coins with positive 24H returns for entry
-                if return_24h > 0:
-                    day_returns[coin_id] = {
-                        'symbol': symbol,
-                        'return_24h': return_24h,
-                        'return_14d': return_14d,
-                        'current_price': latest_price
-                    }
-        
-        # Sort by 24H return to get top 3
-        sorted_coins = sorted(
-            day_returns.keys(),
-            key=lambda x: day_returns[x]['return_24h'],
-            reverse=True
-        )
-        
-        # Top 3 coins for the day based on 24H return
-        top_3_for_day = sorted_coins[:3] if len(sorted_coins) >= 3 else sorted_coins
-        
-        # Exit positions that are no longer in top 3 or have negative 14-day returns
-        coins_to_exit = []
-        for coin_id in active_positions:
-            # Exit if coin drops out of top 3
-            if coin_id not in top_3_for_day:
-                coins_to_exit.append(coin_id)
-            # Exit if 14-day return becomes negative
-            elif coin_id in day_returns and day_returns[coin_id]['return_14d'] is not None:
-                if day_returns[coin_id]['return_14d'] < 0:
-                    coins_to_exit.append(coin_id)
-        
-        for coin_id in coins_to_exit:
-            if coin_id in active_positions:
-                entry_price = active_positions[coin_id]
-                symbol = all_historical_data[coin_id]['symbol']
-                print(f"Exiting position in {symbol} on {current_date.strftime('%Y-%m-%d')}")
-                coin_performances[symbol].loc[current_date, 'in_portfolio'] = False
-                coins_in_portfolio.remove(coin_id)
-                del active_positions[coin_id]
-        
-        # Enter new positions for coins in top 3 that we don't already hold
-        for coin_id in top_3_for_day:
-            if coin_id not in active_positions and coin_id in day_returns:
-                current_price = day_returns[coin_id]['current_price']
-                symbol = all_historical_data[coin_id]['symbol']
-                print(f"Entering position in {symbol} on {current_date.strftime('%Y-%m-%d')}")
-                active_positions[coin_id] = current_price
-                coins_in_portfolio.append(coin_id)
-                coin_performances[symbol].loc[current_date, 'in_portfolio'] = True
-        
-        # Update performance for all coins we're tracking
-        for coin_id, coin_info in all_historical_data.items():
-            symbol = coin_info['symbol']
-            price_data = coin_info['data']
-            
-            price_data_until_now = price_data[price_data['date'] <= current_date]
-            if len(price_data_until_now) > 0:
-                start_price = price_data.iloc[0]['price']
-                current_price = price_data_until_now.iloc[-1]['price']
-                coin_value = 100 * (current_price / start_price)
-                coin_performances[symbol].loc[current_date, 'value'] = coin_value
-        
-        # Update portfolio value (equal weight)
-        if active_positions:
-            portfolio_coins_performance = 0
-            for coin_id in active_positions:
-                symbol = all_historical_data[coin_id]['symbol']
-                portfolio_coins_performance += coin_performances[symbol].loc[current_date, 'value']
-            
-            # Average performance of active positions
-            portfolio.loc[current_date, 'value'] = portfolio_coins_performance / len(active_positions)
-        else:
-            # If no positions, use previous value
-            if i > 0:
-                portfolio.loc[current_date, 'value'] = portfolio.iloc[i-1]['value']
-    
-    # Filter coin performances to only those that were actually in the portfolio at some point
+    portfolio['value'] = result['values']
+    
+    # Keep only the coins that were actually in the portfolio at some point (True on entry days)
+    unique_symbols, symbol_index, symbol_value = strategy_engine.values_by_symbol(panel, symbols)
+    in_portfolio = np.zeros(symbol_value.shape, dtype=bool)
+    for coin, symbol in enumerate(symbol_index):
+        in_portfolio[:, symbol] |= result['entries'][:, coin]
+    
     portfolio_coins = {}
-    for coin_id, coin_info in all_historical_data.items():
-        symbol = coin_info['symbol']
-        if coin_performances[symbol]['in_portfolio'].any():
-            portfolio_coins[symbol] = coin_performances[symbol]
+    for i, symbol in enumerate(unique_symbols):
+        if in_portfolio[:, i].any():
+            portfolio_coins[symbol] = pd.DataFrame(index=dates)
+            portfolio_coins[symbol]['value'] = symbol_value[:, i]
+            portfolio_coins[symbol]['in_portfolio'] = in_portfolio[:, i]
     
     # Generate insights about volatility and sharp reversals
     insights = generate_insights(portfolio, portfolio_coins)
     
     return portfolio, portfolio_coins, insights
 
+def print_trades(result, symbols):
+    """
+    Print the entries and exits of an engine run, day by day: exits in the
+    order the positions were opened, entries in the day's ranking order
+    """
+    # Ranked selection in force on each row (entries only happen on rebalance rows)
+    segment = np.searchsorted(result['rebalances'], result['rows'], side='right') - 1
+    held = []  # Open positions in the order they were entered
+    for day, date in enumerate(result['dates']):
+        exits = result['exits'][day]
+        for coin in held:
+            if exits[coin]:
+                print(f"Exiting position in {symbols[coin]} on {date.strftime('%Y-%m-%d')}")
+        held = [coin for coin in held if not exits[coin]]
+        ranked = result['selected'][segment[day]] if segment[day] >= 0 else []
+        for coin in ranked:
+            if coin >= 0 and result['entries'][day, coin]:
+                print(f"Entering position in {symbols[coin]} on {date.strftime('%Y-%m-%d')}")
+                held.append(coin)
+
 def generate_insights(portfolio, coin_performances):
     """
     Generate insights about volatility spikes and sharp reversals
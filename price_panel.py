@@ -0,0 +1,161 @@
+"""
+Calendar alignment of price series onto one UTC daily grid.
+Raw market_chart series (possibly with a trailing intraday point, duplicate
+or missing days and varying times of day) are snapped into a days x coins
+matrix in one vectorized pass. Gaps are forward-filled but flagged in an
+`observed` mask, and per-coin coverage is reported, so engines can index by
+integer day offset instead of comparing datetimes.
+"""
+
+import numpy as np
+import pandas as pd
+
+import history_cache
+
+# Constants
+DAY_MS = history_cache.DAY_MS
+
+def forward_fill(values, observed):
+    """Forward-fill a days x coins matrix along days from the `observed` cells (leading gaps stay NaN)"""
+    rows = np.arange(values.shape[0])[:, None]
+    source = np.maximum.accumulate(np.where(observed, rows, 0), axis=0)
+    filled = values[source, np.arange(values.shape[1])]
+    # Rows before a coin's first observation point at row 0, which may not be observed
+    return np.where(np.maximum.accumulate(observed, axis=0), filled, np.nan)
+
+class PricePanel:
+    """
+    Aligned days x coins matrix of one series.
+
+    Attributes:
+        days: epoch days of the rows (contiguous)
+        coin_ids: column order
+        values: forward-filled values (NaN before a coin's first observation)
+        observed: True where the value comes from a real data point, False where it was filled
+    """
+
+    def __init__(self, days, coin_ids, values, observed):
+        self.days = np.asarray(days, dtype=np.int64)
+        self.coin_ids = list(coin_ids)
+        self.values = values
+        self.observed = observed
+        self.columns = {coin_id: i for i, coin_id in enumerate(self.coin_ids)}
+
+    @property
+    def filled(self):
+        """True where a gap was repaired by forward fill"""
+        return ~self.observed & ~np.isnan(self.values)
+
+    @property
+    def dates(self):
+        return pd.to_datetime(self.days * DAY_MS, unit='ms')
+
+    def day_offset(self, day):
+        """Row index of an epoch day, a date or a timestamp (truncated to its UTC day)"""
+        if not isinstance(day, (int, np.integer)):
+            day = int(pd.Timestamp(day).value // (DAY_MS * 1_000_000))
+        return int(day - self.days[0])
+
+    def column(self, coin_id):
+        return self.values[:, self.columns[coin_id]]
+
+    def coverage(self):
+        """
+        Per-coin coverage between its first and last observed day.
+
+        Returns:
+            Dict of {coin_id: {'first_day', 'last_day', 'observed', 'filled', 'coverage'}}
+            (coins never observed are omitted; empty for a panel without rows)
+        """
+        if not len(self.days):
+            return {}
+        seen = self.observed.any(axis=0)
+        first = np.argmax(self.observed, axis=0)
+        last = len(self.days) - 1 - np.argmax(self.observed[::-1], axis=0)
+        observed_counts = self.observed.sum(axis=0)
+        report = {}
+        for i in np.flatnonzero(seen):
+            span = last[i] - first[i] + 1
+            report[self.coin_ids[i]] = {
+                'first_day': int(self.days[first[i]]),
+                'last_day': int(self.days[last[i]]),
+                'observed': int(observed_counts[i]),
+                'filled': int(span - observed_counts[i]),
+                'coverage': float(observed_counts[i] / span)
+            }
+        return report
+
+    def to_frame(self):
+        """Forward-filled values as a DataFrame indexed by date with one column per coin"""
+        return pd.DataFrame(self.values, index=self.dates, columns=self.coin_ids)
+
+def empty_panel():
+    """Panel without rows or coins (no usable points at all)"""
+    return PricePanel(np.empty(0, dtype=np.int64), [], np.empty((0, 0)), np.empty((0, 0), dtype=bool))
+
+def align_charts(charts_by_coin, series='prices', start_day=None, end_day=None):
+    """
+    Snap market_chart series for many coins onto one UTC daily grid.
+
+    A trailing point less than a day after the previous one (CoinGecko's
+    provisional "now" point) is dropped, every point is snapped to its UTC day,
+    and only the first point of each day is kept.
+
+    Args:
+        charts_by_coin: {coin_id: market_chart payload or None}
+        series: 'prices', 'total_volumes' or 'market_caps'
+        start_day, end_day: optional epoch-day bounds of the grid (default: the data's range)
+
+    Returns:
+        PricePanel (coins without any points are left out)
+    """
+    coin_ids = [c for c, chart in charts_by_coin.items() if chart and chart.get(series)]
+    if not coin_ids:
+        return empty_panel()
+
+    lengths = np.array([len(charts_by_coin[c][series]) for c in coin_ids])
+    points = np.array([point[:2] for c in coin_ids for point in charts_by_coin[c][series]], dtype=np.float64)
+    coins = np.repeat(np.arange(len(coin_ids)), lengths)
+    timestamps = points[:, 0].astype(np.int64)
+    values = points[:, 1]
+
+    # Order by coin, then time
+    order = np.lexsort((timestamps, coins))
+    coins, timestamps, values = coins[order], timestamps[order], values[order]
+
+    # Drop each series' trailing intraday point
+    is_last = np.append(coins[1:] != coins[:-1], True)
+    gap = np.diff(timestamps, prepend=timestamps[0] - DAY_MS)
+    has_previous = np.insert(coins[1:] == coins[:-1], 0, False)
+    keep = ~(is_last & has_previous & (gap < DAY_MS))
+    keep &= ~np.isnan(values)
+    if not keep.any():
+        return empty_panel()
+    coins, timestamps, values = coins[keep], timestamps[keep], values[keep]
+
+    # Snap to UTC days and keep the first point per coin and day
+    days = timestamps // DAY_MS
+    first_of_day = np.insert((coins[1:] != coins[:-1]) | (days[1:] != days[:-1]), 0, True)
+    coins, days, values = coins[first_of_day], days[first_of_day], values[first_of_day]
+
+    start_day = int(days.min()) if start_day is None else int(start_day)
+    end_day = int(days.max()) if end_day is None else int(end_day)
+    if end_day < start_day:
+        return PricePanel(np.empty(0, dtype=np.int64), coin_ids, np.empty((0, len(coin_ids))),
+                          np.empty((0, len(coin_ids)), dtype=bool))
+    in_range = (days >= start_day) & (days <= end_day)
+
+    grid = np.full((end_day - start_day + 1, len(coin_ids)), np.nan)
+    observed = np.zeros(grid.shape, dtype=bool)
+    grid[days[in_range] - start_day, coins[in_range]] = values[in_range]
+    observed[days[in_range] - start_day, coins[in_range]] = True
+
+    return PricePanel(np.arange(start_day, end_day + 1), coin_ids, forward_fill(grid, observed), observed)
+
+def print_coverage(panel, threshold=1.0):
+    """Print coins whose coverage is below `threshold` (1.0 = every day between first and last point observed)"""
+    gaps = {c: report for c, report in panel.coverage().items() if report['coverage'] < threshold}
+    if gaps:
+        print(f"Filled gaps in {len(gaps)} coin(s):")
+        for coin_id, report in sorted(gaps.items(), key=lambda item: item[1]['coverage']):
+            print(f"  {coin_id}: {report['filled']} day(s) filled, {report['coverage']:.0%} coverage")
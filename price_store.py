@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Columnar binary store for daily price histories.
+
+All coins for one quote currency live in a single set of concatenated
+arrays (int64 epoch-day, float64 price/volume/market_cap) saved as .npy
+files, plus a small JSON index of per-coin offsets. Arrays are
+memory-mapped on load, so reading a coin is a zero-copy slice and building
+a full days x coins panel is a single vectorized scatter.
+
+Run `python3 price_store.py --migrate` from the project root to import the
+legacy per-coin JSON caches.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+
+import history_cache
+import atomic_io
+import cache_manifest
+
+# Constants
+STORE_DIR = "cache/price_store"
+INDEX_FILE = "index.json"
+DAY_COLUMN = "day"
+VALUE_COLUMNS = ("price", "volume", "market_cap")
+LEGACY_CACHE_DIRS = ("cache", "Momentum Backtest/cache")
+CHART_SERIES_COLUMNS = {'prices': 'price', 'total_volumes': 'volume', 'market_caps': 'market_cap'}
+
+def empty_columns():
+    """Columns for a coin with no rows"""
+    columns = {DAY_COLUMN: np.empty(0, dtype=np.int64)}
+    for column in VALUE_COLUMNS:
+        columns[column] = np.empty(0, dtype=np.float64)
+    return columns
+
+def chart_to_columns(chart):
+    """Convert a CoinGecko market_chart payload into day-aligned column arrays"""
+    normalized = history_cache.normalize_market_chart(chart)
+    days = sorted({point[0] // history_cache.DAY_MS for point in normalized['prices']})
+    if not days:
+        return empty_columns()
+
+    columns = {DAY_COLUMN: np.array(days, dtype=np.int64)}
+    positions = {day: i for i, day in enumerate(days)}
+    for series, column in CHART_SERIES_COLUMNS.items():
+        values = np.full(len(days), np.nan)
+        for timestamp, value in normalized[series]:
+            i = positions.get(timestamp // history_cache.DAY_MS)
+            if i is not None and value is not None:
+                values[i] = value
+        columns[column] = values
+    return columns
+
+def columns_to_chart(columns):
+    """Convert column arrays back into a market_chart payload (missing values are skipped)"""
+    timestamps = (np.asarray(columns[DAY_COLUMN]) * history_cache.DAY_MS).tolist()
+    chart = {}
+    for series, column in CHART_SERIES_COLUMNS.items():
+        values = np.asarray(columns[column]).tolist()
+        chart[series] = [[ts, value] for ts, value in zip(timestamps, values) if value == value]
+    return chart
+
+def merge_columns(old, new):
+    """Merge two column sets by day; rows in `new` win"""
+    days = np.concatenate([old[DAY_COLUMN], new[DAY_COLUMN]])
+    # Later occurrences (from `new`) must win, so dedupe on the reversed order
+    order = np.arange(len(days))[::-1]
+    unique_days, first = np.unique(days[order], return_index=True)
+    picked = order[first]
+    merged = {DAY_COLUMN: unique_days.astype(np.int64)}
+    for column in VALUE_COLUMNS:
+        merged[column] = np.concatenate([old[column], new[column]])[picked]
+    return merged
+
+class PriceStore:
+    """Memory-mapped columnar price histories for one quote currency"""
+
+    def __init__(self, vs_currency="usd", store_dir=STORE_DIR):
+        self.vs_currency = vs_currency
+        self.path = os.path.join(store_dir, vs_currency)
+        self.lock_file = os.path.join(store_dir, f"{vs_currency}.lock")
+        self.manifest = cache_manifest.CacheManifest(os.path.join(store_dir, cache_manifest.MANIFEST_FILE_NAME))
+        self.reload()
+
+    def reload(self):
+        """(Re)load the index and memory-map the column files"""
+        # Shared lock: never observe a write that has swapped some columns but not the index
+        with atomic_io.FileLock(self.lock_file, shared=True):
+            self._load()
+
+    def _load(self):
+        index_file = os.path.join(self.path, INDEX_FILE)
+        self.index = {}
+        self.columns = empty_columns()
+        if not os.path.exists(index_file):
+            return
+
+        try:
+            with open(index_file, 'r') as f:
+                self.index = json.load(f).get('coins', {})
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error reading price store index: {e}")
+            return
+
+        if self.index:
+            for column in (DAY_COLUMN,) + VALUE_COLUMNS:
+                self.columns[column] = np.load(os.path.join(self.path, f"{column}.npy"), mmap_mode='r')
+
+        # Stores written before the manifest existed get indexed on first load
+        if self.index and not any(self.manifest.lookup(c, self.vs_currency) for c in self.index):
+            self.sync_manifest()
+
+    def __contains__(self, coin_id):
+        return coin_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def coin_ids(self):
+        return list(self.index)
+
+    def get(self, coin_id):
+        """Zero-copy column views for one coin, or None if it isn't stored"""
+        entry = self.index.get(coin_id)
+        if entry is None:
+            return None
+        start, stop = entry['start'], entry['start'] + entry['length']
+        return {column: values[start:stop] for column, values in self.columns.items()}
+
+    def load_panel(self, coin_ids=None, column="price"):
+        """
+        Build an aligned days x coins matrix for one value column.
+
+        Returns:
+            Tuple of (epoch_days, coin_ids, matrix) where missing cells are NaN
+        """
+        coin_ids = [c for c in (coin_ids or self.coin_ids()) if c in self.index]
+        if not coin_ids:
+            return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+
+        entries = [self.index[c] for c in coin_ids]
+        first_day = min(e['first_day'] for e in entries)
+        last_day = max(e['last_day'] for e in entries)
+
+        # Gather the row ranges of the requested coins in one pass
+        lengths = np.array([e['length'] for e in entries])
+        starts = np.array([e['start'] for e in entries])
+        rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        coin_positions = np.repeat(np.arange(len(coin_ids)), lengths)
+
+        matrix = np.full((last_day - first_day + 1, len(coin_ids)), np.nan)
+        matrix[self.columns[DAY_COLUMN][rows] - first_day, coin_positions] = self.columns[column][rows]
+        return np.arange(first_day, last_day + 1, dtype=np.int64), coin_ids, matrix
+
+    def write(self, series_by_coin, meta_by_coin):
+        """
+        Replace the whole store with `series_by_coin` ({coin_id: columns}).
+
+        `meta_by_coin` holds each coin's `fetched_at` time and optionally
+        `covered_from`, the earliest epoch-day known to be fully fetched
+        (earlier than `first_day` for coins listed after the requested window).
+        """
+        with atomic_io.FileLock(self.lock_file):
+            self._write(series_by_coin, meta_by_coin)
+        self.sync_manifest()
+
+    def _write(self, series_by_coin, meta_by_coin):
+        """Write the store; the caller holds the exclusive store lock"""
+
+        coin_ids = [c for c in series_by_coin if len(series_by_coin[c][DAY_COLUMN])]
+        index = {}
+        start = 0
+        for coin_id in coin_ids:
+            days = series_by_coin[coin_id][DAY_COLUMN]
+            meta = meta_by_coin.get(coin_id, {})
+            index[coin_id] = {
+                'start': start,
+                'length': len(days),
+                'first_day': int(days[0]),
+                'last_day': int(days[-1]),
+                'covered_from': int(min(days[0], meta.get('covered_from', days[0]))),
+                'fetched_at': meta.get('fetched_at', time.time())
+            }
+            start += len(days)
+
+        # Write each column atomically; the index goes last
+        for column, dtype in [(DAY_COLUMN, np.int64)] + [(c, np.float64) for c in VALUE_COLUMNS]:
+            values = [np.asarray(series_by_coin[c][column], dtype=dtype) for c in coin_ids]
+            data = np.concatenate(values) if values else np.empty(0, dtype=dtype)
+            with atomic_io.atomic_open(os.path.join(self.path, f"{column}.npy"), 'wb') as f:
+                np.save(f, data)
+
+        atomic_io.atomic_write_json(os.path.join(self.path, INDEX_FILE), {'vs_currency': self.vs_currency, 'coins': index})
+        self._load()
+
+    def sync_manifest(self):
+        """Rewrite this currency's manifest entries from the store index"""
+        entries = {}
+        for coin_id, entry in self.index.items():
+            columns = self.get(coin_id)
+            checksum = zlib.crc32(columns[DAY_COLUMN].tobytes())
+            checksum = zlib.crc32(columns['price'].tobytes(), checksum)
+            entries[coin_id] = {
+                'file': self.path,
+                'first_day': entry['first_day'],
+                'last_day': entry['last_day'],
+                'fetched_at': entry['fetched_at'],
+                'rows': entry['length'],
+                'checksum': f"{checksum:08x}"
+            }
+        self.manifest.replace_currency(self.vs_currency, entries)
+
+    def meta(self, coin_id):
+        """Stored `fetched_at`/`covered_from` metadata for one coin"""
+        entry = self.index[coin_id]
+        return {'fetched_at': entry['fetched_at'], 'covered_from': entry.get('covered_from', entry['first_day'])}
+
+    def update(self, series_by_coin, covered_from_by_coin=None):
+        """
+        Merge freshly fetched columns into the stored histories of the given coins and rewrite the store.
+        The store is re-read under the exclusive lock first, so coins written by other jobs are kept.
+        """
+        with atomic_io.FileLock(self.lock_file):
+            self._load()
+            self._merge_and_write(series_by_coin, covered_from_by_coin or {})
+        self.sync_manifest()
+
+    def _merge_and_write(self, series_by_coin, covered_from_by_coin):
+        merged = {coin_id: {k: np.array(v) for k, v in self.get(coin_id).items()} for coin_id in self.index}
+        meta_by_coin = {coin_id: self.meta(coin_id) for coin_id in self.index}
+
+        for coin_id, columns in series_by_coin.items():
+            meta = meta_by_coin.get(coin_id, {})
+            if coin_id in merged:
+                merged[coin_id] = merge_columns(merged[coin_id], columns)
+            else:
+                merged[coin_id] = columns
+            meta['fetched_at'] = time.time()
+            if coin_id in covered_from_by_coin:
+                meta['covered_from'] = min(meta.get('covered_from', covered_from_by_coin[coin_id]), covered_from_by_coin[coin_id])
+            meta_by_coin[coin_id] = meta
+
+        self._write(merged, meta_by_coin)
+
+def parse_legacy_cache_name(filename):
+    """Return the coin id of a legacy history cache file name, or None"""
+    match = re.match(r'^(?P<coin>.+)_(\d+_days|history_\d+d)\.json$', filename)
+    return match.group('coin') if match else None
+
+def legacy_data_to_chart(data):
+    """Convert legacy cache contents (date/price records or a market_chart dict) to a market_chart"""
+    if isinstance(data, dict):
+        return data
+
+    prices = []
+    for record in data or []:
+        date = datetime.fromisoformat(str(record['date'])).replace(tzinfo=timezone.utc)
+        prices.append([int(date.timestamp() * 1000), record['price']])
+    return {'prices': prices}
+
+def migrate_json_caches(cache_dirs=LEGACY_CACHE_DIRS, store=None):
+    """Import every legacy per-coin JSON cache into the columnar store. Returns the number of coins imported."""
+    if store is None:
+        store = PriceStore()
+
+    charts_by_coin = {}
+    for cache_dir in cache_dirs:
+        if not os.path.isdir(cache_dir):
+            continue
+        for filename in sorted(os.listdir(cache_dir)):
+            coin_id = parse_legacy_cache_name(filename)
+            if not coin_id:
+                continue
+            cache_data = history_cache.load_chart_cache(os.path.join(cache_dir, filename))
+            if not cache_data or not cache_data.get('data'):
+                continue
+            charts_by_coin.setdefault(coin_id, []).append(
+                (cache_data.get('timestamp', 0), legacy_data_to_chart(cache_data['data']))
+            )
+
+    series_by_coin = {}
+    meta_by_coin = {}
+    for coin_id, charts in charts_by_coin.items():
+        # Merge oldest fetch first so newer files win on overlapping days
+        columns = empty_columns()
+        for fetched_at, chart in sorted(charts, key=lambda item: item[0]):
+            columns = merge_columns(columns, chart_to_columns(chart))
+        series_by_coin[coin_id] = columns
+        meta_by_coin[coin_id] = {'fetched_at': max(fetched_at for fetched_at, _ in charts)}
+
+    # Anything already in the store is at least as fresh as the legacy files
+    for coin_id in store.coin_ids():
+        stored = {k: np.array(v) for k, v in store.get(coin_id).items()}
+        series_by_coin[coin_id] = merge_columns(series_by_coin.get(coin_id, empty_columns()), stored)
+        meta = store.meta(coin_id)
+        meta['fetched_at'] = max(meta_by_coin.get(coin_id, {}).get('fetched_at', 0), meta['fetched_at'])
+        meta_by_coin[coin_id] = meta
+
+    store.write(series_by_coin, meta_by_coin)
+    print(f"Migrated {len(charts_by_coin)} coins from {', '.join(cache_dirs)} into {store.path}")
+    return len(charts_by_coin)
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar price history store")
+    parser.add_argument('--migrate', action='store_true', help="Import legacy JSON caches into the store")
+    parser.add_argument('--vs-currency', default="usd", help="Quote currency of the store")
+    args = parser.parse_args()
+
+    store = PriceStore(args.vs_currency)
+    if args.migrate:
+        migrate_json_caches(store=store)
+
+    print(f"{len(store)} coins stored in {store.path}")
+    for coin_id in store.coin_ids()[:10]:
+        entry = store.index[coin_id]
+        print(f"  - {coin_id}: {entry['length']} days")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
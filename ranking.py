@@ -0,0 +1,55 @@
+"""
+Top-k selection over days x coins score matrices.
+Every rebalance needs only the best few coins of a cross-section, so instead
+of sorting all N coins per day the k best are found with an O(N) partition
+(np.argpartition) for all days at once, and only those k are sorted. Missing
+and ineligible scores are masked out, and ties are broken by column order,
+so the result equals a stable descending sort truncated to k.
+"""
+
+import numpy as np
+
+def top_k(scores, k, eligible=None):
+    """
+    Columns of the `k` highest scores per row, best first; equal scores keep
+    column order. NaN scores and cells where `eligible` is False are skipped.
+
+    Args:
+        scores: days x coins matrix (or one row as a 1-D array)
+        k: number of columns to select per row
+        eligible: optional boolean mask shaped like `scores`
+
+    Returns:
+        days x k int64 matrix of column indices (1-D for a 1-D input), padded
+        with -1 on rows with fewer than k eligible coins
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.ndim == 1:
+        return top_k(scores[None, :], k, None if eligible is None else np.asarray(eligible)[None, :])[0]
+    n_rows, n_coins = scores.shape
+    valid = ~np.isnan(scores)
+    if eligible is not None:
+        valid &= eligible
+    if k <= 0 or n_coins == 0:
+        return np.full((n_rows, max(k, 0)), -1, dtype=np.int64)
+
+    # Ascending keys; masked cells are NaN, which argpartition and argsort place last
+    keys = np.where(valid, -scores, np.nan)
+    chosen = valid
+    if k < n_coins:
+        kth = np.argpartition(keys, k - 1, axis=1)[:, k - 1]
+        threshold = keys[np.arange(n_rows), kth][:, None]
+        # Everything better than the k-th key, then the leftmost of the coins tied with it
+        better = keys < threshold
+        tied = keys == threshold
+        tied &= np.cumsum(tied, axis=1) <= k - better.sum(axis=1, keepdims=True)
+        chosen = np.where(valid.sum(axis=1, keepdims=True) > k, better | tied, valid)
+
+    # Gather the (at most k) chosen columns per row in column order, then sort just those
+    rows, columns = np.nonzero(chosen)
+    counts = np.bincount(rows, minlength=n_rows)
+    slots = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    top = np.full((n_rows, k), -1, dtype=np.int64)
+    top[rows, slots] = columns
+    top_keys = np.where(top >= 0, keys[np.arange(n_rows)[:, None], np.maximum(top, 0)], np.nan)
+    return np.take_along_axis(top, np.argsort(top_keys, axis=1, kind='stable'), axis=1)
@@ -0,0 +1,133 @@
+"""
+Shared rate limiting for CoinGecko, OpenRouter and Discord API requests.
+All fetchers draw from the same token bucket so concurrent requests stay
+within the per-minute budget instead of relying on fixed sleeps.
+
+The bucket state lives in a small file guarded by an advisory lock, so
+overlapping jobs (run.sh, create_discord_summary.py, manual runs) share one
+budget. The allowed rate adapts to the API: it is halved on every 429 and
+all jobs pause until `Retry-After` has passed, then it recovers gradually as
+requests succeed.
+"""
+
+import os
+import json
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import atomic_io
+
+# Constants
+COINGECKO_REQUESTS_PER_MINUTE = 30  # CoinGecko public/demo API budget
+COINGECKO_BURST = 5  # Requests allowed back-to-back before throttling kicks in
+OPENROUTER_REQUESTS_PER_MINUTE = 20  # OpenRouter free-model budget
+OPENROUTER_BURST = 2
+DISCORD_WEBHOOK_REQUESTS_PER_MINUTE = 30  # Discord per-webhook limit
+DISCORD_WEBHOOK_BURST = 5
+RATE_LIMIT_STATE_DIR = "cache/rate_limit"
+MIN_RATE_FRACTION = 0.1  # The adaptive rate never drops below this share of the configured rate
+RATE_DECREASE_FACTOR = 0.5  # Multiplier applied to the rate on every 429
+RATE_RECOVERY_PER_SUCCESS = 0.05  # Share of the configured rate regained per successful request
+DEFAULT_RETRY_AFTER_SECONDS = 30  # Pause after a 429 that carries no Retry-After header
+
+def parse_retry_after(value):
+    """Seconds to wait from a `Retry-After` header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class SharedRateController:
+    """
+    Token bucket shared by every process through a state file, with an adaptive rate.
+
+    State (tokens, current rate, pause deadline) is read and written under an
+    exclusive file lock on each acquire, so concurrent jobs draw from one budget.
+    Call `record_response` after every request so 429s and `Retry-After`
+    headers slow everyone down together, and successes restore the rate.
+    """
+
+    def __init__(self, name, rate, capacity, state_dir=RATE_LIMIT_STATE_DIR):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = rate * MIN_RATE_FRACTION
+        self.capacity = capacity
+        self.state_file = os.path.join(state_dir, f"{name}.json")
+        self.lock_file = f"{self.state_file}.lock"
+        self.lock = threading.Lock()
+
+    def _locked_update(self, update):
+        """Run `update(state, now)` on the shared state under the thread and file locks, then persist it"""
+        with self.lock, atomic_io.FileLock(self.lock_file):
+            state = self._read_state()
+            now = time.time()
+            # Refill at the current adaptive rate
+            elapsed = max(0.0, now - state['updated_at'])
+            state['tokens'] = min(self.capacity, state['tokens'] + elapsed * state['rate'])
+            state['updated_at'] = now
+            result = update(state, now)
+            atomic_io.atomic_write_json(self.state_file, state)
+            return result
+
+    def _read_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            state['rate'] = min(self.max_rate, max(self.min_rate, state['rate']))
+            return state
+        except (IOError, ValueError, KeyError, TypeError):
+            return {'tokens': self.capacity, 'rate': self.max_rate, 'updated_at': time.time(), 'paused_until': 0.0}
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available in the shared budget and consume them. Returns the seconds spent waiting."""
+        def take(state, now):
+            if now < state['paused_until']:
+                return state['paused_until'] - now
+            if state['tokens'] >= tokens:
+                state['tokens'] -= tokens
+                return 0.0
+            return (tokens - state['tokens']) / state['rate']
+
+        waited = 0.0
+        while True:
+            wait_time = self._locked_update(take)
+            if not wait_time:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def record_response(self, status_code, retry_after=None):
+        """
+        Adapt the shared rate to a response.
+
+        A 429 halves the rate (down to a floor), empties the bucket and pauses
+        every job until `Retry-After` (or DEFAULT_RETRY_AFTER_SECONDS) has
+        passed. Any other response restores part of the configured rate.
+
+        Returns:
+            Seconds until requests may resume (0 unless rate limited)
+        """
+        pause = parse_retry_after(retry_after)
+
+        def adapt(state, now):
+            if status_code != 429:
+                state['rate'] = min(self.max_rate, state['rate'] + self.max_rate * RATE_RECOVERY_PER_SUCCESS)
+                return 0.0
+            state['rate'] = max(self.min_rate, state['rate'] * RATE_DECREASE_FACTOR)
+            state['tokens'] = 0.0
+            state['paused_until'] = max(state['paused_until'], now + (pause if pause is not None else DEFAULT_RETRY_AFTER_SECONDS))
+            return state['paused_until'] - now
+
+        return self._locked_update(adapt)
+
+# Shared limiters for every request to these APIs made by any job on this machine
+COINGECKO_LIMITER = SharedRateController("coingecko", COINGECKO_REQUESTS_PER_MINUTE / 60.0, COINGECKO_BURST)
+OPENROUTER_LIMITER = SharedRateController("openrouter", OPENROUTER_REQUESTS_PER_MINUTE / 60.0, OPENROUTER_BURST)
+DISCORD_LIMITER = SharedRateController("discord", DISCORD_WEBHOOK_REQUESTS_PER_MINUTE / 60.0, DISCORD_WEBHOOK_BURST)
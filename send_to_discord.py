@@ -6,7 +6,10 @@ import time
 import random
 from datetime import datetime
 
-def retry_with_exponential_backoff(func, max_retries=5, base_delay=1, max_delay=32, jitter=0.1):
+import transport
+from rate_limit import DISCORD_LIMITER, OPENROUTER_LIMITER
+
+def retry_with_exponential_backoff(func, max_retries=5, base_delay=1, max_delay=32, jitter=0.1, limiter=None):
     """
     Retry a function with exponential backoff
     
@@ -16,6 +19,8 @@ def retry_with_exponential_backoff(func, max_retries=5, base_delay=1, max_delay=
         base_delay: Initial delay between retries in seconds
         max_delay: Maximum delay between retries in seconds
         jitter: Random jitter factor to add to delay
+        limiter: Shared rate controller (see rate_limit.py) pacing every call; 429s
+            are reported to it so Retry-After pauses all jobs using the same API
         
     Returns:
         The result of the function call, or None if all retries failed
@@ -24,17 +29,29 @@ def retry_with_exponential_backoff(func, max_retries=5, base_delay=1, max_delay=
     delay = base_delay
     
     while retries <= max_retries:
+        if limiter:
+            limiter.acquire()
         try:
-            return func()
+            result = func()
+            if limiter:
+                limiter.record_response(200)
+            return result
         except requests.exceptions.RequestException as e:
             retries += 1
+            status_code = e.response.status_code if e.response is not None else None
             
             # If we've exhausted all retries or it's a 4xx error (except 429), don't retry
             # 429 is "Too Many Requests" which is generally worth retrying
-            if retries > max_retries or (400 <= e.response.status_code < 500 and e.response.status_code != 429):
+            if retries > max_retries or (status_code and 400 <= status_code < 500 and status_code != 429):
                 print(f"Error after {retries} retries: {e}")
                 return None
             
+            # Rate limited: the shared controller decides how long every job waits
+            if status_code == 429 and limiter:
+                wait_time = limiter.record_response(429, e.response.headers.get('Retry-After'))
+                print(f"Rate limited. All jobs paused for {wait_time:.2f} seconds (retry {retries}/{max_retries})")
+                continue
+            
             # Add random jitter to avoid thundering herd problem
             jitter_amount = random.uniform(-jitter, jitter)
             actual_delay = min(delay * (1 + jitter_amount), max_delay)
@@ -93,7 +110,7 @@ def get_ai_analysis(coins_data):
     # Define the API call function to use with retry mechanism
     def call_openrouter_api():
         print("Sending request to OpenRouter API...")
-        response = requests.post(
+        response = transport.post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
             json=payload,
@@ -104,7 +121,7 @@ def get_ai_analysis(coins_data):
     
     try:
         # Use the retry mechanism
-        result = retry_with_exponential_backoff(call_openrouter_api)
+        result = retry_with_exponential_backoff(call_openrouter_api, limiter=OPENROUTER_LIMITER)
         
         if not result:
             print("All API retry attempts failed")
@@ -209,15 +226,17 @@ def custom_send_to_discord(content):
             
             # Define the Discord post function for retry mechanism
             def post_to_discord():
-                return requests.post(
+                response = transport.post(
                     webhook_url,
                     json={"content": message, "username": "AI Altcoin Highlights"},
                     timeout=10
                 )
+                response.raise_for_status()
+                return response
             
             try:
                 # Use retry mechanism
-                response = retry_with_exponential_backoff(post_to_discord)
+                response = retry_with_exponential_backoff(post_to_discord, limiter=DISCORD_LIMITER)
                 if not response:
                     print(f"Failed to send part {i+1}/{len(chunks)} to Discord after multiple retries")
                     success = False
@@ -231,15 +250,17 @@ def custom_send_to_discord(content):
     else:
         # Content is within the size limit, send as a single message
         def post_to_discord():
-            return requests.post(
+            response = transport.post(
                 webhook_url,
                 json={"content": content, "username": "AI Altcoin Highlights"},
                 timeout=10
             )
+            response.raise_for_status()
+            return response
         
         try:
             # Use retry mechanism
-            response = retry_with_exponential_backoff(post_to_discord)
+            response = retry_with_exponential_backoff(post_to_discord, limiter=DISCORD_LIMITER)
             if not response:
                 print("Failed to send message to Discord after multiple retries")
                 return False
@@ -1,32 +1,18 @@
 import pandas as pd
 import numpy as np
-import os
-import json
 from datetime import datetime, timedelta
 import ai_highlights
+import history_cache
 
-# Directory containing cached price data
-CACHE_DIR = "cache"
-
-def load_historical_data(coin_id):
-    """Load historical price data from cache"""
-    cache_file = f"{CACHE_DIR}/{coin_id}_114_days.json"
-    
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            df = pd.DataFrame(cache_data.get('data'))
-            
-            # Convert date strings to datetime
-            if 'date' in df.columns and isinstance(df['date'].iloc[0], str):
-                df['date'] = pd.to_datetime(df['date'])
-                
-            return df
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading cache for {coin_id}: {e}")
+def load_historical_data(coin_id, days=114):
+    """Load historical price data from the shared history cache"""
+    chart = history_cache.get_history(coin_id, days, cache_only=True)
+    if not chart or not chart['prices']:
+        return None
     
-    return None
+    df = pd.DataFrame(chart['prices'], columns=['timestamp', 'price'])
+    df['date'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df[['date', 'price']]
 
 def get_top_coins_by_day(days=14):
     """Get the top 3 performing AI coins for each of the past X days"""
@@ -46,6 +32,12 @@ def get_top_coins_by_day(days=14):
     # Dictionary to store top coins for each day
     top_coins_by_day = {date: [] for date in date_range}
     
+    # Bring stale histories up to date with one bulk sparkline request instead of one request per coin
+    coin_ids = [coin.get('id') for coin in all_ai_coins if coin.get('id')]
+    stale_ids = [coin_id for coin_id in coin_ids if history_cache.history_status(coin_id, days + 1) != 'fresh']
+    if stale_ids:
+        history_cache.bulk_refresh(stale_ids)
+    
     # Process each coin
     for coin in all_ai_coins:
         coin_id = coin.get('id')
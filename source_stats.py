@@ -0,0 +1,71 @@
+"""
+Per-source request statistics for hedged market data fetches.
+Records latency samples and win/loss/failure counts for each data source in
+a small JSON file, so the hedge delay can follow the recent latency of the
+primary source across runs.
+"""
+
+import os
+import json
+import threading
+
+import atomic_io
+
+# Constants
+LATENCY_WINDOW = 50  # Latency samples kept per source
+MIN_LATENCY_SAMPLES = 5  # Samples needed before the percentile replaces the default delay
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+class SourceStats:
+    """Thread-safe latency and outcome counters per source, persisted to `path`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sources = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.sources = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Error reading source stats: {e}")
+
+    def _source(self, source):
+        return self.sources.setdefault(source, {
+            'latencies': [], 'wins': 0, 'losses': 0, 'failures': 0, 'timeouts': 0
+        })
+
+    def record_latency(self, source, seconds, ok=True):
+        """Record one completed request; failed requests count as failures and add no latency sample"""
+        with self.lock:
+            stats = self._source(source)
+            if ok:
+                stats['latencies'] = (stats['latencies'] + [round(seconds, 3)])[-LATENCY_WINDOW:]
+            else:
+                stats['failures'] += 1
+            self._save()
+
+    def record_outcome(self, source, outcome):
+        """Count a race outcome for a source: 'wins', 'losses' or 'timeouts'"""
+        with self.lock:
+            self._source(source)[outcome] += 1
+            self._save()
+
+    def latency_percentile(self, source, pct, default):
+        """`pct` percentile of recent successful latencies, or `default` until enough samples exist"""
+        with self.lock:
+            latencies = self.sources.get(source, {}).get('latencies', [])
+            if len(latencies) < MIN_LATENCY_SAMPLES:
+                return default
+            return percentile(latencies, pct)
+
+    def _save(self):
+        try:
+            atomic_io.atomic_write_json(self.path, self.sources, indent=2)
+        except IOError as e:
+            print(f"Error writing source stats: {e}")
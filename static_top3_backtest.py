@@ -3,13 +3,12 @@ import numpy as np
 import matplotlib.pyplot as plt
 import time
 from datetime import datetime, timedelta
-import json
-import os
 import ai_highlights
-import glob
+import history_cache
+import strategy_engine
+import ranking
 
 # Constants
-CACHE_DIR = "cache"
 BACKTEST_DAYS = 90
 
 def get_current_top_coins():
@@ -35,11 +34,9 @@ def get_current_top_coins():
         print("No valid AI coins found after filtering.")
         return None
     
-    # Sort the valid AI coins by 24h price change (descending)
-    valid_ai_coins.sort(key=lambda x: x['price_change_percentage_24h'], reverse=True)
-    
-    # Take top 3
-    top_3_coins = valid_ai_coins[:3]
+    # Take the top 3 by 24h price change (descending)
+    changes = np.array([coin['price_change_percentage_24h'] for coin in valid_ai_coins], dtype=np.float64)
+    top_3_coins = [valid_ai_coins[i] for i in ranking.top_k(changes, 3) if i >= 0]
     top_3_symbols = [coin.get('symbol', '').upper() for coin in top_3_coins]
     
     print(f"Current top 3 AI coins: {', '.join(top_3_symbols)}")
@@ -47,77 +44,38 @@ def get_current_top_coins():
     return top_3_coins
 
 def find_cached_data_for_coin(coin_id):
-    """Try to find cached data for a coin with various potential filenames"""
-    # First, try the exact ID
-    pattern = f"{CACHE_DIR}/{coin_id}_*.json"
-    matches = glob.glob(pattern)
-    
-    if matches:
-        # Sort by days (highest first to get the longest history)
-        matches.sort(key=lambda x: int(x.split('_')[-2]) if x.split('_')[-2].isdigit() else 0, reverse=True)
-        return matches[0]
-    
-    # If no matches, try to normalize and look for any partial matches
-    normalized_id = coin_id.lower().replace('-', '').replace('_', '')
-    all_cache_files = glob.glob(f"{CACHE_DIR}/*.json")
-    
-    potential_matches = []
-    for cache_file in all_cache_files:
-        file_id = os.path.basename(cache_file).split('_')[0].lower()
-        if normalized_id in file_id or file_id in normalized_id:
-            potential_matches.append(cache_file)
-    
-    if potential_matches:
-        # Sort by days (highest first)
-        potential_matches.sort(key=lambda x: int(x.split('_')[-2]) if x.split('_')[-2].isdigit() else 0, reverse=True)
-        print(f"Found potential match for {coin_id}: {os.path.basename(potential_matches[0])}")
-        return potential_matches[0]
-    
-    # Special cases for known naming differences
-    special_cases = {
-        'fomo-3': 'fomo-3',
-        'billy-bets-by-virtuals': 'billy-bets-by-virtuals',
-        'nani': 'nani'
-    }
-    
-    if coin_id in special_cases:
-        # Try again with the special case
-        alt_pattern = f"{CACHE_DIR}/{special_cases[coin_id]}_*.json"
-        alt_matches = glob.glob(alt_pattern)
-        if alt_matches:
-            alt_matches.sort(key=lambda x: int(x.split('_')[-2]) if x.split('_')[-2].isdigit() else 0, reverse=True)
-            print(f"Found special case match for {coin_id}: {os.path.basename(alt_matches[0])}")
-            return alt_matches[0]
-    
-    print(f"No cached data found for {coin_id}")
-    return None
+    """Resolve a coin to its cached history through the cache manifest (exact, then fuzzy id match)"""
+    manifest = history_cache.get_store().manifest
+    cached_id = manifest.resolve(coin_id)
+    
+    if cached_id is None:
+        print(f"No cached data found for {coin_id}")
+    elif cached_id != coin_id:
+        print(f"Found potential match for {coin_id}: {cached_id}")
+    
+    return cached_id
 
-def get_historical_data(coin_id, days):
-    """Load historical price data from cache"""
-    cache_file = find_cached_data_for_coin(coin_id)
-    
-    if cache_file and os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            df = pd.DataFrame(cache_data.get('data'))
-            
-            # Convert date strings to datetime
-            if isinstance(df['date'].iloc[0], str):
-                df['date'] = pd.to_datetime(df['date'])
-                
-            return df
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading cache for {coin_id}: {e}")
-    
-    # If we're here, we couldn't find a valid cache file
-    # List available cache files for debugging
-    print(f"Available cache files:")
-    for f in glob.glob(f"{CACHE_DIR}/*.json")[:10]:  # Show first 10
-        print(f"  - {os.path.basename(f)}")
-    
-    if len(glob.glob(f"{CACHE_DIR}/*.json")) > 10:
-        print(f"  - ... and {len(glob.glob(f'{CACHE_DIR}/*.json'))-10} more")
+def print_cached_coins(limit=10):
+    """List cached coins from the manifest for debugging"""
+    cached_ids = sorted(history_cache.get_store().manifest.coin_ids())
+    print(f"Available cached coins:")
+    for cached_id in cached_ids[:limit]:
+        print(f"  - {cached_id}")
+    
+    if len(cached_ids) > limit:
+        print(f"  - ... and {len(cached_ids) - limit} more")
+
+def get_historical_chart(coin_id, days):
+    """Load a historical market_chart payload from cache"""
+    cached_id = find_cached_data_for_coin(coin_id)
+    
+    if cached_id:
+        chart = history_cache.get_history(cached_id, days, cache_only=True)
+        if chart and chart['prices']:
+            return chart
+    
+    # If we're here, we couldn't find a usable cached history
+    print_cached_coins()
     
     return None
 
@@ -141,25 +99,20 @@ def run_static_backtest(total_days=BACKTEST_DAYS):
         return None, None
     
     # Get historical data for the top coins
-    coin_data = {}
+    charts = {}
+    symbols = []
     
     for coin in top_coins:
         coin_id = coin.get('id')
         symbol = coin.get('symbol', '').upper()
         
-        hist_data = get_historical_data(coin_id, total_days + 10)  # Add buffer
+        chart = get_historical_chart(coin_id, total_days + 10)  # Add buffer
         
-        if hist_data is not None and len(hist_data) > 7:  # Need at least a week of data
-            # Convert date column back to datetime if needed
-            if isinstance(hist_data['date'].iloc[0], str):
-                hist_data['date'] = pd.to_datetime(hist_data['date'])
-                
-            coin_data[coin_id] = {
-                'symbol': symbol,
-                'data': hist_data
-            }
-    
-    if not coin_data:
+        if chart is not None and len(chart['prices']) > 7:  # Need at least a week of data
+            charts[coin_id] = chart
+            symbols.append(symbol)
+    
+    if not charts:
         print("No historical data available. Exiting.")
         return None, None
     
@@ -167,38 +120,20 @@ def run_static_backtest(total_days=BACKTEST_DAYS):
     start_date = datetime.now() - timedelta(days=total_days)
     dates = pd.date_range(start=start_date, periods=total_days)
     
-    # Set up portfolio and coin performance tracking
+    # Sample every coin as of the backtest days and hold them all on the shared engine (equal weight)
+    coin_ids = list(charts)
+    panel = strategy_engine.Panel.from_charts(charts, coin_ids, dates)
+    result = strategy_engine.run(panel, strategy_engine.StaticHold(coin_ids))
+    
     portfolio = pd.DataFrame(index=dates)
-    portfolio['value'] = 100.0  # Start with $100
+    portfolio['value'] = result['values']
     
+    # Per-symbol values start at $100 until a coin's first price
+    unique_symbols, _, symbol_value = strategy_engine.values_by_symbol(panel, symbols)
     coin_performances = {}
-    for coin_id, coin_info in coin_data.items():
-        symbol = coin_info['symbol']
+    for i, symbol in enumerate(unique_symbols):
         coin_performances[symbol] = pd.DataFrame(index=dates)
-        coin_performances[symbol]['value'] = 100.0
-    
-    # Calculate performance for each coin and portfolio over time
-    for i, current_date in enumerate(dates):
-        coin_values = []
-        
-        for coin_id, coin_info in coin_data.items():
-            symbol = coin_info['symbol']
-            price_data = coin_info['data']
-            
-            # Filter data up to current date
-            price_data_until_now = price_data[price_data['date'] <= current_date]
-            
-            if len(price_data_until_now) > 0:
-                start_price = price_data.iloc[0]['price']
-                current_price = price_data_until_now.iloc[-1]['price']
-                coin_value = 100 * (current_price / start_price)
-                
-                coin_performances[symbol].loc[current_date, 'value'] = coin_value
-                coin_values.append(coin_value)
-        
-        # Portfolio is equal weight
-        if coin_values:
-            portfolio.loc[current_date, 'value'] = sum(coin_values) / len(coin_values)
+        coin_performances[symbol]['value'] = symbol_value[:, i]
     
     return portfolio, coin_performances
 
@@ -289,13 +224,8 @@ def prepare_summary(portfolio, coin_performances):
     return summary
 
 if __name__ == "__main__":
-    # First, let's look at what cache files we have
-    print("Available cache files:")
-    for f in sorted(glob.glob(f"{CACHE_DIR}/*.json"))[:10]:
-        print(f"  - {os.path.basename(f)}")
-    
-    if len(glob.glob(f"{CACHE_DIR}/*.json")) > 10:
-        print(f"  - ... and {len(glob.glob(f'{CACHE_DIR}/*.json'))-10} more")
+    # First, let's look at what cached coins we have
+    print_cached_coins()
     
     portfolio, coin_performances = run_static_backtest()
     
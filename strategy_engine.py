@@ -0,0 +1,492 @@
+"""
+Shared engine for the coin strategy backtests.
+Every backtest loads its data once into a Panel (aligned days x coins prices,
+optional 24h volumes and precomputed signal matrices) and describes its rules
+as a Strategy plugin: a selection of coins per day plus optional exit rules.
+The engine turns selections into holdings and weights for all days at once
+and values them with vectorized accounting, so any number of strategies can
+run over one Panel and share its cached return and ranking matrices.
+"""
+
+import numpy as np
+import pandas as pd
+
+import momentum_engine
+import ranking
+
+# Constants
+INITIAL_CAPITAL = 10000  # Starting value of rotation portfolios (USD)
+INDEX_BASE = 100.0  # Starting value of averaged (index-style) portfolios
+BENCHMARK_COIN = "bitcoin"
+SPIKE_THRESHOLD = 0.10  # Held daily moves of at least 10% count as spike captures
+RANK_DEPTH = 10  # Ranked coins kept per row in the ranking cache (grown on demand for a larger top_n)
+VALUATIONS = ("rotation", "average")
+ENTRY_RULES = ("top", "positive")  # Rank every coin, or only coins with positive momentum
+
+class Panel:
+    """
+    Aligned days x coins market data shared by every strategy run on it.
+    Derived matrices (returns, window returns, rankings) are computed once
+    per panel and cached.
+
+    Attributes:
+        prices: days x coins float64 matrix (NaN before a coin's first price)
+        volumes: optional days x coins matrix of 24h volumes aligned with prices
+        coin_ids, dates: column ids and row dates (dates may be None for bare arrays)
+        benchmark_col: column of the benchmark coin, or None
+        signals: extra precomputed matrices by name (e.g. as-of signals, see from_charts)
+    """
+
+    def __init__(self, prices, coin_ids=None, dates=None, volumes=None, benchmark_col=None, signals=None):
+        self.prices = prices
+        self.coin_ids = list(coin_ids) if coin_ids is not None else [str(i) for i in range(prices.shape[1])]
+        self.dates = pd.DatetimeIndex(dates) if dates is not None else None
+        self.volumes = volumes
+        self.benchmark_col = benchmark_col
+        self.signals = dict(signals or {})
+        self.columns = {coin_id: i for i, coin_id in enumerate(self.coin_ids)}
+        self.cache = {}
+
+    @classmethod
+    def from_frames(cls, df_prices, df_volumes=None, benchmark=BENCHMARK_COIN):
+        """Panel of the days x coins DataFrames from prepare_historical_dataframe"""
+        prices = np.ascontiguousarray(df_prices.to_numpy(dtype=np.float64))
+        volumes = None
+        if df_volumes is not None and not df_volumes.empty:
+            volumes = df_volumes.reindex(index=df_prices.index, columns=df_prices.columns).to_numpy(dtype=np.float64)
+        columns = list(df_prices.columns)
+        benchmark_col = columns.index(benchmark) if benchmark in columns else None
+        return cls(prices, columns, df_prices.index, volumes, benchmark_col)
+
+    @classmethod
+    def from_charts(cls, charts, coin_ids, dates, trailing_window=momentum_engine.TRAILING_WINDOW):
+        """
+        Panel of raw market_chart points sampled as of each date (the last point
+        at or before it), with the as-of signals of momentum_engine.precompute_signals.
+        """
+        flat = momentum_engine.flatten_charts(charts, coin_ids)
+        signals = momentum_engine.precompute_signals(flat, momentum_engine.dates_to_ms(dates), trailing_window)
+        return cls(signals['price'], coin_ids, dates, signals=signals)
+
+    def cached(self, key, compute):
+        """Value of `compute()` stored under `key` on this panel"""
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    @property
+    def returns(self):
+        """Row-to-row returns (NaN on the first row and before a coin's first price)"""
+        return self.window_return(1)
+
+    def window_return(self, window):
+        """prices[t] / prices[t - window] - 1 (NaN for the first `window` rows)"""
+        def compute():
+            result = np.full(self.prices.shape, np.nan)
+            if window < len(self.prices):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    result[window:] = self.prices[window:] / self.prices[:-window] - 1
+            return result
+        return self.cached(('window_return', window), compute)
+
+    @property
+    def first_complete(self):
+        """First row on which every coin has a price (like DataFrame.dropna())"""
+        def compute():
+            complete = np.flatnonzero(~np.isnan(self.prices).any(axis=1))
+            return int(complete[0]) if len(complete) else len(self.prices)
+        return self.cached('first_complete', compute)
+
+    @property
+    def has_data(self):
+        """True from a coin's first data point on (as-of panels count points, which may carry no price)"""
+        if 'counts' in self.signals:
+            return self.signals['counts'] > 0
+        return ~np.isnan(self.prices)
+
+    def index_values(self):
+        """100 * price / first price per coin (the as-of 'value' signal when present)"""
+        if 'value' in self.signals:
+            return self.signals['value']
+
+        def compute():
+            has_price = ~np.isnan(self.prices)
+            first_row = np.argmax(has_price, axis=0)
+            first = self.prices[first_row, np.arange(self.prices.shape[1])]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return 100 * (self.prices / first)
+        return self.cached('index_values', compute)
+
+class Strategy:
+    """
+    Base class of strategy plugins.
+
+    A plugin picks coins for every panel row (select, -1 padded column lists),
+    may close positions before the next rebalance (exits), and names how the
+    engine values the portfolio:
+    - 'rotation': equal dollar positions at each rebalance, fixed in dollars until the next
+    - 'average': the mean index value (marks) of the coins held each day
+    Row t of select/scores/exits is read for the holdings of row t + signal_lag.
+    """
+    name = "strategy"
+    valuation = "rotation"
+    holding_days = 1
+    signal_lag = 0
+
+    def first_row(self, panel):
+        """First panel row the strategy can trade"""
+        return 0
+
+    def select(self, panel):
+        raise NotImplementedError
+
+    def scores(self, panel):
+        """Scores behind the selection (reported for selected coins), or None"""
+        return None
+
+    def exits(self, panel):
+        """days x coins mask closing a held position, or None"""
+        return None
+
+    def marks(self, panel):
+        """days x coins index values for 'average' valuation"""
+        return panel.index_values()
+
+class MomentumRotation(Strategy):
+    """
+    Top-N rotation by trailing return (Momentum Backtest rules).
+
+    Every `holding_days` the portfolio is rebuilt as equal dollar positions in
+    the top `top_n` coins by `lookback_days` return as of the day before
+    (benchmark excluded). `entry_rule='positive'` only admits coins with
+    positive momentum, and a `trailing_window` > 0 skips coins whose trailing
+    return over that window is negative. With `require_complete`, trading
+    starts once every coin has a price (the backtest's dropna()).
+    """
+    valuation = "rotation"
+    signal_lag = 1
+
+    def __init__(self, lookback_days=7, holding_days=1, top_n=3, trailing_window=0, entry_rule="top",
+                 require_complete=True, name="momentum_rotation"):
+        if entry_rule not in ENTRY_RULES:
+            raise ValueError(f"entry_rule must be one of {', '.join(ENTRY_RULES)}, got {entry_rule!r}")
+        self.lookback_days = lookback_days
+        self.holding_days = holding_days
+        self.top_n = top_n
+        self.trailing_window = trailing_window
+        self.entry_rule = entry_rule
+        self.require_complete = require_complete
+        self.name = name
+
+    def first_row(self, panel):
+        return (panel.first_complete if self.require_complete else 0) + 1 + self.lookback_days
+
+    def select(self, panel):
+        # One ranking per (lookback, trailing window, entry rule) serves every top_n and holding period
+        key = ('momentum_ranking', self.lookback_days, self.trailing_window, self.entry_rule)
+        if key not in panel.cache or panel.cache[key].shape[1] < self.top_n:
+            scores = self.scores(panel)
+            eligible = ~np.isnan(scores)
+            if panel.benchmark_col is not None:
+                eligible[:, panel.benchmark_col] = False
+            if self.entry_rule == "positive":
+                eligible &= scores > 0
+            if self.trailing_window > 0:
+                eligible &= ~(panel.window_return(self.trailing_window) < 0)
+            panel.cache[key] = ranking.top_k(scores, max(self.top_n, RANK_DEPTH), eligible)
+        return panel.cache[key][:, :self.top_n]
+
+    def scores(self, panel):
+        return panel.window_return(self.lookback_days)
+
+class HighlightsRotation(Strategy):
+    """
+    Rotation into the top `top_n` coins of daily highlights snapshots by 24h
+    change, taken on the day itself (highlights_based_backtest.py rules).
+
+    Args:
+        snapshot_scores: days x coins 24h changes of the coins in each day's
+                         snapshot (NaN = not in the snapshot), aligned with the panel
+    """
+    valuation = "rotation"
+
+    def __init__(self, snapshot_scores, top_n=3, holding_days=1, name="highlights_rotation"):
+        self.snapshot_scores = snapshot_scores
+        self.top_n = top_n
+        self.holding_days = holding_days
+        self.name = name
+
+    def first_row(self, panel):
+        # First row with a complete daily return
+        return panel.first_complete + 1
+
+    def select(self, panel):
+        return ranking.top_k(self.snapshot_scores, self.top_n)
+
+    def scores(self, panel):
+        return self.snapshot_scores
+
+class DailyTopMomentum(Strategy):
+    """
+    Daily top-N by positive 24h return (momentum_strategy.py rules): hold the
+    top `top_n`, exit when a coin drops out of them or its trailing return
+    turns negative, valued as the average index value of the held coins.
+    Uses the panel's as-of signals when it was built by Panel.from_charts,
+    else the daily grid's returns.
+
+    Args:
+        symbols: optional symbol per panel column; coins sharing a symbol are
+                 marked with that symbol's value, as the original per-symbol frames did
+    """
+    valuation = "average"
+
+    def __init__(self, top_n=3, trailing_window=momentum_engine.TRAILING_WINDOW, symbols=None, name="daily_top_momentum"):
+        self.top_n = top_n
+        self.trailing_window = trailing_window
+        self.symbols = symbols
+        self.name = name
+
+    def signals(self, panel):
+        """counts, return_24h, return_trailing and value matrices"""
+        if 'return_24h' in panel.signals:
+            return panel.signals
+        return {
+            'counts': np.cumsum(~np.isnan(panel.prices), axis=0),
+            'return_24h': panel.returns,
+            'return_trailing': panel.window_return(self.trailing_window),
+            'value': panel.index_values()
+        }
+
+    def select(self, panel):
+        def compute():
+            signals = self.signals(panel)
+            eligible = (signals['counts'] >= 2) & (signals['return_24h'] > 0)
+            return ranking.top_k(signals['return_24h'], self.top_n, eligible)
+        return panel.cached(('daily_top', self.trailing_window, self.top_n), compute)
+
+    def scores(self, panel):
+        return self.signals(panel)['return_24h']
+
+    def exits(self, panel):
+        return self.signals(panel)['return_trailing'] < 0
+
+    def marks(self, panel):
+        if self.symbols is None:
+            return self.signals(panel)['value']
+        _, symbol_index, values = values_by_symbol(panel, self.symbols)
+        return values[:, symbol_index]
+
+class StaticHold(Strategy):
+    """Buy and hold a fixed set of coins, each from its first price on (static_top3_backtest.py rules)"""
+    valuation = "average"
+
+    def __init__(self, coin_ids, name="static_hold"):
+        self.coin_ids = list(coin_ids)
+        self.name = name
+
+    def select(self, panel):
+        columns = np.array([panel.columns[c] for c in self.coin_ids if c in panel.columns], dtype=np.int64)
+        return np.where(panel.has_data[:, columns], columns[None, :], -1)
+
+def values_by_symbol(panel, symbols):
+    """
+    Index values per symbol (see momentum_engine.symbol_values: coins sharing
+    a symbol write into one column, 100 until a coin's first price).
+
+    Returns:
+        Tuple of (unique symbols in first-seen order, symbol column per coin, days x symbols values)
+    """
+    unique_symbols = list(dict.fromkeys(symbols))
+    symbol_column = {symbol: i for i, symbol in enumerate(unique_symbols)}
+    symbol_index = np.array([symbol_column[symbol] for symbol in symbols], dtype=np.int64)
+    values = panel.cached(('values_by_symbol', tuple(symbols)), lambda: momentum_engine.symbol_values(
+        panel.index_values(), panel.has_data, symbol_index, len(unique_symbols)))
+    return unique_symbols, symbol_index, values
+
+def new_state(initial_value=INITIAL_CAPITAL):
+    """State of a portfolio before its first trading day"""
+    return {
+        'portfolio_value': [initial_value],  # Last two end-of-day values (the win rate compares them)
+        'benchmark_value': [initial_value],
+        'positions': {},  # {coin_id: dollars}
+        'days_since_rebalance': None,  # None forces a rebalance on the first day
+        'days_traded': 0,
+        'win_count': 0,
+        'total_rebalances': 0,
+        'spike_captures': 0
+    }
+
+def equal_weights(top, n_coins):
+    """rows x coins equal weights of the -1 padded column lists in `top`"""
+    held = top >= 0
+    counts = held.sum(axis=1)
+    weights = np.zeros((len(top), n_coins))
+    rows, slots = np.nonzero(held)
+    weights[rows, top[rows, slots]] = 1 / counts[rows]
+    return weights
+
+def compound_segments(daily, segment, initial):
+    """
+    Values of a portfolio whose dollar positions are fixed within each segment
+    of rows: value = value at segment start * (1 + cumulative sum of daily P&L rates).
+
+    Args:
+        daily: per-row P&L as a fraction of the segment's starting value
+        segment: non-decreasing segment id per row
+
+    Returns:
+        Tuple of (values, segment starting value per row)
+    """
+    starts = np.flatnonzero(np.diff(segment, prepend=segment[0] - 1))
+    lengths = np.diff(np.append(starts, len(daily)))
+    cumulative = np.cumsum(daily)
+    within = cumulative - np.repeat(np.concatenate([[0], cumulative[starts[1:] - 1]]), lengths)
+    growth = 1 + within[np.append(starts[1:], len(daily)) - 1]
+    base = np.repeat(initial * np.concatenate([[1], np.cumprod(growth)[:-1]]), lengths)
+    return base * (1 + within), base
+
+def run(panel, strategy, start=None, end=None, state=None):
+    """
+    Backtest one strategy on panel rows [start, end).
+
+    Holdings are rebuilt every `strategy.holding_days` rows from the
+    strategy's selection and closed early where its exit rule fires; a
+    position exited on a rebalance row is reopened if it is selected again.
+
+    Args:
+        state: state from an earlier run (see new_state) to continue from, with
+               the window starting on the row after the one it ended on
+
+    Returns:
+        Dict with 'rows' (panel rows traded), 'dates', 'initial_value',
+        'values' and 'benchmark_values' (per row), 'base' (per row, the value
+        'weights' are fractions of: dollar positions = weights * base),
+        'weights' and 'holdings' (rows x coins),
+        'entries' and 'exits' (rows x coins, positions opened or closed on the
+        row), 'rebalances' (panel rows), 'selected' and 'selected_scores'
+        (rebalances x top_n, padded with -1 / NaN), this window's 'win_count',
+        'total_rebalances' and 'spike_captures', and the advanced 'state';
+        or None if the window has no rows
+    """
+    if strategy.valuation not in VALUATIONS:
+        raise ValueError(f"valuation must be one of {', '.join(VALUATIONS)}, got {strategy.valuation!r}")
+    n_rows, n_coins = panel.prices.shape
+    first_row = strategy.first_row(panel)
+    start = first_row if start is None else max(start, first_row)
+    end = n_rows if end is None else min(end, n_rows)
+    if start >= end:
+        return None
+    rotation = strategy.valuation == "rotation"
+    state = state if state is not None else new_state(INITIAL_CAPITAL if rotation else INDEX_BASE)
+
+    rows = np.arange(start, end)
+    n_days = len(rows)
+    decision_rows = rows - strategy.signal_lag
+    since = state['days_since_rebalance']
+    first_rebalance = 0 if since is None else max(strategy.holding_days - since - 1, 0)
+    rebalances = np.arange(first_rebalance, n_days, strategy.holding_days)
+    # Segment 0 holds the positions carried in from `state` until the first rebalance
+    segment = np.searchsorted(rebalances, np.arange(n_days), side='right')
+
+    initial_value = state['portfolio_value'][-1]
+    carried = np.zeros((1, n_coins))
+    for coin_id, dollars in state['positions'].items():
+        if coin_id in panel.columns:
+            carried[0, panel.columns[coin_id]] = dollars / initial_value
+    selected = strategy.select(panel)[decision_rows[rebalances]]
+    weights = np.vstack([carried, equal_weights(selected, n_coins)])[segment]
+
+    exit_mask = strategy.exits(panel)
+    fired = None
+    if exit_mask is not None:
+        fired = exit_mask[decision_rows]
+        # Exits since the segment started close the position until the next rebalance
+        closing = fired.copy()
+        closing[rebalances] = False
+        closed_count = np.cumsum(closing, axis=0)
+        segment_start = np.concatenate([[0], rebalances])[segment]
+        before = np.where((segment_start > 0)[:, None], closed_count[np.maximum(segment_start - 1, 0)], 0)
+        weights[closed_count > before] = 0
+    holdings = weights > 0
+
+    returns = panel.returns[rows]
+    if rotation:
+        daily = np.nansum(weights * returns, axis=1)
+        values, base = compound_segments(daily, segment, initial_value)
+    else:
+        counts = holdings.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averaged = np.where(holdings, strategy.marks(panel)[rows], 0).sum(axis=1) / counts
+        # Days without holdings keep the last value
+        last_held = np.maximum.accumulate(np.where(counts > 0, np.arange(n_days), -1))
+        values = np.where(last_held >= 0, averaged[np.maximum(last_held, 0)], initial_value)
+        weights = holdings / np.maximum(counts, 1)[:, None]
+        base = values
+
+    benchmark_initial = state['benchmark_value'][-1]
+    if panel.benchmark_col is not None:
+        benchmark_values = benchmark_initial * np.cumprod(1 + np.nan_to_num(returns[:, panel.benchmark_col]))
+    else:
+        benchmark_values = np.full(n_days, float(benchmark_initial))
+
+    previous = np.vstack([carried > 0, holdings[:-1]])
+    if fired is not None:
+        entries = holdings & (~previous | fired)
+        exits = previous & (~holdings | fired)
+    else:
+        entries = holdings & ~previous
+        exits = previous & ~holdings
+
+    # A rebalance beats the benchmark when the day before it did (days after the first, with positions held)
+    history = np.concatenate([state['portfolio_value'], values])
+    benchmark_history = np.concatenate([state['benchmark_value'], benchmark_values])
+    scored = rebalances[previous.any(axis=1)[rebalances] & (state['days_traded'] + rebalances > 0)]
+    day = len(state['portfolio_value']) + scored - 1
+    win_count = int(np.sum(history[day] / history[day - 1] > benchmark_history[day] / benchmark_history[day - 1]))
+    with np.errstate(invalid='ignore'):
+        spike_captures = int(np.sum(holdings & (returns >= SPIKE_THRESHOLD)))
+
+    scores = strategy.scores(panel)
+    selected_scores = None
+    if scores is not None:
+        selected_scores = np.where(selected >= 0, np.take_along_axis(
+            scores[decision_rows[rebalances]], np.maximum(selected, 0), axis=1), np.nan)
+
+    return {
+        'rows': rows,
+        'dates': panel.dates[rows] if panel.dates is not None else None,
+        'initial_value': initial_value,
+        'values': values,
+        'base': base,
+        'benchmark_values': benchmark_values,
+        'weights': weights,
+        'holdings': holdings,
+        'entries': entries,
+        'exits': exits,
+        'rebalances': rows[rebalances],
+        'selected': selected,
+        'selected_scores': selected_scores,
+        'win_count': win_count,
+        'total_rebalances': len(scored),
+        'spike_captures': spike_captures,
+        'state': {
+            'portfolio_value': history[-2:].tolist(),
+            'benchmark_value': benchmark_history[-2:].tolist(),
+            'positions': {panel.coin_ids[c]: float(weights[-1, c] * base[-1]) for c in np.flatnonzero(holdings[-1])},
+            'days_since_rebalance': int(n_days - 1 - rebalances[-1]) if len(rebalances) else since + n_days,
+            'days_traded': state['days_traded'] + n_days,
+            'win_count': state['win_count'] + win_count,
+            'total_rebalances': state['total_rebalances'] + len(scored),
+            'spike_captures': state['spike_captures'] + spike_captures
+        }
+    }
+
+def run_strategies(panel, strategies, start=None, end=None):
+    """
+    Run several strategies over one panel; return and ranking matrices are
+    computed once and shared through the panel's cache.
+
+    Returns:
+        {strategy.name: run result (None if it had no rows)}
+    """
+    return {strategy.name: run(panel, strategy, start, end) for strategy in strategies}
@@ -0,0 +1,106 @@
+"""
+Pluggable HTTP transport for every outbound API call.
+In the default `live` mode requests go straight to the network. `record`
+also stores each response in a fixture directory, and `replay` answers
+from those fixtures without touching the network, so the pipeline can run
+offline and reproducibly. Setting HTTP_TRANSPORT_REDIRECT sends every
+request to another host (e.g. mock_api_server.py) with the same path.
+
+Configured through environment variables:
+    HTTP_TRANSPORT_MODE      live | record | replay (default: live)
+    HTTP_FIXTURE_DIR         fixture store (default: fixtures/http)
+    HTTP_TRANSPORT_REDIRECT  base URL replacing scheme and host, e.g. http://127.0.0.1:8765
+"""
+
+import os
+import json
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+import atomic_io
+
+# Constants
+MODES = ("live", "record", "replay")
+DEFAULT_FIXTURE_DIR = "fixtures/http"
+
+def get_mode():
+    mode = os.environ.get("HTTP_TRANSPORT_MODE", "live").lower()
+    if mode not in MODES:
+        raise ValueError(f"HTTP_TRANSPORT_MODE must be one of {', '.join(MODES)}, got {mode!r}")
+    return mode
+
+def get_fixture_dir():
+    return os.environ.get("HTTP_FIXTURE_DIR", DEFAULT_FIXTURE_DIR)
+
+def redirect_url(url):
+    """Swap scheme and host for HTTP_TRANSPORT_REDIRECT, keeping path and query"""
+    target = os.environ.get("HTTP_TRANSPORT_REDIRECT")
+    if not target:
+        return url
+    parts = urlsplit(url)
+    base = urlsplit(target)
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip('/') + parts.path, parts.query, parts.fragment))
+
+def fixture_key(method, url, params=None, json_body=None, data=None, files=None):
+    """Stable key for a request; the host is left out so redirected and live requests share fixtures"""
+    request = {
+        'method': method,
+        'path': urlsplit(url).path,
+        'params': sorted((str(k), str(v)) for k, v in (params or {}).items()),
+        'json': json_body,
+        'data': sorted((str(k), str(v)) for k, v in (data or {}).items()),
+        'files': sorted(str(name) for name in (files or {}))
+    }
+    return hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest(), request
+
+def fixture_path(key):
+    return os.path.join(get_fixture_dir(), f"{key}.json")
+
+def save_fixture(key, request, response):
+    """Store a response under its request key (atomically, so parallel recorders never leave half a file)"""
+    record = {
+        'request': request,
+        'status_code': response.status_code,
+        'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'retry-after')},
+        'body': response.content.decode('utf-8', errors='replace')
+    }
+    atomic_io.atomic_write_json(fixture_path(key), record)
+
+def load_fixture(key, method, url):
+    """Rebuild a requests.Response from a stored fixture; a missing fixture behaves like a network error"""
+    path = fixture_path(key)
+    if not os.path.exists(path):
+        raise requests.exceptions.ConnectionError(f"No recorded response for {method} {url} (fixture {key})")
+    with open(path, 'r') as f:
+        record = json.load(f)
+
+    response = requests.Response()
+    response.status_code = record['status_code']
+    response.headers.update(record.get('headers') or {})
+    response._content = record['body'].encode('utf-8')
+    response.url = url
+    response.encoding = 'utf-8'
+    return response
+
+def request(method, url, params=None, json=None, data=None, files=None, headers=None, timeout=None):
+    """Send a request through the configured transport and return a requests.Response"""
+    mode = get_mode()
+    key, recorded_request = fixture_key(method, url, params, json, data, files)
+    if mode == "replay":
+        return load_fixture(key, method, url)
+
+    response = requests.request(
+        method, redirect_url(url), params=params, json=json, data=data,
+        files=files, headers=headers, timeout=timeout
+    )
+    if mode == "record":
+        save_fixture(key, recorded_request, response)
+    return response
+
+def get(url, params=None, **kwargs):
+    return request("GET", url, params=params, **kwargs)
+
+def post(url, json=None, data=None, **kwargs):
+    return request("POST", url, json=json, data=data, **kwargs)